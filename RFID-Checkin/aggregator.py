@@ -0,0 +1,68 @@
+'''
+RFID Logging Software
+
+Description (aggregator.py):
+Collapses the many reads of a tag passing through the field into a single event before it is correlated and published.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+class TagAggregator:
+  def __init__(self, window = 1, max_span = 5):
+    """
+    Args:
+      window: float, reads of the same EPC less than this many seconds apart are merged into one event.
+        A window of 0 passes every read through on its own.
+      max_span: float, max seconds between the first and last read of an event, so that a tag sitting in
+        the field is still reported
+    """
+    self.__window = window
+    self.__max_span = max_span
+    self.__open = {} # EPC -> [aggregated Tag, monotonic time of the first read, monotonic time of the latest read]
+    self.__closed = []
+
+  def __len__(self):
+    return len(self.__open) + len(self.__closed)
+
+  @property
+  def NextDeadline(self):
+    """
+    Monotonic time when the next event can be collected, or None if there are no events.
+    """
+    if self.__closed: return 0
+    return min(self.__deadline(entry) for entry in self.__open.values()) if self.__open else None
+
+  def AddTag(self, tag):
+    entry = self.__open.get(tag.EPC)
+
+    if entry is not None and tag.ReadTime - entry[2] <= self.__window and tag.ReadTime - entry[1] <= self.__max_span:
+      entry[0].Merge(tag)
+      entry[2] = max(entry[2], tag.ReadTime)
+    else:
+      # The tag has left the field since it was last read (or has been in it too long), so the previous event is complete
+      if entry is not None: self.__closed.append(entry[0])
+      self.__open[tag.EPC] = [tag, tag.ReadTime, tag.ReadTime]
+
+  def Collect(self, now):
+    """
+    Args:
+      now: float, current time.monotonic()
+
+    Returns: list<Tag>, events whose EPC hasn't been read for the length of the window, or that have reached
+      the max span, in the order they were read
+    """
+    events = self.__closed
+    self.__closed = []
+
+    for epc in [epc for epc, entry in self.__open.items() if self.__deadline(entry) <= now]:
+      events.append(self.__open.pop(epc)[0])
+
+    events.sort(key=lambda tag: tag.ReadTime)
+    return events
+
+  def __deadline(self, entry):
+    _, first_read, last_read = entry
+    return min(last_read + self.__window, first_read + self.__max_span)
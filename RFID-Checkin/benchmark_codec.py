@@ -0,0 +1,66 @@
+'''
+RFID Logging Software
+
+Description (benchmark_codec.py):
+Compares the size and encode/decode time of codec.py against pickle for each kind of message sent between the
+nodes and the handler. Run with: python3 benchmark_codec.py [iterations]
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import pickle, timeit, datetime, sys, zlib
+from node_enums import Status, Command, Topic, NodeBusy, NodeError
+from tag import Tag, TagStatus
+import codec
+
+NODE_ID = 'UPOGDU'
+
+def sample_messages():
+  """
+  Returns: list<[str, Topic, object]>, name, topic, and body of each message to compare
+  """
+  tags = [Tag(f'E2000017221101021890{x:04X}', TagStatus.In, -55, antenna=1).__dict__ for x in range(50)]
+
+  return [
+    ['command', Topic.COMMANDS, Command.START_LOGGING],
+    ['status', Topic.NODE_STATUS, {'Status' : Status.LOGGING, 'ScanMode' : None}],
+    ['response', Topic.NODE_RESPONSE, Command.START_LOGGING],
+    ['1 tag', Topic.TAG_READINGS, tags[:1]],
+    ['50 tags', Topic.TAG_READINGS, tags],
+    ['sensor', Topic.SENSOR_READINGS, [0, 1]],
+    ['error', Topic.ERROR_CODES, {'TRIGGER_COMMAND' : Command.READ_ONCE, 'ERROR_MESSAGE' : NodeBusy(NodeError.NODE_BUSY_LOGGING)}],
+    ['log', Topic.NODE_LOG, {'Name' : '10-17-2026.txt', 'Offset' : 0, 'Chunk' : zlib.compress(b'10/17/2026 12:00:00\tread tag\n' * 100)}]
+  ]
+
+def run(iterations = 10000):
+  """
+  Returns: list<object>, one result per message with sizes in bytes and times in microseconds
+  """
+  results = []
+
+  for name, topic, body in sample_messages():
+    message_obj = {'TIMESTAMP' : datetime.datetime.now(), 'ID' : NODE_ID, 'BODY' : body}
+    pickled = pickle.dumps(message_obj)
+    encoded = codec.encode(topic, body, NODE_ID)
+
+    results.append({
+      'message' : name,
+      'pickle_bytes' : len(pickled),
+      'codec_bytes' : len(encoded),
+      'pickle_encode_us' : timeit.timeit(lambda: pickle.dumps(message_obj), number=iterations) / iterations * 1e6,
+      'codec_encode_us' : timeit.timeit(lambda: codec.encode(topic, body, NODE_ID), number=iterations) / iterations * 1e6,
+      'pickle_decode_us' : timeit.timeit(lambda: pickle.loads(pickled), number=iterations) / iterations * 1e6,
+      'codec_decode_us' : timeit.timeit(lambda: codec.decode(encoded), number=iterations) / iterations * 1e6
+    })
+
+  return results
+
+if __name__ == '__main__':
+  results = run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
+
+  print(f"{'message':<10}{'pickle B':>10}{'codec B':>10}{'pickle enc':>12}{'codec enc':>12}{'pickle dec':>12}{'codec dec':>12}")
+  for r in results:
+    print(f"{r['message']:<10}{r['pickle_bytes']:>10}{r['codec_bytes']:>10}{r['pickle_encode_us']:>10.1f}us{r['codec_encode_us']:>10.1f}us{r['pickle_decode_us']:>10.1f}us{r['codec_decode_us']:>10.1f}us")
@@ -0,0 +1,274 @@
+'''
+RFID Logging Software
+
+Description (benchmark_pipeline.py):
+Measures the whole reading pipeline end to end: ReadingManager -> ManagerWrapper -> Node -> Handler. Objects
+carrying tags are passed through the simulated lasers while the simulated reader plays back reads of their tags,
+and everything talks through the in-process broker from simulation.py, so no hardware or network is needed.
+
+Reports the reads per second handled, the latency from a tag's last read until the handler has logged it, the CPU
+time and memory of each stage, and any events that were dropped, misclassified, or logged when they shouldn't have
+been. Results are printed as JSON so they can be saved and compared between releases.
+
+Run with: python3 benchmark_pipeline.py [--passes N] [--tags N] [--rate N] [--interval S] [--output FILE]
+  [--baseline FILE] [--tolerance F] [--verbose]
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import argparse, contextlib, datetime, io, json, os, pickle, random, shutil, sys, tempfile, threading, time
+from simulation import SimulatedReader, SimulatedGPIO, LocalBroker
+from sensors import Laser, SetGPIOBackend
+from node_enums import Command, Status
+from rfidtag import RFIDTag
+from tag import TagStatus
+from node import Node
+from handler import Handler
+import read
+
+LOCATION = 'Benchmark'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+RESULT_VERSION = 1
+
+def build_scenario(passes = 20, tags_per_pass = 5, rate = 50, interval = 5, seed = 0):
+  """
+  Builds passes alternating between going in and out, each carrying their own tags. Every tag is read at the rate
+  while it is within a second of the lasers, with the RSSI peaking as it passes between them.
+
+  Args:
+    passes: int, amount of objects passing the lasers
+    tags_per_pass: int, amount of tags carried by each object
+    rate: float, reads per second of each tag while it is near the lasers
+    interval: float, seconds between objects
+    seed: int, seed for repeatable reads
+
+  Returns: [list<[float, str, int, int]>, list<[float, int, int]>, dict<str, TagStatus>], the reader recording
+    (see SimulatedReader), the laser timeline (see SimulatedGPIO), and the status each EPC should be logged with
+  """
+  rand = random.Random(seed)
+  recording = []
+  timeline = []
+  expected = {}
+  gap = 0.3
+
+  for x in range(passes):
+    # Going in breaks the outer laser first, and the direction is the laser broken second. See sensors.py
+    status = TagStatus.In if x % 2 == 0 else TagStatus.Out
+    first_pin, second_pin = [Laser.OUT_PIN, Laser.IN_PIN] if status == TagStatus.In else [Laser.IN_PIN, Laser.OUT_PIN]
+    start = 1 + x * interval
+    timeline += SimulatedGPIO.PassTimeline(first_pin, second_pin, 1, gap=gap, start=start)
+
+    for y in range(tags_per_pass):
+      epc = f'E2B0{x:08X}{y:012X}'
+      expected[epc] = status
+
+      read_time = start - 1 + rand.expovariate(rate)
+      while read_time < start + gap + 1:
+        distance = abs(read_time - (start + gap / 2))
+        recording.append([read_time, epc, int(max(-127, -45 - 25 * distance + rand.gauss(0, 3))), 1])
+        read_time += rand.expovariate(rate)
+
+  return [sorted(recording), sorted(timeline), expected]
+
+def process_usage(pid = 'self'):
+  """
+  Returns: object {'cpu_s' : float, 'rss_kb' : int}, CPU time and resident memory of the process, read from /proc
+  """
+  with open(f'/proc/{pid}/stat') as sf:
+    fields = sf.read().rsplit(')', 1)[1].split()
+  with open(f'/proc/{pid}/status') as sf:
+    rss = next((int(line.split()[1]) for line in sf if line.startswith('VmRSS:')), 0)
+
+  # utime and stime are the 14th and 15th fields, counted from after the process name
+  return {'cpu_s' : (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, 'rss_kb' : rss}
+
+def percentile(values, fraction):
+  if not values: return None
+  ordered = sorted(values)
+  return ordered[int(round(fraction * (len(ordered) - 1)))]
+
+def wait_for(condition, timeout):
+  end_time = time.monotonic() + timeout
+  while not condition():
+    if time.monotonic() > end_time: return False
+    time.sleep(0.05)
+  return True
+
+def run(passes = 20, tags_per_pass = 5, rate = 50, interval = 5, seed = 0):
+  """
+  Runs the scenario from build_scenario() through the pipeline in a temporary folder.
+
+  Returns: object, the results. See summarize()
+  """
+  recording, timeline, expected = build_scenario(passes, tags_per_pass, rate, interval, seed)
+  work_dir = tempfile.mkdtemp(prefix='rfid-benchmark-')
+  original_dir = os.getcwd()
+  os.chdir(work_dir)
+
+  try:
+    # The handler only logs tags it knows, so every tag of the scenario is registered ahead of time
+    os.makedirs('data')
+    with open('data/settings.rsf', 'wb') as sf:
+      pickle.dump({
+        'spreadsheet_id' : '',
+        'rfid_tags' : [RFIDTag(epc, 'Unknown', 'Benchmark', f'Tag {x}', '', '') for x, epc in enumerate(expected)],
+        'nodes' : []
+      }, sf)
+
+    gpio = SimulatedGPIO()
+    SetGPIOBackend(gpio)
+    reader = SimulatedReader(recording=recording, loop=False)
+    broker = LocalBroker()
+
+    node_client = broker.Client('node')
+    wrapper = read.ManagerWrapper(reader, 'simulated reader', client=node_client)
+    handler = Handler(interactive=False)
+
+    logged = []
+    logged_lock = threading.Lock()
+
+    def log_tag(log, location):
+      # Logs through the handler exactly as its own nodes do, then measures from the tag's last read
+      handler._Handler__receive_node_log(log, location)
+      done = datetime.datetime.now()
+
+      with logged_lock:
+        logged.append([log['BODY']['EPC'], log['BODY']['Status'], log['BODY'].get('ReadCount', 1),
+                       (done - log['BODY'].get('LastSeen', log['TIMESTAMP'])).total_seconds() * 1000])
+
+    ignore = lambda *args: None
+    handler_client = broker.Client('handler')
+    node = Node(ID=read.RASPI_ID, Location=LOCATION, LoggingCallback=log_tag, ReadOnceCallback=ignore, SensorTestingCallback=ignore,
+                ReaderTestingCallback=ignore, ErrorCallback=ignore, Client=handler_client)
+
+    if not wait_for(lambda: node.Status == Status.ONLINE, 10):
+      raise RuntimeError('Node never came online')
+
+    parent_start = process_usage()
+    start_time = time.monotonic()
+    gpio.Play(timeline)
+    node.SendMessage(Command.START_LOGGING)
+
+    # Every event is logged within the correlator's hold time of its pass, plus some slack for the final batch
+    end_of_scenario = max(recording[-1][0] if recording else 0, timeline[-1][0] if timeline else 0)
+    wait_for(lambda: len(logged) >= len(expected), end_of_scenario + 15)
+    elapsed = time.monotonic() - start_time
+    time.sleep(1) # Gives late duplicates a chance to show up
+
+    # The processes exit once reading stops, so they are measured first
+    stages = {name : process_usage(pid) for name, pid in wrapper.ReadingManager.ProcessIDs.items()}
+    parent_end = process_usage()
+
+    node.SendMessage(Command.STOP_LOGGING)
+    wait_for(lambda: node.Status == Status.ONLINE, 10)
+    wrapper.Shutdown()
+    node.QuickShutdown()
+  finally:
+    os.chdir(original_dir)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+  # The parent runs the broker, the node's network loop, and the handler. The time spent in each client's callbacks
+  # is the node handling commands and the handler (through Node.__on_message) logging tags.
+  stages['parent'] = {'cpu_s' : parent_end['cpu_s'] - parent_start['cpu_s'], 'rss_kb' : parent_end['rss_kb']}
+  stages['node_callbacks'] = {'cpu_s' : node_client.CallbackTime}
+  stages['handler_callbacks'] = {'cpu_s' : handler_client.CallbackTime}
+
+  return summarize(expected, logged, recording, elapsed, stages)
+
+def summarize(expected, logged, recording, elapsed, stages):
+  """
+  Returns: object {
+    'version' : int, format of the results
+    'elapsed_s' : float, seconds from starting to log until the last event was expected
+    'offered_reads' : int, reads played back by the simulated reader
+    'logged_reads' : int, reads merged into the events that were logged
+    'reads_per_s' : float, logged reads per second
+    'events' : object {'expected', 'logged', 'dropped', 'misclassified', 'extra'}, counts of events
+    'latency_ms' : object {'p50', 'p99', 'max'}, from each tag's last read until the handler had logged it
+    'stages' : object, {'cpu_s' : float, 'rss_kb' : int} for each process and the parent's MQTT callbacks
+  }
+  """
+  first_logs = {}
+  extra = 0
+  for epc, status, read_count, latency in logged:
+    if epc in expected and epc not in first_logs: first_logs[epc] = status
+    else: extra += 1
+
+  latencies = [x[3] for x in logged]
+  logged_reads = sum(x[2] for x in logged)
+
+  return {
+    'version' : RESULT_VERSION,
+    'elapsed_s' : round(elapsed, 3),
+    'offered_reads' : len(recording),
+    'logged_reads' : logged_reads,
+    'reads_per_s' : round(logged_reads / elapsed, 1) if elapsed else 0,
+    'events' : {
+      'expected' : len(expected),
+      'logged' : len(logged),
+      'dropped' : len(expected) - len(first_logs),
+      'misclassified' : sum(1 for epc, status in first_logs.items() if status != expected[epc]),
+      'extra' : extra
+    },
+    'latency_ms' : {
+      'p50' : round(percentile(latencies, 0.5), 1) if latencies else None,
+      'p99' : round(percentile(latencies, 0.99), 1) if latencies else None,
+      'max' : round(max(latencies), 1) if latencies else None
+    },
+    'stages' : {name : {key : round(value, 3) for key, value in usage.items()} for name, usage in stages.items()}
+  }
+
+def compare(results, baseline, tolerance = 0.2):
+  """
+  Args:
+    results: object, results from run()
+    baseline: object, results from an earlier run to compare against
+    tolerance: float, fraction that throughput and latency may worsen by before it counts as a regression
+
+  Returns: list<str>, description of each regression
+  """
+  regressions = []
+
+  if results['reads_per_s'] < baseline['reads_per_s'] * (1 - tolerance):
+    regressions.append(f"reads/s fell from {baseline['reads_per_s']} to {results['reads_per_s']}")
+
+  for key in ['p50', 'p99']:
+    old, new = baseline['latency_ms'][key], results['latency_ms'][key]
+    if old is not None and new is not None and new > old * (1 + tolerance):
+      regressions.append(f"{key} latency rose from {old} ms to {new} ms")
+
+  for key in ['dropped', 'misclassified', 'extra']:
+    if results['events'][key] > baseline['events'][key]:
+      regressions.append(f"{key} events rose from {baseline['events'][key]} to {results['events'][key]}")
+
+  return regressions
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='End to end benchmark of the reading pipeline')
+  parser.add_argument('--passes', type=int, default=20, help='objects passing the lasers')
+  parser.add_argument('--tags', type=int, default=5, help='tags carried by each object')
+  parser.add_argument('--rate', type=float, default=50, help='reads per second of each tag near the lasers')
+  parser.add_argument('--interval', type=float, default=5, help='seconds between objects')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help='file to save the results to')
+  parser.add_argument('--baseline', help='results of an earlier run. Exits with 1 if this run is worse')
+  parser.add_argument('--tolerance', type=float, default=0.2)
+  parser.add_argument('--verbose', action='store_true', help="show the node's and handler's output")
+  args = parser.parse_args()
+
+  output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+  with output:
+    results = run(args.passes, args.tags, args.rate, args.interval, args.seed)
+
+  text = json.dumps(results, indent=2)
+  print(text)
+  if args.output:
+    with open(args.output, 'w') as rf: rf.write(text + '\n')
+
+  if args.baseline:
+    with open(args.baseline) as bf: regressions = compare(results, json.load(bf), args.tolerance)
+    for regression in regressions: print(f'regression: {regression}', file=sys.stderr)
+    sys.exit(1 if regressions else 0)
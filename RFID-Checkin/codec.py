@@ -0,0 +1,338 @@
+'''
+RFID Logging Software
+
+Description (codec.py):
+Compact binary format for the messages sent between the nodes and the handler. Replaces pickle, which is large
+on the wire and able to run arbitrary code when loading untrusted messages, and checks the version and shape of
+every message it decodes. It isn't faster than pickle for batches of tags, where most of the time goes into the
+datetimes and dicts of each tag either way.
+
+Every message starts with a fixed header followed by a body that depends on the topic it is sent on:
+
+  version (B), topic (B), timestamp in epoch-ms (q), node ID length (B), node ID (utf-8)
+
+Enum members are sent as their index within the enum, so new members must only ever be added to the end of an
+enum. Any other change to the format must increment VERSION.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import struct, datetime, math
+from node_enums import Status, Command, Topic, NodeError, ScanMode
+from tag import TagStatus
+
+VERSION = 4
+
+_HEADER = struct.Struct('<BBqB')
+_LENGTH = struct.Struct('<H')
+_LONG_LENGTH = struct.Struct('<I')
+_BYTE = struct.Struct('<B')
+
+# EPC length, status, RSSI, antenna, timestamp, first seen, last seen, read count, antenna bit mask. Followed by the raw EPC.
+_TAG = struct.Struct('<BBbBqqqII')
+_MAX_ANTENNAS = 32
+# Sensor type, reading
+_SENSOR = struct.Struct('<BB')
+# Triggering command, error
+_ERROR = struct.Struct('<BB')
+# Status, scan mode (NO_SCAN_MODE if the node isn't reading)
+_STATUS = struct.Struct('<BB')
+_NO_SCAN_MODE = 0xFF
+# Offset of the chunk within the log file. Preceded by the file name, followed by the compressed chunk.
+_LOG = struct.Struct('<Q')
+# Interval, each of _METRIC_COUNTS, CPU temperature. Followed by a _LATENCY for each of _METRIC_LATENCIES.
+# Values that are None are sent as NaN.
+_METRIC_COUNTS = ['Reads', 'DroppedReads', 'LaserEvents', 'Tags', 'UnmatchedTags', 'DroppedMessages', 'TagQueue',
+                  'DirectionQueue', 'WaitingTags', 'SyncQueue', 'PublishQueue', 'OutboxBacklog', 'FilteredReads']
+_METRIC_LATENCIES = ['TagLatency', 'PublishLatency']
+_METRICS = struct.Struct('<f' + 'I' * len(_METRIC_COUNTS) + 'f')
+# Count, P50, P99, max
+_LATENCY = struct.Struct('<Ifff')
+
+_TOPICS = list(Topic)
+_STATUSES = list(Status)
+_COMMANDS = list(Command)
+_TAG_STATUSES = list(TagStatus)
+_TAG_STATUS_INDEXES = {x : i for i, x in enumerate(_TAG_STATUSES)} # Faster than searching the list for a member
+_ERRORS = list(NodeError)
+_SCAN_MODES = list(ScanMode)
+
+def encode(topic, body, node_id = '', timestamp = None):
+  """
+  Args:
+    topic: Topic, topic the message is sent on. Decides how the body is encoded
+    body: object, data being sent. See decode() for the type expected for each topic
+    node_id: str, ID of the node sending or receiving the message
+    timestamp: datetime, when the message was sent. Defaults to now
+
+  Returns: bytes, the encoded message
+
+  Raises: ValueError, if the topic isn't a Topic or a value of the body can't be encoded, such as an antenna
+    outside of the antenna mask
+  """
+  if not isinstance(topic, Topic):
+    raise ValueError("'topic' argument must be an instance of Topic")
+
+  timestamp = timestamp or datetime.datetime.now()
+  raw_id = node_id.encode('utf-8')
+  header = _HEADER.pack(VERSION, _TOPICS.index(topic), _to_ms(timestamp), len(raw_id)) + raw_id
+
+  return header + _ENCODERS[topic](body)
+
+def decode(payload, topic = None):
+  """
+  Args:
+    payload: bytes, message created by encode()
+    topic: Topic, optional topic the message was received on. The body of a message is only guaranteed to have
+      the shape listed below for the topic it was encoded for, so messages encoded for any other are refused.
+
+  Returns: object, {
+    'TIMESTAMP' : datetime, when the message was sent
+    'ID' : str, node ID
+    'TOPIC' : Topic, topic the message was encoded for
+    'BODY' : object, one of the following depending on the topic\n
+      COMMANDS: object {'Command' : Command, 'Argument' : bytes}, where the argument is None if there isn't one
+      NODE_STATUS: object {'Status' : Status, 'ScanMode' : ScanMode}, where the scan mode is None if the node isn't reading
+      NODE_RESPONSE: Command, the command being replied to
+      TAG_READINGS: list<object> of tags, see _decode_tags()
+      UNMATCHED_TAGS: list<object> of tags that no laser pass could be matched to, see _decode_tags()
+      METRICS: object of the node's metrics, see _decode_metrics()
+      SENSOR_READINGS: object {'SensorType' : int, 'Reading' : int}
+      ERROR_CODES: object {'TRIGGER_COMMAND' : Command, 'ERROR_CODE' : NodeError, 'ERROR_MESSAGE' : str}
+      NODE_LOG: object {'Name' : str, 'Offset' : int, 'Chunk' : bytes}, a zlib compressed part of a log file, see log_sync.py
+  }
+
+  Raises: ValueError, if the message is malformed, was encoded with a different version, or was encoded for
+    another topic than the one given
+  """
+  try:
+    version, topic_index, timestamp, id_length = _HEADER.unpack_from(payload)
+    if version != VERSION:
+      raise ValueError(f"Unsupported message version {version}")
+
+    offset = _HEADER.size + id_length
+    encoded_topic = _TOPICS[topic_index]
+    if topic is not None and encoded_topic != topic:
+      raise ValueError(f"Message for '{encoded_topic}' received on '{topic}'")
+
+    return {
+      'TIMESTAMP' : _from_ms(timestamp),
+      'ID' : str(payload[_HEADER.size:offset], 'utf-8'),
+      'TOPIC' : encoded_topic,
+      'BODY' : _DECODERS[encoded_topic](payload, offset)
+    }
+  except (struct.error, IndexError, KeyError, UnicodeDecodeError) as error:
+    raise ValueError(f"Malformed message: {error}")
+
+def _to_ms(timestamp):
+  return int(timestamp.timestamp() * 1000)
+
+def _from_ms(timestamp):
+  return datetime.datetime.fromtimestamp(timestamp / 1000)
+
+def _encode_string(text, length = _LENGTH):
+  raw = text.encode('utf-8')
+  return length.pack(len(raw)) + raw
+
+def _decode_string(payload, offset, length = _LENGTH):
+  """
+  Returns: [str, int], the string and the offset after it
+  """
+  size, = length.unpack_from(payload, offset)
+  offset += length.size
+  if offset + size > len(payload): raise struct.error('string runs past the end of the message')
+  return [str(payload[offset:offset + size], 'utf-8'), offset + size]
+
+def _to_float(value):
+  return math.nan if value is None else value
+
+def _from_float(value):
+  return None if math.isnan(value) else value
+
+#region Encoders
+def _encode_enum(members):
+  return lambda body: _BYTE.pack(members.index(body))
+
+def _encode_command(body):
+  # Commands without an argument can be given on their own
+  command, argument = [body, None] if isinstance(body, Command) else [body['Command'], body.get('Argument')]
+  return _BYTE.pack(_COMMANDS.index(command)) + _LONG_LENGTH.pack(len(argument or b'')) + (argument or b'')
+
+def _encode_tags(body):
+  tags = body if isinstance(body, list) else [body]
+  encoded = [_LENGTH.pack(len(tags))]
+
+  for tag in tags:
+    tag = tag if isinstance(tag, dict) else tag.__dict__
+    raw_epc = bytes.fromhex(tag['EPC'])
+    antenna = tag.get('Antenna', 0)
+    antennas = 0
+    for x in tag.get('Antennas', ()):
+      if not 0 <= x < _MAX_ANTENNAS: raise ValueError(f"Antenna {x} is outside of 0 to {_MAX_ANTENNAS - 1}")
+      antennas |= 1 << x
+    if not 0 <= antenna < _MAX_ANTENNAS: raise ValueError(f"Antenna {antenna} is outside of 0 to {_MAX_ANTENNAS - 1}")
+    if 'Antennas' not in tag: antennas = 1 << antenna
+
+    try: status = _TAG_STATUS_INDEXES[tag['Status']]
+    except KeyError: raise ValueError(f"{tag['Status']} isn't a TagStatus")
+
+    # Most tags are single reads, where all three times are the same
+    timestamp = tag['Timestamp']
+    first_seen = tag.get('FirstSeen', timestamp)
+    last_seen = tag.get('LastSeen', timestamp)
+    timestamp_ms = _to_ms(timestamp)
+
+    encoded.append(_TAG.pack(len(raw_epc), status, max(-128, min(127, int(tag['RSSI']))), antenna,
+                             timestamp_ms, timestamp_ms if first_seen == timestamp else _to_ms(first_seen),
+                             timestamp_ms if last_seen == timestamp else _to_ms(last_seen), tag.get('ReadCount', 1), antennas))
+    encoded.append(raw_epc)
+
+  return b''.join(encoded)
+
+def _encode_status(body):
+  scan_mode = body.get('ScanMode')
+  return _STATUS.pack(_STATUSES.index(body['Status']), _NO_SCAN_MODE if scan_mode is None else _SCAN_MODES.index(scan_mode))
+
+def _encode_sensor(body):
+  sensor_type, reading = body
+  return _SENSOR.pack(getattr(sensor_type, 'value', sensor_type), int(reading))
+
+def _encode_error(body):
+  error = body['ERROR_MESSAGE']
+  return _ERROR.pack(_COMMANDS.index(body['TRIGGER_COMMAND']), _ERRORS.index(error.Error)) + _encode_string(error.Message)
+
+def _encode_log(body):
+  return _encode_string(body['Name']) + _LOG.pack(body['Offset']) + _LONG_LENGTH.pack(len(body['Chunk'])) + body['Chunk']
+
+def _encode_metrics(body):
+  encoded = [_METRICS.pack(body['Interval'], *[min(0xFFFFFFFF, int(body.get(x, 0))) for x in _METRIC_COUNTS], _to_float(body.get('CPUTemperature')))]
+
+  for name in _METRIC_LATENCIES:
+    latency = body.get(name) or {}
+    encoded.append(_LATENCY.pack(latency.get('Count', 0), *[_to_float(latency.get(x)) for x in ['P50', 'P99', 'Max']]))
+
+  return b''.join(encoded)
+#endregion
+
+#region Decoders
+def _decode_enum(members):
+  return lambda payload, offset: members[_BYTE.unpack_from(payload, offset)[0]]
+
+def _decode_command(payload, offset):
+  command, = _BYTE.unpack_from(payload, offset)
+  length, = _LONG_LENGTH.unpack_from(payload, offset + _BYTE.size)
+  offset += _BYTE.size + _LONG_LENGTH.size
+
+  if offset + length > len(payload): raise struct.error('argument runs past the end of the message')
+  return {'Command' : _COMMANDS[command], 'Argument' : bytes(payload[offset:offset + length]) if length else None}
+
+def _decode_tags(payload, offset):
+  """
+  Returns: list<object>, each formatted as {
+    'EPC' : str, 'Status' : TagStatus, 'RSSI' : int, 'Antenna' : int, 'Timestamp' : datetime,
+    'FirstSeen' : datetime, 'LastSeen' : datetime, 'ReadCount' : int, 'Antennas' : list<int>
+  }
+  """
+  count, = _LENGTH.unpack_from(payload, offset)
+  offset += _LENGTH.size
+  tags = []
+
+  for _ in range(count):
+    epc_length, status, rssi, antenna, timestamp, first_seen, last_seen, read_count, antennas = _TAG.unpack_from(payload, offset)
+    offset += _TAG.size
+    raw_epc = payload[offset:offset + epc_length]
+    offset += epc_length
+
+    if len(raw_epc) != epc_length: raise struct.error('EPC runs past the end of the message')
+
+    read_time = _from_ms(timestamp)
+
+    tags.append({
+      'EPC' : raw_epc.hex().upper(),
+      'Status' : _TAG_STATUSES[status],
+      'RSSI' : rssi,
+      'Antenna' : antenna,
+      'Timestamp' : read_time,
+      'FirstSeen' : read_time if first_seen == timestamp else _from_ms(first_seen),
+      'LastSeen' : read_time if last_seen == timestamp else _from_ms(last_seen),
+      'ReadCount' : read_count,
+      'Antennas' : [x for x in range(antennas.bit_length()) if antennas >> x & 1]
+    })
+
+  return tags
+
+def _decode_status(payload, offset):
+  status, scan_mode = _STATUS.unpack_from(payload, offset)
+  return {'Status' : _STATUSES[status], 'ScanMode' : None if scan_mode == _NO_SCAN_MODE else _SCAN_MODES[scan_mode]}
+
+def _decode_sensor(payload, offset):
+  sensor_type, reading = _SENSOR.unpack_from(payload, offset)
+  return {'SensorType' : sensor_type, 'Reading' : reading}
+
+def _decode_error(payload, offset):
+  command, error = _ERROR.unpack_from(payload, offset)
+  message, _ = _decode_string(payload, offset + _ERROR.size)
+  return {'TRIGGER_COMMAND' : _COMMANDS[command], 'ERROR_CODE' : _ERRORS[error], 'ERROR_MESSAGE' : message}
+
+def _decode_log(payload, offset):
+  name, offset = _decode_string(payload, offset)
+  chunk_offset, = _LOG.unpack_from(payload, offset)
+  length, = _LONG_LENGTH.unpack_from(payload, offset + _LOG.size)
+  offset += _LOG.size + _LONG_LENGTH.size
+
+  if offset + length > len(payload): raise struct.error('chunk runs past the end of the message')
+  return {'Name' : name, 'Offset' : chunk_offset, 'Chunk' : bytes(payload[offset:offset + length])}
+
+def _decode_metrics(payload, offset):
+  """
+  Returns: object {
+    'Interval' : float, seconds covered by the metrics
+    'Reads', 'DroppedReads', 'LaserEvents', 'Tags', 'UnmatchedTags', 'DroppedMessages' : int, counts within the interval
+    'TagQueue', 'DirectionQueue', 'WaitingTags', 'SyncQueue', 'PublishQueue' : int, items waiting at the end of the interval
+    'OutboxBacklog' : int, bytes waiting in the outbox
+    'FilteredReads' : int, reads of tags the handler doesn't know about, dropped within the interval
+    'CPUTemperature' : float, Celsius, or None if unknown
+    'TagLatency', 'PublishLatency' : object {'Count' : int, 'P50' : float, 'P99' : float, 'Max' : float}, milliseconds
+  }
+  """
+  values = _METRICS.unpack_from(payload, offset)
+  offset += _METRICS.size
+
+  metrics = dict(zip(_METRIC_COUNTS, values[1:-1]))
+  metrics['Interval'] = values[0]
+  metrics['CPUTemperature'] = _from_float(values[-1])
+
+  for name in _METRIC_LATENCIES:
+    count, *percentiles = _LATENCY.unpack_from(payload, offset)
+    offset += _LATENCY.size
+    metrics[name] = dict(zip(['P50', 'P99', 'Max'], [_from_float(x) for x in percentiles]), Count=count)
+
+  return metrics
+#endregion
+
+_ENCODERS = {
+  Topic.COMMANDS : _encode_command,
+  Topic.NODE_STATUS : _encode_status,
+  Topic.NODE_RESPONSE : _encode_enum(_COMMANDS),
+  Topic.TAG_READINGS : _encode_tags,
+  Topic.SENSOR_READINGS : _encode_sensor,
+  Topic.ERROR_CODES : _encode_error,
+  Topic.NODE_LOG : _encode_log,
+  Topic.UNMATCHED_TAGS : _encode_tags,
+  Topic.METRICS : _encode_metrics
+}
+
+_DECODERS = {
+  Topic.COMMANDS : _decode_command,
+  Topic.NODE_STATUS : _decode_status,
+  Topic.NODE_RESPONSE : _decode_enum(_COMMANDS),
+  Topic.TAG_READINGS : _decode_tags,
+  Topic.SENSOR_READINGS : _decode_sensor,
+  Topic.ERROR_CODES : _decode_error,
+  Topic.NODE_LOG : _decode_log,
+  Topic.UNMATCHED_TAGS : _decode_tags,
+  Topic.METRICS : _decode_metrics
+}
@@ -0,0 +1,117 @@
+'''
+RFID Logging Software
+
+Description (command_executor.py):
+Runs the commands received by a node away from the MQTT network thread, so that thread is always free to send
+replies, keepalives, and tags. Commands that change what the node is doing run one at a time in the order they
+were received, while the rest run on a pool of workers. Modes that keep going until they are stopped, such as the
+reader test, run as a Task that the command stopping them cancels.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import threading, queue, time
+
+class Task:
+  def __init__(self, target, cancel = None, name = None):
+    """
+    Starts running target in the background.
+
+    Args:
+      target: function, called with a threading.Event that is set once the task is cancelled. Should return
+        soon after it is set.
+      cancel: function, optional, called when the task is cancelled, for targets that are stopped some other way
+      name: str, optional name of the thread
+    """
+    self.__cancel = cancel
+    self.__cancelled = threading.Event()
+    self.__thread = threading.Thread(target=target, args=(self.__cancelled,), name=name, daemon=True)
+    self.__thread.start()
+
+  @property
+  def Running(self):
+    return self.__thread.is_alive()
+
+  def Cancel(self, timeout = 5):
+    """
+    Tells the task to stop and waits for it to finish.
+
+    Returns: bool, whether the task finished within the timeout
+    """
+    self.__cancelled.set()
+    if self.__cancel is not None: self.__cancel()
+    return self.Wait(timeout)
+
+  def Wait(self, timeout = None):
+    """
+    Returns: bool, whether the task finished within the timeout
+    """
+    if self.__thread is not threading.current_thread(): self.__thread.join(timeout)
+    return not self.__thread.is_alive()
+
+class CommandExecutor:
+  def __init__(self, on_error, workers = 2):
+    """
+    Args:
+      on_error: function, called with (Command, Exception) when running a command raises
+      workers: int, amount of threads running the commands that don't have to be run in order
+    """
+    self.__on_error = on_error
+    self.__handlers = {}
+
+    # Commands run in order are all handled by one thread. The rest share the pool.
+    self.__ordered = queue.Queue()
+    self.__unordered = queue.Queue()
+    self.__threads = [threading.Thread(target=self.__run, args=(self.__ordered,), daemon=True)]
+    self.__threads += [threading.Thread(target=self.__run, args=(self.__unordered,), daemon=True) for _ in range(workers)]
+    for thread in self.__threads: thread.start()
+
+  def Register(self, command, handler, ordered = True):
+    """
+    Args:
+      command: Command, command handled
+      handler: function, called with the command's argument (bytes or None). Anything that keeps going until
+        stopped must be started as a Task so the next command isn't held up.
+      ordered: bool, whether the command must run after every ordered command received before it. Commands
+        that change the node's status must be.
+    """
+    self.__handlers[command] = [handler, ordered]
+
+  def Submit(self, command, argument = None):
+    """
+    Queues a command to be run. Never blocks.
+
+    Returns: bool, whether a handler was registered for the command
+    """
+    if command not in self.__handlers: return False
+
+    handler, ordered = self.__handlers[command]
+    (self.__ordered if ordered else self.__unordered).put_nowait([command, handler, argument])
+    return True
+
+  def Stop(self, timeout = 5):
+    """
+    Stops the threads once every command already queued has run, and waits for them to finish so nothing is still
+    using the node when it's torn down.
+
+    Args:
+      timeout: float, max seconds to wait for all of the threads
+
+    Returns: bool, whether every thread finished within the timeout
+    """
+    for thread in self.__threads:
+      (self.__ordered if thread is self.__threads[0] else self.__unordered).put_nowait(None)
+
+    end_time = time.monotonic() + timeout
+    for thread in self.__threads:
+      if thread is not threading.current_thread(): thread.join(max(0, end_time - time.monotonic()))
+
+    return not any(thread.is_alive() for thread in self.__threads if thread is not threading.current_thread())
+
+  def __run(self, commands):
+    for command, handler, argument in iter(commands.get, None):
+      try: handler(argument)
+      except Exception as error: self.__on_error(command, error)
@@ -10,8 +10,9 @@ Dom Stepek
 Edited on: May 4, 2019
 '''
 
-import threading, queue, re, enum
+import threading, queue, re, enum, datetime
 from node_enums import Command
+from log import Log
 from tabulate import tabulate
 
 class CommandReader:
@@ -148,6 +149,16 @@ class CommandReader:
           self.__print_nodes()
         elif display_command == 'l':
           self.__print_logs(int(next(commands, 5)))
+        elif display_command == 'm':
+          self.__print_metrics()
+        elif display_command == 'o':
+          owner = ' '.join(commands)
+          self.__print_tags(self.__handler.RFIDTags.ByOwner(owner), f"Tags owned by '{owner}'")
+        elif display_command == 'q':
+          self.__print_query(' '.join(commands))
+        elif display_command == 'w':
+          location = ' '.join(commands)
+          self.__print_tags(self.__handler.RFIDTags.ByLocation(location), f"Tags last seen at '{location}'")
       elif first_command == CommandReader.Command.HELP:
         self.ShowHelp()
 
@@ -199,17 +210,61 @@ class CommandReader:
 
   def __print_nodes(self):
     print('\r\nNodes:\r\n')
-    nodes = [[[v.ID, v.Location, v.Status]] for v in self.__handler.Nodes]
-    print(tabulate(nodes, headers=['ID', 'Location', 'Status'], tablefmt="rst"))
+    nodes = [[v.ID, v.Location, v.Status.value, v.ScanMode.value if v.ScanMode else ''] for v in self.__handler.Nodes]
+    print(tabulate(nodes, headers=['ID', 'Location', 'Status', 'Scan Mode'], tablefmt="rst"))
 
-  def __print_tags(self):
-    print('\r\nTags:\r\n')
-    tags = [str(v).split(sep=',') for v in self.__handler.RFIDTags]
+  def __print_tags(self, rfidtags = None, title = 'Tags'):
+    print(f'\r\n{title}:\r\n')
+    tags = [str(v).split(sep=',') for v in (self.__handler.RFIDTags if rfidtags is None else rfidtags)]
     print(tabulate(tags, headers=['EPC', 'Status', 'Owner', 'Description', 'Last Location', 'Extra'], tablefmt="rst"))
 
+  def __print_metrics(self):
+    print('\r\nNode Metrics:\r\n')
+    latency = lambda values: '/'.join('-' if values[x] is None else f'{values[x]:.0f}' for x in ['P50', 'P99', 'Max'])
+    rows = []
+
+    for node in self.__handler.Nodes:
+      metrics = node.Metrics
+      if metrics is None:
+        rows.append([node.ID] + [''] * 10)
+        continue
+
+      interval = metrics['Interval'] or 1
+      rows.append([node.ID, metrics['Timestamp'].strftime('%H:%M:%S'), f"{metrics['Reads'] / interval:.1f}", metrics['DroppedReads'], metrics['FilteredReads'],
+                   f"{metrics['LaserEvents'] * 60 / interval:.1f}",
+                   f"{metrics['TagQueue']}/{metrics['WaitingTags']}/{metrics['SyncQueue']}/{metrics['PublishQueue']}",
+                   metrics['DroppedMessages'], latency(metrics['TagLatency']), latency(metrics['PublishLatency']),
+                   '' if metrics['CPUTemperature'] is None else f"{metrics['CPUTemperature']:.1f}"])
+
+    print(tabulate(rows, headers=['ID', 'Time', 'Reads/s', 'Dropped Reads', 'Filtered Reads', 'Laser Events/min', 'Queues (Tag/Waiting/Sync/Publish)',
+                                  'Dropped Messages', 'Tag Latency ms (P50/P99/Max)', 'Publish Latency ms (P50/P99/Max)', 'CPU °C'], tablefmt="rst"))
+
+  def __print_query(self, text):
+    # Filters are given as name=value, where values may contain spaces, e.g. location=Room 112 since=10/01/2026
+    filters = dict(re.findall(r'(\w+)=(.*?)(?=\s+\w+=|$)', text))
+
+    try:
+      for name in ['since', 'until']:
+        if name in filters: filters[name] = self.__parse_time(filters[name])
+      if 'status' in filters: filters['status'] = Log.Status[filters['status'].title()]
+      limit = int(filters.pop('limit', 20))
+
+      logs = self.__handler.QueryLogs(limit=limit, newest_first=True, **filters)
+    except (ValueError, KeyError, TypeError):
+      self.__print_error(f"Invalid log query '{text}'")
+      return
+
+    print('\r\nLogs:\r\n')
+    logs = [str(v).split(sep=',') for v in reversed(logs)]
+    print(tabulate(logs, headers=['Timestamp', 'EPC', 'Status', 'Owner', 'Description', 'Location', 'Extra'], tablefmt="rst"))
+
+  def __parse_time(self, text):
+    try: return datetime.datetime.strptime(text, '%m/%d/%Y %H:%M:%S')
+    except ValueError: return datetime.datetime.strptime(text, '%m/%d/%Y')
+
   def __print_logs(self, rows):
     print('\r\nLogs:\r\n')
-    logs = [str(v).split(sep=',') for v in self.__handler.GetLogsFile()[-rows:]]
+    logs = [str(v).split(sep=',') for v in self.__handler.GetLastLogs(rows)]
     print(tabulate(logs, headers=['Timestamp', 'EPC', 'Status', 'Owner', 'Description', 'Location', 'Extra'], tablefmt="rst"))
 #endregion
 
@@ -254,6 +309,12 @@ display|d [command] [results]
     n - Display readers.
     s - Display spreadsheet ID.
     l - Display logs.
+    m - Display the latest metrics of each node.
+    o [owner] - Display the RFID tags of an owner.
+    w [location] - Display the RFID tags last seen at a location.
+    q [filters] - Display the most recent logs matching the filters. Filters are given as name=value:
+      epc, location, status (in/out), since and until (MM/DD/YYYY [HH:MM:SS]), limit (default 20)
+      e.g. d q location=Room 112 since=10/16/2026 until=10/17/2026 status=out
   Results:
     integer, the amount of logs to display (more recent logs have priority)
 help|h
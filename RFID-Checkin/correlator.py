@@ -0,0 +1,201 @@
+'''
+RFID Logging Software
+
+Description (correlator.py):
+Assigns laser directions to tag reads. Directions are kept in a time ordered interval list and tags are matched
+against it as a streaming merge-join once every direction that could contain them has been logged.
+
+Each tag is matched once when it is added, and again only when a new direction contains it. Waiting tags are
+kept in read order with a heap of the times they can be collected, so Collect() only looks at tags that are ready
+rather than every tag against every pending pass.
+
+With several pairs of lasers (such as one per door of a double doorway), each pair is a zone and each antenna can
+be assigned the zone it covers, so a tag is only matched to directions from the lasers next to the antenna that
+read it best.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import bisect, itertools, heapq
+from tag import TagStatus
+
+class DirectionCorrelator:
+  def __init__(self, hold_time, zones = None, padding = None):
+    """
+    Args:
+      hold_time: float, seconds after a read until every direction that could contain it has been logged.
+        For directions padded by the laser threshold this is twice the threshold (the padding before the first
+        break plus the max time until the second break).
+      zones: dict<int, int>, optional zone covered by each antenna. Tags read by an antenna that isn't listed
+        are matched against directions from every zone.
+      padding: float, optional seconds each direction was padded by on both sides. With it, tags are collected
+        as soon as no direction still to come could contain them or be nearer to them (see Collect()), which is
+        usually long before the hold time.
+    """
+    self.__hold_time = hold_time
+    self.__zones = zones or {}
+    self.__padding = padding
+
+    # Directions sorted by start time. __starts mirrors the start times for bisecting.
+    self.__starts = []
+    self.__directions = []
+    self.__max_span = 0
+
+    # Tags waiting for their directions to close as [read time, sequence, tag, status, distance, deadline],
+    # ordered by read time. __waiting finds them by sequence.
+    self.__tags = []
+    self.__waiting = {}
+    self.__sequence = itertools.count()
+
+    # [deadline, sequence] of every waiting tag. Rematching a tag pushes its new deadline, and the old one is
+    # skipped once it comes up.
+    self.__deadlines = []
+    self.__next_deadline = None
+
+  def __len__(self):
+    return len(self.__tags)
+
+  @property
+  def NextDeadline(self):
+    """
+    Monotonic time when the next waiting tag can be collected if no pass is under way, or None if there are no
+    tags. Only valid after Collect() has been called with every direction added.
+    """
+    return self.__next_deadline
+
+  def AddDirection(self, time_range, status, zone = 0):
+    """
+    Args:
+      time_range: TimeRange, monotonic times in which an object passed the lasers
+      status: TagStatus, direction of the object
+      zone: int, zone of the lasers that were broken
+    """
+    index = bisect.bisect_right(self.__starts, time_range.StartTime)
+    self.__starts.insert(index, time_range.StartTime)
+    self.__directions.insert(index, [time_range, status, zone])
+    self.__max_span = max(self.__max_span, time_range.EndTime - time_range.StartTime)
+
+    # Only the tags read within the new direction can have their match changed by it
+    first = bisect.bisect_left(self.__tags, [time_range.StartTime])
+    last = bisect.bisect_right(self.__tags, [time_range.EndTime, float('inf')])
+
+    for entry in self.__tags[first:last]:
+      tag_zone = self.__zones.get(entry[2].Antenna)
+      if tag_zone is None or tag_zone == zone: self.__rematch(entry)
+
+  def AddTag(self, tag):
+    entry = [tag.ReadTime, next(self.__sequence), tag, None, None, None]
+    bisect.insort(self.__tags, entry)
+    self.__waiting[entry[1]] = entry
+    self.__rematch(entry)
+
+  def Collect(self, now, pending = ()):
+    """
+    Assigns directions to every tag whose match can no longer change. Must be called after every direction
+    logged before now has been added.
+
+    Without padding, a tag is held for the hold time. With padding, directions still to come start at or after
+    the earliest of now and the pending passes, so their midpoints are at least that far from a read. A matched tag
+    is collected once that is no nearer than its match, and an unmatched tag once it is past the padding.
+
+    Args:
+      now: float, current time.monotonic()
+      pending: list<float>, monotonic times of the first break of passes still waiting on their second break
+
+    Returns: list<Tag>, tags in the order they were read. Tags without a direction are left Unknown.
+    """
+    earliest_start = min([now] + list(pending))
+    ready = {}
+
+    # Tags held for the hold time are at the front, since they are ordered by read time
+    for entry in self.__tags:
+      if entry[0] + self.__hold_time > now: break
+      ready[entry[1]] = entry
+
+    if self.__padding is not None:
+      while self.__deadlines and self.__deadlines[0][0] <= earliest_start:
+        deadline, sequence = heapq.heappop(self.__deadlines)
+        if self.__is_current(deadline, sequence): ready[sequence] = self.__waiting[sequence]
+
+    tags = []
+    for entry in sorted(ready.values()):
+      del self.__tags[bisect.bisect_left(self.__tags, entry)]
+      del self.__waiting[entry[1]]
+      entry[2].Status = entry[3]
+      tags.append(entry[2])
+
+    # Deadlines of tags that were collected or rematched are dropped once they reach the top
+    while self.__deadlines and not self.__is_current(*self.__deadlines[0]):
+      heapq.heappop(self.__deadlines)
+    self.__next_deadline = self.__deadlines[0][0] if self.__deadlines else None
+
+    self.__prune(now)
+    return tags
+
+  def __rematch(self, entry):
+    """
+    Matches a waiting tag against the directions known so far and queues its new deadline if it changed.
+    """
+    read_time, sequence, tag = entry[:3]
+    status, distance = self.__match(read_time, self.__zones.get(tag.Antenna))
+    deadline = self.__deadline(read_time, status, distance)
+    changed = deadline != entry[5]
+    entry[3:] = [status, distance, deadline]
+    if not changed: return
+
+    heapq.heappush(self.__deadlines, [deadline, sequence])
+    if self.__next_deadline is None or deadline < self.__next_deadline: self.__next_deadline = deadline
+
+  def __is_current(self, deadline, sequence):
+    """
+    Returns: bool, whether the deadline is the latest one of a tag that is still waiting
+    """
+    entry = self.__waiting.get(sequence)
+    return entry is not None and entry[5] == deadline
+
+  def __deadline(self, read_time, status, distance):
+    """
+    Returns: float, time after which no direction still to come could change the match, if no pass is under way
+    """
+    if self.__padding is None: return read_time + self.__hold_time
+    settle_time = read_time + (self.__padding if status == TagStatus.Unknown else distance)
+    return min(settle_time, read_time + self.__hold_time)
+
+  def __match(self, read_time, zone = None):
+    """
+    Finds the direction containing read_time within the zone, or any zone if it is None. If several overlap,
+    the one whose midpoint is nearest wins, with ties going to the earliest direction.
+
+    Returns: [TagStatus, float], the direction and the distance from its midpoint to the read, or
+      [TagStatus.Unknown, None] if no direction contains the read
+    """
+    best_status = TagStatus.Unknown
+    best_distance = None
+
+    # Only directions starting within the longest span before the read can contain it
+    first = bisect.bisect_left(self.__starts, read_time - self.__max_span)
+    last = bisect.bisect_right(self.__starts, read_time)
+
+    for time_range, status, direction_zone in self.__directions[first:last]:
+      if (zone is None or zone == direction_zone) and time_range.Contains(read_time):
+        distance = abs((time_range.StartTime + time_range.EndTime) / 2 - read_time)
+        if best_distance is None or distance < best_distance:
+          best_status, best_distance = status, distance
+
+    return [best_status, best_distance]
+
+  def __prune(self, now):
+    """
+    Drops directions that ended long enough ago that no new tag could match them.
+    """
+    cutoff = now - self.__hold_time * 2
+    expired = bisect.bisect_left(self.__starts, cutoff - self.__max_span)
+
+    while expired < len(self.__starts) and self.__directions[expired][0].EndTime < cutoff:
+      expired += 1
+
+    del self.__starts[:expired]
+    del self.__directions[:expired]
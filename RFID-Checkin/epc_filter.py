@@ -0,0 +1,225 @@
+'''
+RFID Logging Software
+
+Description (epc_filter.py):
+Bloom filter of the EPCs the handler knows about. The handler pushes it to the nodes, which drop reads of any
+other tag (retail tags, library books, ...) before they are ever queued or published. A Bloom filter never turns
+away one of our tags, but lets through about false_positive_rate of the others, which the handler still ignores.
+
+Format of a filter sent to the nodes: bit count (I), hash count (B), bits
+Format of EPCs added to a filter: EPC length (B), raw EPC, repeated for each EPC
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+from multiprocessing import Lock, RawArray, RawValue
+from ctypes import c_uint8, c_uint32, c_uint64, memmove
+import hashlib, math, struct
+
+_HEADER = struct.Struct('<IB')
+_EPC_LENGTH = struct.Struct('<B')
+
+def _raw_epc(epc):
+  """
+  Returns: bytes, the raw EPC of a hex EPC given as str or as bytes like the Mercury API reports them
+  """
+  return bytes.fromhex(str(epc, 'utf-8') if isinstance(epc, bytes) else epc)
+
+def _bit_indexes(raw_epc, bit_count, hash_count):
+  # Double hashing, deriving every index from the two halves of a single digest
+  digest = hashlib.blake2b(raw_epc, digest_size=16).digest()
+  first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+  return [(first + x * second) % bit_count for x in range(hash_count)]
+
+def _set_bits(bits, raw_epc, bit_count, hash_count):
+  for index in _bit_indexes(raw_epc, bit_count, hash_count):
+    bits[index >> 3] |= 1 << (index & 7)
+
+def _has_bits(bits, raw_epc, bit_count, hash_count):
+  return all(bits[index >> 3] & (1 << (index & 7)) for index in _bit_indexes(raw_epc, bit_count, hash_count))
+
+def encode_epcs(epcs):
+  """
+  Args:
+    epcs: list<str>, hex EPCs to add to a filter. Invalid EPCs are skipped
+
+  Returns: bytes, the EPCs formatted to be sent with Command.ADD_TO_EPC_FILTER
+  """
+  encoded = []
+  for epc in epcs:
+    try: raw_epc = _raw_epc(epc)
+    except ValueError: continue
+    encoded.append(_EPC_LENGTH.pack(len(raw_epc)) + raw_epc)
+
+  return b''.join(encoded)
+
+def decode_epcs(data):
+  """
+  Returns: list<str>, the hex EPCs encoded by encode_epcs()
+
+  Raises: ValueError, if the data is malformed
+  """
+  epcs = []
+  offset = 0
+
+  while offset < len(data):
+    length = data[offset]
+    raw_epc = data[offset + 1:offset + 1 + length]
+    if len(raw_epc) != length: raise ValueError('EPC runs past the end of the data')
+
+    epcs.append(raw_epc.hex().upper())
+    offset += 1 + length
+
+  return epcs
+
+class EPCFilter:
+  def __init__(self, bit_count, hash_count, bits = None):
+    """
+    Args:
+      bit_count: int, size of the filter
+      hash_count: int, bits set for each EPC
+      bits: bytes, optional bits of an existing filter
+    """
+    self.__bit_count = bit_count
+    self.__hash_count = hash_count
+    self.__bits = bytearray(bits) if bits is not None else bytearray((bit_count + 7) // 8)
+
+    if len(self.__bits) != (bit_count + 7) // 8:
+      raise ValueError('bits do not match the bit count')
+
+  @staticmethod
+  def FromEPCs(epcs, false_positive_rate = 0.01, spare = 0.5):
+    """
+    Args:
+      epcs: list<str>, hex EPCs to add. Invalid EPCs are skipped
+      false_positive_rate: float, fraction of other EPCs let through
+      spare: float, extra room for EPCs added later, as a fraction of the amount of EPCs
+
+    Returns: EPCFilter, filter sized for the EPCs
+    """
+    capacity = max(16, int(len(epcs) * (1 + spare)))
+    bit_count = max(64, int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+    hash_count = max(1, int(round(bit_count / capacity * math.log(2))))
+
+    epc_filter = EPCFilter(bit_count, hash_count)
+    for epc in epcs:
+      try: epc_filter.Add(epc)
+      except ValueError: pass
+
+    return epc_filter
+
+  @staticmethod
+  def FromBytes(data):
+    """
+    Raises: ValueError, if the data is malformed
+    """
+    try: bit_count, hash_count = _HEADER.unpack_from(data)
+    except struct.error as error: raise ValueError(f'Malformed filter: {error}')
+    return EPCFilter(bit_count, hash_count, data[_HEADER.size:])
+
+  @property
+  def BitCount(self):
+    return self.__bit_count
+
+  @property
+  def HashCount(self):
+    return self.__hash_count
+
+  @property
+  def Capacity(self):
+    """
+    Amount of EPCs the filter was sized for. Past this, more and more foreign EPCs are let through.
+    """
+    return int(self.__bit_count / self.__hash_count * math.log(2))
+
+  @property
+  def Bits(self):
+    return bytes(self.__bits)
+
+  def ToBytes(self):
+    return _HEADER.pack(self.__bit_count, self.__hash_count) + self.__bits
+
+  def Add(self, epc):
+    """
+    Args:
+      epc: str or bytes, hex EPC
+
+    Raises: ValueError, if the EPC isn't hex
+    """
+    _set_bits(self.__bits, _raw_epc(epc), self.__bit_count, self.__hash_count)
+
+  def __contains__(self, epc):
+    try: return _has_bits(self.__bits, _raw_epc(epc), self.__bit_count, self.__hash_count)
+    except ValueError: return False
+
+class SharedEPCFilter:
+  def __init__(self, max_size = 1 << 16):
+    """
+    EPCFilter in shared memory, so it can be swapped or added to while the reader processes check reads against
+    it. Must be created before the processes that share it are started. Lets everything through until a filter
+    is loaded.
+
+    Args:
+      max_size: int, max bytes of bits held. Larger filters are turned away, leaving everything let through
+    """
+    self.__bits = RawArray(c_uint8, max_size)
+    self.__bit_count = RawValue(c_uint32, 0) # 0 when no filter is loaded
+    self.__hash_count = RawValue(c_uint8, 0)
+    self.__rejected = RawValue(c_uint64, 0)
+    self.__lock = Lock()
+
+  @property
+  def Enabled(self):
+    return self.__bit_count.value != 0
+
+  @property
+  def Rejected(self):
+    """
+    Total amount of EPCs turned away.
+    """
+    return self.__rejected.value
+
+  def Load(self, epc_filter):
+    """
+    Args:
+      epc_filter: EPCFilter, filter to use, or None to let everything through
+
+    Returns: bool, whether the filter was loaded. Filters too large to be held are not.
+    """
+    bits = epc_filter.Bits if epc_filter is not None else b''
+
+    with self.__lock:
+      if epc_filter is None or len(bits) > len(self.__bits):
+        self.__bit_count.value = 0
+        return epc_filter is None
+
+      memmove(self.__bits, bits, len(bits))
+      self.__bit_count.value = epc_filter.BitCount
+      self.__hash_count.value = epc_filter.HashCount
+      return True
+
+  def Add(self, epcs):
+    """
+    Args:
+      epcs: list<str>, hex EPCs to add to the loaded filter. Invalid EPCs are skipped
+    """
+    with self.__lock:
+      if not self.__bit_count.value: return
+
+      for epc in epcs:
+        try: _set_bits(self.__bits, _raw_epc(epc), self.__bit_count.value, self.__hash_count.value)
+        except ValueError: pass
+
+  def __contains__(self, epc):
+    try: raw_epc = _raw_epc(epc)
+    except ValueError: raw_epc = None
+
+    with self.__lock:
+      if not self.__bit_count.value: return True
+
+      if raw_epc is not None and _has_bits(self.__bits, raw_epc, self.__bit_count.value, self.__hash_count.value): return True
+      self.__rejected.value += 1
+      return False
@@ -21,10 +21,20 @@ from rfidtag import RFIDTag
 from command_reader import CommandReader
 from pathlib import Path
 from node_enums import Command
-import re, asyncio, threading, queue, datetime, pickle, time
+from epc_filter import EPCFilter
+from tag_registry import TagRegistry
+from settings_journal import SettingsJournal
+from log_file import LogFile
+from log_store import LogStore
+import re, asyncio, threading, queue, datetime, time
 
 class Handler:
-  def __init__(self):
+  def __init__(self, interactive = True):
+    """
+    Args:
+      interactive: bool, whether to start the CLI and connect to Google Sheets. Without it, the handler only
+        stores logs locally, which is used by benchmark_pipeline.py.
+    """
     # Setup variables for Google Sheets API
     self.__SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
     self.__NODES_RANGE = "readers!a2:c"
@@ -33,7 +43,9 @@ class Handler:
 
     # Setup files for server
     self.__SETTINGS_FILE = "data/settings.rsf"
+    self.__JOURNAL_FILE = "data/settings.journal"
     self.__LOG_FILE = "data/logs.csv"
+    self.__LOG_DATABASE = "data/logs.db"
     self.__SERVICE_ACC_FILE = "data/service_account.json"
 
     self.__DATETIME_FORMAT = "%m/%d/%Y %H:%M:%S"
@@ -41,22 +53,36 @@ class Handler:
     self.__spreadsheetID = ""
 
     self.__nodes = []
-    self.__rfidtags = []
+    self.__rfidtags = TagRegistry() # Known tags by EPC, see tag_registry.py
+    self.__epc_filter = None # Pushed to the nodes so they only send the tags in __rfidtags
     self.__log_buffer = [] # Does not actually contain every log. Only new logs that aren't added to the spreadsheet
 
-    print("Frontend for RFID Logging Software.\r\n\r\nHandles data from nodes and stores data locally, while occasionally pushing the data to a Google spreadsheet.\r\nThis softare is intended as a direct complement to the node(s).\r\n\r\nDeveloped at American River College\r\nWritten by: Dominique Stepek")
+    # Tag changes are appended to the journal, and the full settings are only saved once it gets long. Both are
+    # written from a background thread, so logging a tag never waits on the disk.
+    self.__journal = SettingsJournal(self.__SETTINGS_FILE, self.__JOURNAL_FILE, on_error=self.__journal_failed)
+    self.__settings_lock = threading.RLock()
+
+    # Logs are written to the log file and the indexed log store in batches from a background thread, see
+    # log_file.py and log_store.py
+    self.__log_store = LogStore(self.__LOG_DATABASE)
+    self.__log_file = LogFile(self.__LOG_FILE, store=self.__log_store, on_error=self.__log_store_failed)
+
+    self.__interactive = interactive
+    if interactive: print("Frontend for RFID Logging Software.\r\n\r\nHandles data from nodes and stores data locally, while occasionally pushing the data to a Google spreadsheet.\r\nThis softare is intended as a direct complement to the node(s).\r\n\r\nDeveloped at American River College\r\nWritten by: Dominique Stepek")
     self.__command_reader = CommandReader(self)
 
     self.__google_service = None
-    self.__google_login()
+    if interactive: self.__google_login()
 
     self.LoadSettingsFile()
 
     self.__sheets_update_interval_queue = queue.Queue()
     self.__sheets_update_interval_queue.put(6) # Amount of updates per day
-    self.__automatic_sheets_update_running = True
-    threading.Thread(target=self.__start_automatic_sheet_update_service).start()
-    self.__command_reader.Start()
+    self.__automatic_sheets_update_running = interactive
+
+    if interactive:
+      threading.Thread(target=self.__start_automatic_sheet_update_service).start()
+      self.__command_reader.Start()
     
   @property
   def SpreadSheetID(self):
@@ -68,6 +94,9 @@ class Handler:
 
   @property
   def RFIDTags(self):
+    """
+    TagRegistry of the known tags. Changes must go through its methods to keep it indexed.
+    """
     return self.__rfidtags
 
   def ChangeUpdateInterval(self, interval):
@@ -75,7 +104,7 @@ class Handler:
 
   def AddLogs(self, log_object, write_mode = 'a'):
     '''
-    Appends to the log file a new instance.
+    Queues a new instance to be written to the log file. Returns before it is written, see FlushLogs().
 
     Args:
       l: Log or list<Log>, the log object or list of log objects to be appended.
@@ -83,45 +112,49 @@ class Handler:
         a: Append mode, adds log values to the end of the file.
         w: Write mode, truncates log values in file and writes logs.
     '''
-
-    # Converts log(s) into line(s) string 
-    def str_builder():
-      txt = ""
-      if isinstance(log_object, Log):
-        txt = '\n' + str(log_object)
-      elif isinstance(log_object, list):
-        for log in log_object:
-          if isinstance(log, Log):
-            print('add')
-            txt += '\n' + str(log)
-      return txt
+    logs = [log_object] if isinstance(log_object, Log) else [x for x in log_object or [] if isinstance(x, Log)]
 
     # 'a' for append and 'w' for overwrite
     if write_mode == 'a':
-      with open(self.__LOG_FILE, mode='a') as hf:
-        hf.write(str_builder())
+      self.__log_file.Append(logs)
     elif write_mode == 'w':
-      with open(self.__LOG_FILE, mode='w') as hf:
-        hf.write(f"Timestamp,Status,EPC,Owner,Description,Location,Extra{str_builder()}")
-        
-    self.__print_out(f"saved logs to {self.__LOG_FILE}")
+      self.__log_file.Rewrite(logs)
+      self.__print_out(f"saved logs to {self.__LOG_FILE}")
+
+  def FlushLogs(self, timeout = 5):
+    '''
+    Waits until every log added so far is written to the log file.
+
+    Returns: bool, whether or not the logs were written before the timeout
+    '''
+    return self.__log_file.Flush(timeout)
 
   def GetLogsFile(self):
     '''
-    Retreives a list of logs from the logs file.
+    Retreives the logs from the logs file, one at a time as they are iterated.
 
     Returns:
-      list<Log>, all logs from the file
+      generator<Log>, all logs from the file, oldest first
+    '''
+    return self.__log_file.Read()
+
+  def QueryLogs(self, **filters):
     '''
+    Finds logs by EPC, location, time, and status through the log store's indexes. See LogStore.Query() for the filters.
 
-    # Pulls all lines from log file
-    lf_lines = ""
-    with open(self.__LOG_FILE, mode='r') as lf:
-      lf_lines = lf.readlines()
+    Returns:
+      list<Log>, the logs found, ordered by time
+    '''
+    return self.__log_store.Query(**filters)
 
-    # Creates new log objects, skipping the first line since it's dedicated for the headers.
-    logs = [Log(x) for x in lf_lines[1:]]
-    return logs
+  def GetLastLogs(self, count):
+    '''
+    Retreives the most recent logs without going through the rest of the file.
+
+    Returns:
+      list<Log>, the last count logs from the file, oldest first
+    '''
+    return self.__log_file.Tail(count)
 
   def LoadSettingsFile(self):
     """
@@ -130,42 +163,46 @@ class Handler:
     """
 
     # Attempts to open the file for updating and creates it if necessary.
-    Path(self.__SETTINGS_FILE).touch()
     Path(self.__LOG_FILE).touch()
-    rsf_data = None
-    log_data = None
 
-    # Attempts to read the binary data from the settings file
-    with open(self.__SETTINGS_FILE, 'r+b') as sf:
-      rsf_data = sf.read()
+    # Reads the last snapshot of the settings and the tag changes made since, see settings_journal.py
+    settings_obj, changes = self.__journal.Load()
 
-    # Attempts to read the TEXT data from the log file
-    with open(self.__LOG_FILE, 'r') as lf:
-      log_data = lf.read()
+    # Only whether the log file is empty is needed, which doesn't take reading it
+    logs_empty = Path(self.__LOG_FILE).stat().st_size == 0
 
-    # If settings file is empty, try to load from the Google Spreadsheet. Otherwise, use settings data
-    if rsf_data == b"":
+    # If there are no settings, try to load from the Google Spreadsheet. Otherwise, use settings data
+    if settings_obj is None:
       self.ChangeSpreadsheet()
     else:
-      # Deserializes file and pulls spreadsheet ID, rfid tags, and nodes.
-      settings_obj = pickle.loads(rsf_data)
+      # Pulls spreadsheet ID, rfid tags, and nodes, and brings the tags up to date with the journal.
       self.__spreadsheetID = settings_obj['spreadsheet_id']
-      self.__rfidtags = settings_obj['rfid_tags']
+      self.__rfidtags.Replace(settings_obj['rfid_tags'])
+      for epc, status, location in changes:
+        self.__rfidtags.Update(epc, RFIDTag.Status[status], location)
       self.__open_nodes_from_settings(settings_obj['nodes'])
+      self.__push_epc_filter()
       self.__print_out(f'loaded settings from {self.__SETTINGS_FILE}')
 
-    if log_data == "":
+    if logs_empty:
       self.AddLogs(None, write_mode='w')
+    elif not self.__log_store.InSync:
+      # Filled from the log file when the store is new or has missed logs. It's done on the log writer's thread, in
+      # order with any logs already queued, so none are copied twice or left out.
+      self.__log_file.Rebuild()
+      self.__print_out(f"rebuilding {self.__LOG_DATABASE} from {self.__LOG_FILE}")
 
   def SaveSettingsFile(self):
     node_properties = [{'id' : node.ID, 'location' : node.Location} for node in self.Nodes]
     
-    # Serializes settings and saves it to the settings file.
-    pickle.dump({
-      'spreadsheet_id' : self.__spreadsheetID,
-      'rfid_tags' : self.__rfidtags,
-      'nodes' : node_properties
-    }, open(self.__SETTINGS_FILE, mode='wb'))      
+    # Queues the settings to replace the settings file, emptying the journal. No tag may change while they are
+    # listed and queued, so every change is either in the snapshot or appended after it.
+    with self.__settings_lock:
+      self.__journal.Snapshot({
+        'spreadsheet_id' : self.__spreadsheetID,
+        'rfid_tags' : list(self.__rfidtags),
+        'nodes' : node_properties
+      })
 
     self.__print_out(f'saved settings to {self.__SETTINGS_FILE}')
 
@@ -178,7 +215,7 @@ class Handler:
       try:
         # Get status from spreadsheet
         rfid_tag_values = self.__google_service.spreadsheets().values().get(spreadsheetId=self.__spreadsheetID, range=self.__RFIDTAGS_RANGE).execute().get('values', [])
-        self.__rfidtags = [RFIDTag(*val) for val in rfid_tag_values]
+        self.__rfidtags.Replace([RFIDTag(*val) for val in rfid_tag_values])
 
         # Get logs from spreadsheet
         log_values = self.__google_service.spreadsheets().values().get(spreadsheetId=self.__spreadsheetID, range=self.__LOGS_RANGE).execute().get('values', [])
@@ -188,6 +225,7 @@ class Handler:
         node_values = self.__google_service.spreadsheets().values().get(spreadsheetId=self.__spreadsheetID, range=self.__NODES_RANGE).execute().get('values', [])
         nodes_settings = [{ "id" : str(val[0]), "location" : str(val[1]) } for val in node_values]
         self.__open_nodes_from_settings(nodes_settings)
+        self.__push_epc_filter()
 
         break
       except ConnectionResetError: # In case the Google service object got disconnected
@@ -218,6 +256,9 @@ class Handler:
     #   ....
     # ]
 
+    # Nothing to update when running without Google Sheets
+    if self.__google_service is None: return
+
     # Compresses node, rfid tag, and log lists into rows for Google Sheets API
     node_vals = [[n.ID, n.Location, n.Status.value] for n in self.__nodes]
     rfid_tag_vals = [[r.EPC, str(r.Status), r.Owner, r.Description, r.LastLocation, r.Extra] for r in self.__rfidtags]
@@ -305,6 +346,10 @@ class Handler:
     self.__shutdown_nodes()
     self.__stop_automatic_sheet_update_service()
     self.SaveSettingsFile()
+    self.__journal.Close()
+    self.FlushLogs()
+    self.__log_file.Stop()
+    self.__log_store.Close()
     self.UpdateSheets(log_mode='a')
 
   def __google_login(self):
@@ -326,7 +371,27 @@ class Handler:
     """
     self.__quick_shutdown_nodes()
     self.__nodes = [Node(node['id'], node['location'], self.__receive_node_log, self.__receive_node_read_once_tag,
-                    self.__receive_node_reader_reading, self.__receive_node_sensor_reading, self.__receive_node_error) for node in node_settings]
+                    self.__receive_node_reader_reading, self.__receive_node_sensor_reading, self.__receive_node_error,
+                    UnmatchedCallback=self.__receive_node_unmatched_tag) for node in node_settings]
+
+  def __push_epc_filter(self):
+    """
+    Builds a filter of every known EPC and sends it to the nodes.
+    """
+    self.__epc_filter = EPCFilter.FromEPCs(self.__rfidtags.EPCs)
+    for node in self.__nodes: node.SetEPCFilter(self.__epc_filter)
+
+  def __add_to_epc_filter(self, epc):
+    """
+    Sends a newly added EPC to the nodes. The filter is rebuilt instead once it has used up the room it was given
+    for new tags, so it doesn't let through more and more foreign tags.
+    """
+    if self.__epc_filter is None or len(self.__rfidtags) > self.__epc_filter.Capacity:
+      self.__push_epc_filter()
+      return
+
+    self.__epc_filter.Add(epc)
+    for node in self.__nodes: node.AddToEPCFilter([epc])
 
   def __shutdown_nodes(self):
     self.__print_out('shutting down nodes')
@@ -352,22 +417,32 @@ class Handler:
        }
     """
 
-    # Attempts to find the index of the scanned tag and breaks out of the function if it's -1
-    try:
-      index = self.__rfidtags.index(next((tag for tag in self.__rfidtags if tag.EPC == log['BODY']['EPC']), None))
-    except ValueError:
-      return
-
-    # Updates the the status and location of the tag to the status and 
-    self.__rfidtags[index].Status = RFIDTag.Status(log['BODY']['Status'].value)
-    self.__rfidtags[index].LastLocation = location
+    # Updates the status and location of the scanned tag, and breaks out of the function if it isn't known.
+    # Only the change is saved, and the full settings once the journal gets long (see settings_journal.py).
+    with self.__settings_lock:
+      rfidtag = self.__rfidtags.Update(log['BODY']['EPC'], RFIDTag.Status(log['BODY']['Status'].value), location)
+      if rfidtag is None:
+        return
+      compact = self.__journal.Append(rfidtag.EPC, rfidtag.Status.name, location)
 
     # Create a new log object from the rfid tag
-    new_log = Log(log['TIMESTAMP'], self.__rfidtags[index], location)
+    new_log = Log(log['TIMESTAMP'], rfidtag, location)
 
     self.__log_buffer.append(new_log)
     self.AddLogs(new_log)
-    self.SaveSettingsFile()
+    if compact: self.SaveSettingsFile()
+
+  def __receive_node_unmatched_tag(self, message, location):
+    """Reports a known tag that was read near a node while nothing passed its lasers, such as one left by the door.
+    Its status and the logs are left alone, since it didn't check in or out.
+
+    Args:
+      message: object, formatted as in __receive_node_log(), where the tag's status is Unknown
+    """
+    rfidtag = self.__rfidtags.Get(message['BODY']['EPC'])
+    if rfidtag is None: return
+
+    self.__print_out(f"{message['ID']}	{rfidtag.EPC} ({rfidtag.Owner}) was read at {location} without passing the lasers")
 
   def __receive_node_read_once_tag(self, message, location):
     """Attempts to add new RFIDTag to the database.
@@ -385,7 +460,7 @@ class Handler:
     """
 
     # Checks to see if the tag already exists and returns if it does
-    if message['BODY']['EPC'] in [x.EPC for x in self.__rfidtags]:
+    if message['BODY']['EPC'] in self.__rfidtags:
       self.__print_out(f"Read an existing tag {message['BODY']['EPC']}")
       return
 
@@ -403,7 +478,8 @@ class Handler:
       if len(user_response.split(sep=',')) == 3: # Input validation
         formatted_response = re.sub(r'(?<=,)\s', '', user_response) # Removes unecessary whitespace after ','s
         owner, description, extra = user_response.split(sep=',')
-        self.__rfidtags.append(RFIDTag(message['BODY']['EPC'], message['BODY']['Status'], owner, description, location, extra))
+        self.__rfidtags.Add(RFIDTag(message['BODY']['EPC'], message['BODY']['Status'], owner, description, location, extra))
+        self.__add_to_epc_filter(message['BODY']['EPC'])
         self.SaveSettingsFile()
         break
       else:
@@ -460,6 +536,12 @@ class Handler:
   def __receive_node_status(self, status):
     self.__print_out(f"node is now {status.value}")
 
+  def __journal_failed(self, error):
+    self.__print_out(f"failed to save settings to {self.__SETTINGS_FILE}: {error}")
+
+  def __log_store_failed(self, error):
+    self.__print_out(f"failed to write logs to {self.__LOG_DATABASE}, it will be rebuilt from {self.__LOG_FILE} on the next start: {error}")
+
   def __print_out(self, message):
     print(f"{datetime.datetime.now().strftime(self.__DATETIME_FORMAT)}\t{message}")
 
@@ -496,4 +578,5 @@ class Handler:
     """
     self.__automatic_sheets_update_running = False
 
-handler = Handler()
\ No newline at end of file
+if __name__ == '__main__':
+  handler = Handler()
\ No newline at end of file
@@ -59,7 +59,7 @@ class Log:
         self.__init__(*re.sub(r'(?<=,)\s', '', args[0]).split(','))
         return
       elif len(args) == 3 and isinstance(args[1], rfidtag.RFIDTag):
-        self.__init__(args[0], args[1].EPC, args[1].Status.Value, args[1].Owner, args[1].Description, args[2], args[1].Extra)
+        self.__init__(args[0], args[1].EPC, args[1].Status.value, args[1].Owner, args[1].Description, args[2], args[1].Extra)
         return
       elif len(args) == len(Log.__DICT_VALUES):
         self.__init__(Timestamp=args[0], EPC=args[1], Status=args[2], Owner=args[3], Description=args[4], Location=args[5], Extra=args[6])
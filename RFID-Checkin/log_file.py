@@ -0,0 +1,205 @@
+'''
+RFID Logging Software
+
+Description (log_file.py):
+Writes the handler's logs to its CSV file from a background thread. Callers only queue logs, while the thread
+keeps the file open and writes everything that arrives within a short linger of the first log as one batch,
+syncing it to disk as often as the fsync interval asks for. Flush() waits until everything queued so far is on
+disk, e.g. before the handler closes.
+
+Reading never loads the whole history at once. Read() parses one log at a time as it is iterated, and Tail() reads
+blocks backwards from the end of the file until it has the logs asked for, so the cost depends on how many logs
+are shown rather than how many have been kept.
+
+Each batch is also added to the log store, if one is given, from the same thread (see log_store.py). The file
+stays the record the store is built from. A batch the store fails to take is reported and the store is marked to
+be rebuilt, which Rebuild() does in order with the logs queued around it.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import threading, queue, os, time
+from log import Log
+
+HEADER = "Timestamp,Status,EPC,Owner,Description,Location,Extra"
+
+class LogFile:
+  __MAX_BATCH = 1000
+  __BLOCK_SIZE = 1 << 16
+
+  def __init__(self, path, linger = 0.05, fsync_interval = 1, store = None, on_error = None):
+    """
+    Args:
+      path: str, path of the CSV file
+      linger: float, max seconds to wait for more logs to write along with the first one
+      fsync_interval: float, max seconds between syncs to disk. 0 syncs every batch, None leaves it to the OS
+      store: LogStore, optional, given every log written
+      on_error: function, optional, called with the exception whenever the store fails to take logs
+    """
+    self.__path = path
+    self.__store = store
+    self.__on_error = on_error
+    self.__linger = linger
+    self.__fsync_interval = fsync_interval
+
+    self.__queue = queue.Queue()
+    self.__file = None
+    self.__last_fsync = time.monotonic()
+
+    threading.Thread(target=self.__run, daemon=True).start()
+
+  def Append(self, logs):
+    """
+    Queues logs to be added to the end of the file. Never blocks.
+
+    Args:
+      logs: list<Log>, logs to add
+    """
+    if logs: self.__queue.put_nowait(['a', list(logs)])
+
+  def Rewrite(self, logs):
+    """
+    Queues replacing the file with the header and the logs, after every log queued before. Never blocks.
+
+    Args:
+      logs: list<Log>, logs to write
+    """
+    self.__queue.put_nowait(['w', list(logs)])
+
+  def Rebuild(self):
+    """
+    Queues filling the log store with every log in the file, after every log queued before. Never blocks.
+    """
+    self.__queue.put_nowait(['r', []])
+
+  def Flush(self, timeout = 5):
+    """
+    Waits until every log queued so far has been written and synced.
+
+    Returns: bool, whether or not the logs were written before the timeout
+    """
+    done = threading.Event()
+    self.__queue.put_nowait(done)
+    return done.wait(timeout)
+
+  def Stop(self):
+    """
+    Stops the thread once every log already queued has been written and synced.
+    """
+    self.__queue.put_nowait(None)
+
+  def Read(self):
+    """
+    Yields: Log, every log in the file from the oldest, including those queued before reading started
+    """
+    self.Flush()
+    yield from self.__read()
+
+  def Tail(self, count):
+    """
+    Args:
+      count: int, amount of logs to read
+
+    Returns: list<Log>, the most recent logs, oldest first, including those queued before reading started
+    """
+    if count <= 0: return []
+    self.Flush()
+
+    data = b''
+    with open(self.__path, 'rb') as lf:
+      position = lf.seek(0, os.SEEK_END)
+
+      # Takes one more line than asked for, since the first line read is either cut off or the header
+      while position > 0 and data.count(b'\n') <= count:
+        size = min(LogFile.__BLOCK_SIZE, position)
+        position -= size
+        lf.seek(position)
+        data = lf.read(size) + data
+
+    # Lines are only decoded once the first one is dropped, since a block can start inside a multi-byte character
+    lines = [x for x in data.split(b'\n')[1:] if x.strip()]
+    return [Log(str(x, 'utf-8').strip()) for x in lines[-count:]]
+
+  def __run(self):
+    running = True
+
+    while running:
+      batch = [self.__queue.get()]
+
+      # Logs arriving close together are written together. A flush or stop doesn't wait out the linger.
+      end_time = time.monotonic() + self.__linger
+      try:
+        while len(batch) < LogFile.__MAX_BATCH and isinstance(batch[-1], list):
+          batch.append(self.__queue.get(timeout=max(0, end_time - time.monotonic())))
+      except queue.Empty: pass
+
+      lines = []
+      logs = []
+      flushes = []
+
+      for item in batch:
+        if item is None:
+          running = False
+        elif isinstance(item, threading.Event):
+          flushes.append(item)
+        elif item[0] == 'r':
+          # Everything before is written first, so the store gets all of it
+          self.__write(lines)
+          lines = []
+          logs = []
+          self.__store_logs(self.__read(), True)
+        elif item[0] == 'w':
+          # Whatever was appended before the rewrite is dropped along with the old file
+          lines = []
+          logs = []
+          self.__open('w')
+          self.__write([HEADER] + ['\n' + str(log) for log in item[1]])
+          self.__store_logs(item[1], True)
+        else:
+          lines += ['\n' + str(log) for log in item[1]]
+          logs += item[1]
+
+      self.__write(lines)
+      self.__store_logs(logs)
+
+      if flushes or not running or (self.__fsync_interval is not None and time.monotonic() - self.__last_fsync >= self.__fsync_interval):
+        self.__fsync()
+      for done in flushes: done.set()
+
+    if self.__file is not None: self.__file.close()
+
+  def __read(self):
+    with open(self.__path, 'r', encoding='utf-8') as lf:
+      next(lf, None) # Header
+      for line in lf:
+        if line.strip(): yield Log(line.strip())
+
+  def __open(self, mode = 'a'):
+    if self.__file is not None: self.__file.close()
+    self.__file = open(self.__path, mode, encoding='utf-8')
+
+  def __write(self, lines):
+    if not lines: return
+    if self.__file is None: self.__open()
+
+    self.__file.write(''.join(lines))
+    self.__file.flush()
+
+  def __store_logs(self, logs, replace = False):
+    if self.__store is None or not (logs or replace): return
+
+    try:
+      if replace: self.__store.Replace(logs)
+      else: self.__store.Add(logs)
+    except Exception as error:
+      # The logs are still in the file, so the store can be filled again from it on the next start
+      try: self.__store.MarkForRebuild()
+      except OSError: pass
+      if self.__on_error is not None: self.__on_error(error)
+
+  def __fsync(self):
+    if self.__file is not None: os.fsync(self.__file.fileno())
+    self.__last_fsync = time.monotonic()
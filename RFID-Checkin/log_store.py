@@ -0,0 +1,168 @@
+'''
+RFID Logging Software
+
+Description (log_store.py):
+Keeps the handler's logs in an SQLite database next to the log file, indexed by time, EPC, and location, so
+questions like "where has this tag been this month" or "what left this room yesterday" are answered without going
+through every log. The log file's writer thread adds each batch of logs in a single transaction (see log_file.py),
+and the database runs in WAL mode so queries, which each thread runs on its own connection, don't wait on those
+writes.
+
+The log file is the record the store is built from. The store only counts as holding the same logs once it has
+been filled from the whole file with Replace(), which is recorded in the database. A write the store fails to take
+leaves a marker file next to the database, so the store is filled again from the log file on the next start.
+
+Contributors:
+Dom Stepek
+
+To read more about SQLite for Python, go to: https://docs.python.org/3/library/sqlite3.html
+
+Edited on: October 17, 2026
+'''
+
+import sqlite3, threading, datetime, itertools, os
+from log import Log
+
+_SCHEMA = [
+  """CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    epc TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    description TEXT,
+    location TEXT,
+    extra TEXT
+  )""",
+  "CREATE INDEX IF NOT EXISTS logs_timestamp ON logs (timestamp)",
+  "CREATE INDEX IF NOT EXISTS logs_epc ON logs (epc, timestamp)",
+  "CREATE INDEX IF NOT EXISTS logs_location ON logs (location, timestamp)"
+]
+_COLUMNS = "timestamp, epc, status, owner, description, location, extra"
+
+def _to_text(timestamp):
+  # Times are kept as text that sorts in time order, which also keeps the database readable with other tools
+  return timestamp.isoformat(sep=' ', timespec='seconds')
+
+def _to_row(log):
+  return [_to_text(log.Timestamp), log.EPC.upper(), str(log.Status), log.Owner, log.Description, log.Location, log.Extra]
+
+def _to_log(row):
+  timestamp, epc, status, owner, description, location, extra = row
+  return Log(Timestamp=datetime.datetime.fromisoformat(timestamp), EPC=epc, Status=status, Owner=owner,
+             Description=description, Location=location, Extra=extra)
+
+class LogStore:
+  __BATCH_SIZE = 10000
+
+  def __init__(self, path):
+    """
+    Opens the database, creating it if necessary.
+
+    Args:
+      path: str, path of the database file
+    """
+    self.__path = path
+    self.__rebuild_file = path + '.rebuild'
+    self.__connection = sqlite3.connect(path, check_same_thread=False) # Only used for writing
+    self.__lock = threading.Lock()
+    self.__readers = threading.local()
+
+    with self.__lock:
+      self.__connection.execute("PRAGMA journal_mode=WAL")
+      self.__connection.execute("PRAGMA synchronous=NORMAL") # Safe in WAL mode, only a power loss can undo the last commits
+      with self.__connection:
+        for statement in _SCHEMA: self.__connection.execute(statement)
+
+  @property
+  def InSync(self):
+    """
+    Whether the store holds every log in the log file, i.e. it was filled by Replace() and hasn't failed a write since.
+    """
+    return self.__reader().execute("PRAGMA user_version").fetchone()[0] == 1 and not os.path.exists(self.__rebuild_file)
+
+  def MarkForRebuild(self):
+    """
+    Records that the store has missed logs and has to be filled again from the log file. Kept outside of the
+    database, which may be what is failing.
+
+    Raises: OSError, if the marker can't be written either
+    """
+    with open(self.__rebuild_file, 'w'): pass
+
+  def Count(self):
+    """
+    Returns: int, amount of logs stored
+    """
+    return self.__reader().execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+  def Add(self, logs):
+    """
+    Stores logs in as few transactions as possible.
+
+    Args:
+      logs: iterable<Log>, logs to add, such as the generator of LogFile.Read()
+    """
+    logs = iter(logs)
+
+    for batch in iter(lambda: list(itertools.islice(logs, LogStore.__BATCH_SIZE)), []):
+      with self.__lock, self.__connection:
+        self.__connection.executemany(f"INSERT INTO logs ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", [_to_row(x) for x in batch])
+
+  def Replace(self, logs):
+    """
+    Removes every log and stores the new ones instead, all in one transaction. The store counts as in sync with
+    the log file afterwards, so the logs must be every log in the file.
+
+    Args:
+      logs: iterable<Log>, the new logs, such as the generator of LogFile.Read()
+    """
+    with self.__lock:
+      with self.__connection:
+        self.__connection.execute("DELETE FROM logs")
+        self.__connection.executemany(f"INSERT INTO logs ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", (_to_row(x) for x in logs))
+        self.__connection.execute("PRAGMA user_version = 1")
+
+      try: os.remove(self.__rebuild_file)
+      except FileNotFoundError: pass
+
+  def Query(self, epc = None, location = None, since = None, until = None, status = None, limit = None, newest_first = False):
+    """
+    Finds logs using the indexes. Filters that are None are left out.
+
+    Args:
+      epc: str, EPC of the tag
+      location: str, location the tag was logged at
+      since: datetime, earliest time, included
+      until: datetime, latest time, excluded
+      status: Log.Status, direction the tag was moving
+      limit: int, max amount of logs returned
+      newest_first: bool, whether to return the most recent logs first. Combined with limit, gives the latest logs
+
+    Returns: list<Log>, the logs found, ordered by time
+    """
+    conditions = []
+    values = []
+
+    for condition, value in [["epc = ?", epc.upper() if epc else None], ["location = ?", location], ["timestamp >= ?", since and _to_text(since)],
+                             ["timestamp < ?", until and _to_text(until)], ["status = ?", status and str(status)]]:
+      if value is not None:
+        conditions.append(condition)
+        values.append(value)
+
+    sql = f"SELECT {_COLUMNS} FROM logs"
+    if conditions: sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY timestamp {'DESC' if newest_first else 'ASC'}, id {'DESC' if newest_first else 'ASC'}"
+    if limit is not None:
+      sql += " LIMIT ?"
+      values.append(limit)
+
+    return [_to_log(x) for x in self.__reader().execute(sql, values).fetchall()]
+
+  def Close(self):
+    with self.__lock: self.__connection.close()
+
+  def __reader(self):
+    connection = getattr(self.__readers, 'connection', None)
+    if connection is None: connection = self.__readers.connection = sqlite3.connect(self.__path)
+    return connection
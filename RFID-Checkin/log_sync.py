@@ -0,0 +1,144 @@
+'''
+RFID Logging Software
+
+Description (log_sync.py):
+Ships a node's system logs to the handler a piece at a time. The handler asks for the bytes of the node's log past
+the ones it already has, and the node sends them as zlib compressed chunks tagged with the offset they start at.
+The handler writes each chunk at its offset from a background thread, so its network thread never touches the
+disk and a chunk received twice is harmless.
+
+Format of a request sent with Command.GET_LOGS: offset (Q), log file name (utf-8)
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import os, queue, struct, threading, zlib
+
+CHUNK_SIZE = 1 << 16
+
+_REQUEST = struct.Struct('<Q')
+
+def encode_log_request(name, offset):
+  """
+  Args:
+    name: str, name of the latest log file the handler has, or an empty string if it has none
+    offset: int, bytes of the file the handler already has
+
+  Returns: bytes, the request formatted to be sent with Command.GET_LOGS
+  """
+  return _REQUEST.pack(offset) + name.encode('utf-8')
+
+def decode_log_request(data):
+  """
+  Returns: [str, int], the name and offset encoded by encode_log_request()
+
+  Raises: ValueError, if the data is malformed
+  """
+  try: offset, = _REQUEST.unpack_from(data)
+  except struct.error as error: raise ValueError(f'Malformed log request: {error}')
+  return [str(data[_REQUEST.size:], 'utf-8'), offset]
+
+def read_chunks(path, offset = 0, chunk_size = CHUNK_SIZE):
+  """
+  Reads a log file from the offset up to its size when opened, so lines written meanwhile are left for the next
+  request. A file smaller than the offset has been replaced, and is read from the start.
+
+  Yields: [int, bytes, int], offset of the chunk, its compressed bytes, and the offset right after it
+
+  Raises: OSError, if the file can't be read
+  """
+  with open(path, 'rb') as lf:
+    size = os.fstat(lf.fileno()).st_size
+    if offset > size: offset = 0
+    lf.seek(offset)
+
+    while offset < size:
+      data = lf.read(min(chunk_size, size - offset))
+      if not data: break
+
+      yield [offset, zlib.compress(data), offset + len(data)]
+      offset += len(data)
+
+class LogWriter:
+  def __init__(self, folder):
+    """
+    Writes the log chunks received from a node from a background thread.
+
+    Args:
+      folder: str, folder holding the node's log files
+    """
+    self.__folder = folder
+    self.__queue = queue.Queue()
+    os.makedirs(folder, exist_ok=True)
+
+    threading.Thread(target=self.__run, daemon=True).start()
+
+  @property
+  def Latest(self):
+    """
+    Name of the most recently written log file, or an empty string if there are none.
+    """
+    paths = [os.path.join(self.__folder, x) for x in os.listdir(self.__folder)]
+    paths = [x for x in paths if os.path.isfile(x)]
+    return os.path.basename(max(paths, key=os.path.getmtime)) if paths else ''
+
+  def Offset(self, name):
+    """
+    Returns: int, bytes of the log file written so far
+    """
+    try: return os.path.getsize(self.__path(name))
+    except OSError: return 0
+
+  def Append(self, name, offset, chunk):
+    """
+    Queues a chunk to be written. Never blocks.
+
+    Args:
+      name: str, name of the log file
+      offset: int, where the chunk starts in the file
+      chunk: bytes, zlib compressed part of the file
+    """
+    self.__queue.put_nowait([name, offset, chunk])
+
+  def Flush(self, timeout = 5):
+    """
+    Returns: bool, whether every chunk queued so far was written before the timeout
+    """
+    done = threading.Event()
+    self.__queue.put_nowait(done)
+    return done.wait(timeout)
+
+  def Stop(self):
+    """
+    Stops the thread once every chunk already queued has been written.
+    """
+    self.__queue.put_nowait(None)
+
+  def __path(self, name):
+    # Names are given by the nodes, so they're kept from pointing outside of the folder
+    return os.path.join(self.__folder, os.path.basename(name))
+
+  def __run(self):
+    for item in iter(self.__queue.get, None):
+      if isinstance(item, threading.Event): item.set()
+      else: self.__write(*item)
+
+  def __write(self, name, offset, chunk):
+    path = self.__path(name)
+    if not os.path.basename(name): return
+
+    try: data = zlib.decompress(chunk)
+    except zlib.error: return
+
+    # A chunk past the end of the file would leave a gap. It's dropped, and sent again on the next request
+    # since the request starts from the end of the file.
+    if offset > self.Offset(name): return
+
+    try:
+      with open(path, 'r+b' if os.path.exists(path) else 'wb') as lf:
+        lf.seek(offset)
+        lf.write(data)
+    except OSError: pass
@@ -0,0 +1,128 @@
+'''
+RFID Logging Software
+
+Description (metrics.py):
+Cheap instrumentation for the node. Counters that are already kept by the ring buffers and publisher are read as
+they are, so the hot paths only pay for recording latencies into fixed histograms. MetricsReporter turns the
+totals into rates and publishes a snapshot of them at a set interval.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import bisect, threading, time
+
+CPU_TEMPERATURE_FILE = '/sys/class/thermal/thermal_zone0/temp'
+
+class Histogram:
+  # Bucket bounds in milliseconds, growing by a quarter each from 0.1 ms to about 2 minutes
+  __BOUNDS = [0.1 * 1.25 ** x for x in range(64)]
+
+  def __init__(self):
+    """
+    Histogram of durations, safe to record into from any thread. Percentiles are given as the upper bound of
+    their bucket, so they are at most a quarter too high.
+    """
+    self.__counts = [0] * (len(Histogram.__BOUNDS) + 1)
+    self.__count = 0
+    self.__max = 0
+    self.__lock = threading.Lock()
+
+  def Observe(self, seconds):
+    """
+    Args:
+      seconds: float, duration to record
+    """
+    ms = seconds * 1000
+    bucket = bisect.bisect_left(Histogram.__BOUNDS, ms)
+
+    with self.__lock:
+      self.__counts[bucket] += 1
+      self.__count += 1
+      if ms > self.__max: self.__max = ms
+
+  def Snapshot(self, reset = True):
+    """
+    Args:
+      reset: bool, whether to start over afterwards, so the next snapshot only covers what comes after this one
+
+    Returns: object {'Count' : int, 'P50' : float, 'P99' : float, 'Max' : float}, durations in milliseconds.
+      The percentiles and max are None if nothing was recorded.
+    """
+    with self.__lock:
+      counts, count, max_ms = self.__counts, self.__count, self.__max
+      if reset:
+        self.__counts = [0] * len(counts)
+        self.__count = 0
+        self.__max = 0
+
+    return {'Count' : count, 'P50' : self.__percentile(counts, count, max_ms, 0.5),
+            'P99' : self.__percentile(counts, count, max_ms, 0.99), 'Max' : max_ms if count else None}
+
+  def __percentile(self, counts, count, max_ms, fraction):
+    if not count: return None
+
+    total = 0
+    for bucket, bucket_count in enumerate(counts):
+      total += bucket_count
+      if total >= fraction * count:
+        return min(max_ms, Histogram.__BOUNDS[bucket]) if bucket < len(Histogram.__BOUNDS) else max_ms
+
+def cpu_temperature(path = CPU_TEMPERATURE_FILE):
+  """
+  Returns: float, temperature of the CPU in Celsius, or None if it can't be read (e.g. when not on a Raspberry Pi)
+  """
+  try:
+    with open(path) as tf: return int(tf.read().strip()) / 1000
+  except (OSError, ValueError): return None
+
+class MetricsReporter:
+  def __init__(self, collect, publish, interval = 10):
+    """
+    Publishes snapshots of the node's metrics from a background thread.
+
+    Args:
+      collect: function, returns an object of the current metrics. Values under 'Totals' are running totals,
+        which are reported as their change since the last snapshot. Everything else is reported as it is.
+      publish: function, called with each snapshot, formatted as the collected metrics plus 'Interval' (float,
+        seconds covered by the snapshot) and the changes of the totals under their own names
+      interval: float, seconds between snapshots
+    """
+    self.__collect = collect
+    self.__publish = publish
+    self.__interval = interval
+    self.__latest = None
+    self.__stopped = threading.Event()
+
+    threading.Thread(target=self.__run, daemon=True).start()
+
+  @property
+  def Latest(self):
+    """
+    Most recently published snapshot, or None.
+    """
+    return self.__latest
+
+  def Stop(self):
+    self.__stopped.set()
+
+  def __run(self):
+    last_time = time.monotonic()
+    last_totals = self.__collect().pop('Totals', {})
+
+    while not self.__stopped.wait(self.__interval):
+      curr_time = time.monotonic()
+      snapshot = self.__collect()
+      totals = snapshot.pop('Totals', {})
+
+      # Totals start over whenever reading restarts, in which case everything since then is new
+      for name, total in totals.items():
+        snapshot[name] = total - last_totals.get(name, 0) if total >= last_totals.get(name, 0) else total
+
+      snapshot['Interval'] = curr_time - last_time
+      last_time, last_totals = curr_time, totals
+
+      self.__latest = snapshot
+      self.__publish(snapshot)
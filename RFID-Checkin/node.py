@@ -12,9 +12,11 @@ To read more about MQTT for Python, go to: https://pypi.org/project/paho-mqtt/
 Edited on: May 4, 2019
 '''
 
-import enum, threading, datetime, pickle, os
+import enum, threading, datetime, os, time, codec
 from node_enums import *
 from paho.mqtt import client
+from epc_filter import encode_epcs
+from log_sync import LogWriter, encode_log_request
 
 class Node:
   __DICT_VALUES = ['ID', 'Location', 'ErrorCallback', 'LoggingCallback', 'ReadOnceCallback', 'SensorTestingCallback', 'ReaderTestingCallback']
@@ -32,6 +34,8 @@ class Node:
       SensorTestingCallback: function, called when receiving a sensor reading value
       ReaderTestingCallback: function, called when receiving a tag value with no direction
       ErrorCallback: function, called whenever the node reports an error
+      UnmatchedCallback: function, optional, called while logging with a tag that couldn't be matched to a laser pass
+      Client: paho.mqtt.client.Client, optional unconnected client to use instead of connecting to the broker over websockets
     """
     if all(val in kwargs for val in Node.__DICT_VALUES):
       self.__id = kwargs['ID']
@@ -41,21 +45,25 @@ class Node:
       self.__sensor_callback = kwargs['SensorTestingCallback']
       self.__reader_callback = kwargs['ReaderTestingCallback']
       self.__error_callback = kwargs['ErrorCallback']
+      self.__unmatched_callback = kwargs.get('UnmatchedCallback')
     elif len(args) == 7:
-      self.__init__(ID=args[0], Location=args[1], LoggingCallback=args[2], ReadOnceCallback=args[3], SensorTestingCallback=args[4], ReaderTestingCallback=args[5], ErrorCallback=args[6])
+      self.__init__(ID=args[0], Location=args[1], LoggingCallback=args[2], ReadOnceCallback=args[3], SensorTestingCallback=args[4], ReaderTestingCallback=args[5], ErrorCallback=args[6], **kwargs)
       return
     else:
       raise ValueError(f"Must specify values for {', '.join(Node.__DICT_VALUES)}")
       
     self.__status = Status.OFFLINE
+    self.__scan_mode = None
+    self.__metrics = None
+    self.__epc_filter = None
     self.__closing = False
     
     self.__node_replies = []
     self.__node_replies_lock = threading.Lock()
 
-    # Folder that holds the node's SYSTEM logs
+    # Folder that holds the node's SYSTEM logs. They're received in chunks and written in the background.
     self.__LOG_FOLDER = f'Node Logs/{self.ID}/'
-    os.makedirs(self.__LOG_FOLDER, exist_ok=True)
+    self.__log_writer = LogWriter(self.__LOG_FOLDER)
 
     # Connects to the MQTT server
 
@@ -63,7 +71,7 @@ class Node:
     # with tcp. This isn't currently possible as American River College's WiFi has a firewall preventing this
     # connection type. Additionally, a more secure way of sending data, if necessary, is to connect with a client ID
     # that is recognized by the nodes.
-    self.__client = client.Client(transport='websockets') 
+    self.__client = kwargs.get('Client') or client.Client(transport='websockets')
     self.__client.on_connect = self.__on_connect
     self.__client.on_message = self.__on_message
     self.__client.connect('broker.hivemq.com', port=8000)
@@ -75,11 +83,42 @@ class Node:
     return f"{self.__id},{self.__location},{str(self.__connected)}"
 
 #region Public
-  def SendMessage(self, message):
+  def SendMessage(self, message, argument = None):
+    """
+    Args:
+      message: Command, command to send
+      argument: bytes, optional data for the command, see node_enums.Command. GET_LOGS defaults to asking for
+        the logs past the ones already received.
+    """
+    if message == Command.GET_LOGS and argument is None:
+      name = self.__log_writer.Latest
+      argument = encode_log_request(name, self.__log_writer.Offset(name))
+
     if isinstance(message, Command):
-      threading.Thread(target=self.__send_message, args=(message,)).start()
+      threading.Thread(target=self.__send_message, args=(message,), kwargs={'argument' : argument}).start()
     else: raise ValueError("'message' parameter should be of type Command")
 
+  def SetEPCFilter(self, epc_filter):
+    """
+    Tells the node to only log the EPCs in the filter. The filter is sent again whenever the node comes back
+    online, so it should be kept up to date with AddToEPCFilter().
+
+    Args:
+      epc_filter: EPCFilter, EPCs to log, or None to log every EPC
+    """
+    self.__epc_filter = epc_filter
+    if self.__status != Status.OFFLINE: self.__send_epc_filter()
+
+  def AddToEPCFilter(self, epcs):
+    """
+    Sends EPCs that were added to the filter given to SetEPCFilter(). Only the new EPCs are sent.
+
+    Args:
+      epcs: list<str>, hex EPCs already added to the filter
+    """
+    if self.__epc_filter is not None and self.__status != Status.OFFLINE:
+      self.SendMessage(Command.ADD_TO_EPC_FILTER, encode_epcs(epcs))
+
   def CheckStatus(self):
     self.__send_message(Command.CHECK_STATUS)
     return self.__status
@@ -87,6 +126,7 @@ class Node:
   def QuickShutdown(self):
     self.__closing = True
     self.__client.disconnect()
+    self.__log_writer.Stop()
 
   def Shutdown(self):
     self.SendMessage(Command.STOP_LOGGING)
@@ -95,6 +135,7 @@ class Node:
 
     self.__closing = True
     self.__client.disconnect()
+    self.__log_writer.Stop()
 
   def Reset(self):
     self.Shutdown()
@@ -112,12 +153,27 @@ class Node:
   def Status(self):
     return self.__status
 
+  @property
+  def ScanMode(self):
+    """
+    ScanMode the node's reader is in, or None if it isn't reading.
+    """
+    return self.__scan_mode
+
+  @property
+  def Metrics(self):
+    """
+    Latest metrics published by the node (see codec._decode_metrics()) plus 'Timestamp', when they were sent,
+    or None if none have been received.
+    """
+    return self.__metrics
+
   @property
   def NodeConnected(self):
     return self.__send_message(Command.PING, timeout=Node.__CONNECTIVITY_TIMEOUT)
 #endregion
 
-  def __send_message(self, message, timeout = 15):
+  def __send_message(self, message, timeout = 15, argument = None):
     """
     Sends a message to the client and waits for a response. Note: this function is intended
     to be run on a seperate thread as it will block the thread which it is running on. This
@@ -127,6 +183,7 @@ class Node:
     Args:
       message: object, the message to send
       timeout: int, max time to wait for a response. Defaults to 15.
+      argument: bytes, optional data for the command
 
     Returns: bool, whether or not the message was sent and received within the timeout.
     """
@@ -135,29 +192,29 @@ class Node:
     if not isinstance(message, Command):
       raise ValueError("Invalid message argument. Must be of type Command")
     
-    # Send the pickled message (for ease of use) through MQTT.
-    self.__client.publish(f'reader/{self.ID}/{Topic.COMMANDS}', pickle.dumps(message), qos=1)
+    # Send the encoded message (see codec.py) through MQTT.
+    self.__client.publish(f'reader/{self.ID}/{Topic.COMMANDS}', codec.encode(Topic.COMMANDS, { 'Command' : message, 'Argument' : argument }, self.ID), qos=1)
 
     start_time = datetime.datetime.now()
     
-    # Hashes the response before waiting for a reply. This can reduce the amount of data
-    # transferred if the message is very large.
-    expected_response = repr(message)
+    # The node replies with the command it received.
+    expected_response = message
     received_response = False
     
     # Loops as long as long as there is no recevied response, the node is not closing, and the time hasn't surpassed
     # the timeout.
     while not (received_response or self.__closing) and (datetime.datetime.now() - start_time).total_seconds() <= timeout:
       # Uses lock to ensure thread safe variable accessing.
-      self.__node_replies_lock.acquire()
-      try:
-        # Tries to find the index of the hashed message inside the node replies. If it finds it, remove it
-        # from node replies and exit the loop by setting received response to true, otherwise continue.
-        ind = [[x['ID'], x['BODY']] for x in self.__node_replies].index([self.ID, expected_response])
-        self.__node_replies.pop(ind)
-        received_response = True
-      except: continue
-      self.__node_replies_lock.release()
+      with self.__node_replies_lock:
+        try:
+          # Tries to find the index of the message inside the node replies. If it finds it, remove it
+          # from node replies and exit the loop by setting received response to true, otherwise continue.
+          ind = [[x['ID'], x['BODY']] for x in self.__node_replies].index([self.ID, expected_response])
+          self.__node_replies.pop(ind)
+          received_response = True
+        except ValueError: pass
+
+      if not received_response: time.sleep(0.005)
     
     # The following code calculates the time from sending the message to receiving it.
 
@@ -175,29 +232,45 @@ class Node:
     client.subscribe(f'reader/{self.ID}/{Topic.TAG_READINGS}', 1) 
     client.subscribe(f'reader/{self.ID}/{Topic.SENSOR_READINGS}', 1)
     client.subscribe(f'reader/{self.ID}/{Topic.ERROR_CODES}', 1)
-    client.subscribe(f'reader/{self.ID}/{Topic.NODE_LOG}'), 1
+    client.subscribe(f'reader/{self.ID}/{Topic.NODE_LOG}', 1)
+    client.subscribe(f'reader/{self.ID}/{Topic.UNMATCHED_TAGS}', 1)
+    client.subscribe(f'reader/{self.ID}/{Topic.METRICS}', 1)
 
-    self.CheckStatus()
+    # Sent from another thread, since the reply can only be received once this callback has returned
+    self.SendMessage(Command.CHECK_STATUS)
 
   def __on_message(self, client, data, msg):
     """
     Receives messages from nodes over MQTT.
 
-    msg payloads are formatted as follows:\n
+    msg payloads are encoded with codec.py and decoded as follows:\n
     {
       'TIMESTAMP' : [date when message was sent],
       'ID' : [node ID],
       'BODY' : [data being sent]
     }
+
+    Tags are sent in batches, where 'BODY' is a list of tags. Each tag is passed to the callbacks in
+    its own message formatted as above, with 'TIMESTAMP' being when the tag was read.
     """
 
-    # Depickles the message and deduces the topic
-    message_obj = pickle.loads(msg.payload)
-    topic = Topic(msg.topic.split(sep='/')[2])
+    # The topic is taken from the one subscribed to rather than from the payload, which anyone on the broker can
+    # write. Messages that are malformed, or weren't encoded for that topic, are ignored, so every body has the
+    # shape codec.decode() lists for its topic.
+    try:
+      topic = Topic(msg.topic.rsplit('/', 1)[-1])
+      message_obj = codec.decode(msg.payload, topic)
+    except ValueError: return
 
     # Resets understood status of the node
     if topic == Topic.NODE_STATUS:
-      self.__status = message_obj['BODY']
+      previous_status = self.__status
+      self.__status = message_obj['BODY']['Status']
+      self.__scan_mode = message_obj['BODY']['ScanMode']
+
+      # A node that has just come online may have restarted, losing its filter
+      if previous_status == Status.OFFLINE and self.__status != Status.OFFLINE and self.__epc_filter is not None:
+        self.__send_epc_filter()
 
     # Message that the physical node received, is used to compare the actual message sent in __send_message()
     elif topic == Topic.NODE_RESPONSE:
@@ -207,14 +280,26 @@ class Node:
 
     # Any time a tag was read in logging, requesting tag, or test mode.
     elif topic == Topic.TAG_READINGS:
-      if self.__status == Status.LOGGING:
-        self.__logging_callback(message_obj, self.Location)
-      elif self.__status == Status.REQUESTING_TAG:
-        self.__read_once_callback(message_obj, self.Location)
-        self.__read_once_callback = None
-      elif self.__status == Status.RUNNING_READER_TEST:
-        self.__reader_callback(message_obj)
+      for tag_obj in self.__unpack_tags(message_obj):
+        if self.__status == Status.LOGGING:
+          self.__logging_callback(tag_obj, self.Location)
+        elif self.__status == Status.REQUESTING_TAG:
+          self.__read_once_callback(tag_obj, self.Location)
+          self.__read_once_callback = None
+          break
+        elif self.__status == Status.RUNNING_READER_TEST:
+          self.__reader_callback(tag_obj)
     
+    # Tags read while logging that couldn't be matched to a laser pass
+    elif topic == Topic.UNMATCHED_TAGS:
+      if self.__unmatched_callback is not None and self.__status == Status.LOGGING:
+        for tag_obj in self.__unpack_tags(message_obj):
+          self.__unmatched_callback(tag_obj, self.Location)
+
+    # Snapshot of the node's health, published at a set interval
+    elif topic == Topic.METRICS:
+      self.__metrics = dict(message_obj['BODY'], Timestamp=message_obj['TIMESTAMP'])
+
     # Any time a sensor reading was read (deprecated as of May 4th, 2019)
     elif topic == Topic.SENSOR_READINGS:
       self.__sensor_callback(message_obj)
@@ -223,7 +308,19 @@ class Node:
     elif topic == Topic.ERROR_CODES:
       self.__error_callback(message_obj)
 
-    # Writes to the node's sytem log file
+    # Part of the node's system log file, written at its offset in the background
     elif topic == Topic.NODE_LOG:
-      with open(f"{self.__LOG_FOLDER}{message_obj['BODY']['Name']}", 'w') as LF:
-        LF.write(message_obj['BODY']['Logs'])
+      body = message_obj['BODY']
+      self.__log_writer.Append(body['Name'], body['Offset'], body['Chunk'])
+
+  def __send_epc_filter(self):
+    self.SendMessage(Command.SET_EPC_FILTER, self.__epc_filter.ToBytes() if self.__epc_filter is not None else None)
+
+  def __unpack_tags(self, message_obj):
+    """
+    Splits a batch of tags into a message per tag.
+    """
+    tags = message_obj['BODY'] if isinstance(message_obj['BODY'], list) else [message_obj['BODY']]
+
+    for tag in tags:
+      yield {'TIMESTAMP' : tag.get('Timestamp', message_obj['TIMESTAMP']), 'ID' : message_obj['ID'], 'BODY' : tag}
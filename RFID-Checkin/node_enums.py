@@ -10,7 +10,7 @@ Dom Stepek
 Edited on: May 4, 2019
 '''
 
-import enum, hashlib
+import enum
 
 class Status(enum.Enum):
   ONLINE = "online"
@@ -21,6 +21,10 @@ class Status(enum.Enum):
   RUNNING_SENSOR_TEST = "running sensor test"
   RUNNING_READER_TEST = "running reader test"
 
+class ScanMode(enum.Enum):
+  ACTIVE = "active" # Reading continuously, since something has recently passed the lasers
+  IDLE = "idle" # Reading at a low duty cycle until the lasers are tripped
+
 class Command(enum.Enum):
   START_LOGGING = "start_logging"
   STOP_LOGGING = "stop_logging"
@@ -30,15 +34,14 @@ class Command(enum.Enum):
   BEGIN_READER_TEST = "begin_reader_test"
   STOP_READER_TEST = "stop_reader_test"
   CHECK_STATUS = "check_status"
-  GET_LOGS = "get_logs"
+  GET_LOGS = "get_logs" # Argument is a log request (see log_sync.py), or none to continue from the last log sent
   PING = "ping"
+  SET_EPC_FILTER = "set_epc_filter" # Argument is an EPCFilter (see epc_filter.py), or none to read every tag
+  ADD_TO_EPC_FILTER = "add_to_epc_filter" # Argument is a list of EPCs, see epc_filter.encode_epcs()
 
   def __str__(self):
     return self.value
 
-  def __repr__(self):
-    return hashlib.sha1(bytes(self.value, 'utf-8')).hexdigest()
-
 class Topic(enum.Enum):
   COMMANDS = "command"
   NODE_STATUS = "status"
@@ -47,6 +50,8 @@ class Topic(enum.Enum):
   SENSOR_READINGS = "sensor"
   ERROR_CODES = 'errors'
   NODE_LOG = 'logs'
+  UNMATCHED_TAGS = 'unmatched'
+  METRICS = 'metrics'
 
   def __str__(self):
     return self.value
@@ -60,7 +65,7 @@ class NodeBusy(Exception):
       self.Error = NodeError(error)
       self.Message = str(NodeError(error))
 
-def ReaderUnreachable(Exception):
+class ReaderUnreachable(Exception):
   pass
 
 class NodeError(enum.Enum):
@@ -71,14 +76,14 @@ class NodeError(enum.Enum):
   NODE_BUSY_TESTING_READER = 5
   NODE_BUSY_REQUESTING_TAG = 6
 
-  __ERR_MESSAGES = {
-    NODE_OFFLINE : "Node is unreachable",
-    INVALID_CALLBACK : "Callback function was invalid",
-    NODE_BUSY_LOGGING : "Node is currently logging and cannot perform another action until it has stopped",
-    NODE_BUSY_TESTING_SENSORS : "Node is currently running a sensor test and cannot perform another action until it has stopped",
-    NODE_BUSY_TESTING_READER : "Node is currently running a reader test and cannot perform another action until it has stopped",
-    NODE_BUSY_REQUESTING_TAG : "Node is currently requesting a tag from the reading manager and cannot perform another action until it has finished"
-  }
-
   def __str__(self):
-    return __ERR_MESSAGES(self.name)
\ No newline at end of file
+    return ERROR_MESSAGES[self]
+
+ERROR_MESSAGES = {
+  NodeError.NODE_OFFLINE : "Node is unreachable",
+  NodeError.INVALID_CALLBACK : "Callback function was invalid",
+  NodeError.NODE_BUSY_LOGGING : "Node is currently logging and cannot perform another action until it has stopped",
+  NodeError.NODE_BUSY_TESTING_SENSORS : "Node is currently running a sensor test and cannot perform another action until it has stopped",
+  NodeError.NODE_BUSY_TESTING_READER : "Node is currently running a reader test and cannot perform another action until it has stopped",
+  NodeError.NODE_BUSY_REQUESTING_TAG : "Node is currently requesting a tag from the reading manager and cannot perform another action until it has finished"
+}
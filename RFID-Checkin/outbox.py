@@ -0,0 +1,234 @@
+'''
+RFID Logging Software
+
+Description (outbox.py):
+Disk-backed store-and-forward queue for messages that must survive a broker or Wi-Fi outage. Messages are appended
+to segment files first and sent from there in the background whenever the MQTT connection is up.
+
+Layout of the outbox directory:
+  [segment number].seg - records formatted as length (I), crc32 (I), payload. Only the newest segment is appended to.
+  cursor - segment number (Q) and offset (Q) of the first record that hasn't been acknowledged by the broker
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import os, struct, threading, time, zlib
+
+class Outbox:
+  __RECORD = struct.Struct('<II')
+  __CURSOR = struct.Struct('<QQ')
+  __SEGMENT_FORMAT = '{:010d}.seg'
+
+  def __init__(self, directory, send, is_connected, segment_size = 1 << 20, max_size = 64 << 20, batch_size = 200, fsync_interval = 1):
+    """
+    Args:
+      directory: str, folder holding the segment files
+      send: function, called with (bytes, function) to publish a payload. The second argument must be called once
+        the broker has acknowledged the payload. Returns whether or not the payload could be queued.
+      is_connected: function, returns whether or not the MQTT client is connected
+      segment_size: int, bytes after which a new segment file is started
+      max_size: int, max bytes kept on disk. The oldest segments are deleted past this, losing their messages.
+      batch_size: int, max amount of records sent before waiting on their acknowledgements
+      fsync_interval: float, max seconds between syncs of the newest segment to disk
+    """
+    self.__directory = directory
+    self.__send = send
+    self.__is_connected = is_connected
+    self.__segment_size = segment_size
+    self.__max_segments = max(2, max_size // segment_size)
+    self.__batch_size = batch_size
+    self.__fsync_interval = fsync_interval
+
+    self.__condition = threading.Condition()
+    self.__dropped = 0
+    self.__last_fsync = time.monotonic()
+
+    os.makedirs(directory, exist_ok=True)
+    self.__recover()
+
+    self.__running = True
+    threading.Thread(target=self.__run, daemon=True).start()
+
+  @property
+  def Backlog(self):
+    """
+    Bytes waiting to be sent.
+    """
+    with self.__condition:
+      segments = self.__segments()
+      total = sum(os.path.getsize(self.__path(x)) for x in segments if x != self.__active_segment) + self.__active_file.tell()
+      return max(0, total - self.__cursor[1])
+
+  @property
+  def Dropped(self):
+    """
+    Amount of segments deleted before they could be sent.
+    """
+    return self.__dropped
+
+  def Append(self, payload):
+    with self.__condition:
+      self.__active_file.write(Outbox.__RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+      self.__active_file.flush()
+
+      if time.monotonic() - self.__last_fsync >= self.__fsync_interval:
+        os.fsync(self.__active_file.fileno())
+        self.__last_fsync = time.monotonic()
+
+      if self.__active_file.tell() >= self.__segment_size:
+        self.__roll()
+
+      self.__condition.notify()
+
+  def Wake(self):
+    """
+    Tells the outbox to try sending again. Should be called whenever the MQTT client connects.
+    """
+    with self.__condition: self.__condition.notify()
+
+  def Stop(self):
+    with self.__condition:
+      self.__running = False
+      os.fsync(self.__active_file.fileno())
+      self.__condition.notify()
+
+  def __path(self, segment):
+    return os.path.join(self.__directory, Outbox.__SEGMENT_FORMAT.format(segment))
+
+  def __segments(self):
+    return sorted(int(x.split('.')[0]) for x in os.listdir(self.__directory) if x.endswith('.seg'))
+
+  def __recover(self):
+    """
+    Loads the cursor and reopens the newest segment, cutting off a record that was only partly written.
+    """
+    segments = self.__segments()
+    self.__cursor = [segments[0] if segments else 0, 0]
+
+    try:
+      with open(os.path.join(self.__directory, 'cursor'), 'rb') as cf:
+        self.__cursor = list(Outbox.__CURSOR.unpack(cf.read()))
+    except (OSError, struct.error): pass
+
+    for segment in segments:
+      if segment < self.__cursor[0]: os.remove(self.__path(segment))
+
+    self.__active_segment = max(segments[-1] if segments else 0, self.__cursor[0])
+    path = self.__path(self.__active_segment)
+
+    valid_length = 0
+    if os.path.exists(path):
+      with open(path, 'rb') as sf:
+        valid_length = self.__read_records(sf, 0, None)[1]
+
+    self.__active_file = open(path, 'ab')
+    self.__active_file.truncate(valid_length)
+    self.__active_file.seek(valid_length)
+
+  def __roll(self):
+    os.fsync(self.__active_file.fileno())
+    self.__active_file.close()
+    self.__active_segment += 1
+    self.__active_file = open(self.__path(self.__active_segment), 'ab')
+
+    # Deletes the oldest segments, including any that are still waiting to be sent, once the outbox is full
+    segments = self.__segments()
+    for segment in segments[:max(0, len(segments) - self.__max_segments)]:
+      os.remove(self.__path(segment))
+      if segment >= self.__cursor[0]:
+        self.__dropped += 1
+        self.__cursor = [segment + 1, 0]
+
+  def __read_records(self, segment_file, offset, max_records):
+    """
+    Returns: [list<bytes>, int], the complete records from offset onwards and the offset after the last one
+    """
+    records = []
+    segment_file.seek(offset)
+
+    while max_records is None or len(records) < max_records:
+      header = segment_file.read(Outbox.__RECORD.size)
+      if len(header) < Outbox.__RECORD.size: break
+
+      length, crc = Outbox.__RECORD.unpack(header)
+      payload = segment_file.read(length)
+      if len(payload) < length or zlib.crc32(payload) != crc: break
+
+      records.append(payload)
+      offset += Outbox.__RECORD.size + length
+
+    return [records, offset]
+
+  def __next_batch(self):
+    """
+    Returns: [list<bytes>, list<int>], the next records to send and the cursor after them
+    """
+    segment, offset = self.__cursor
+    path = self.__path(segment)
+
+    if not os.path.exists(path): return [[], self.__cursor]
+
+    with open(path, 'rb') as sf:
+      records, end = self.__read_records(sf, offset, self.__batch_size)
+
+    # A finished segment has been read to the end, so move on to the next one
+    if not records and segment < self.__active_segment:
+      return [[], [segment + 1, 0]]
+
+    return [records, [segment, end]]
+
+  def __cursor_after(self, cursor, records):
+    return [cursor[0], cursor[1] + sum(Outbox.__RECORD.size + len(x) for x in records)]
+
+  def __commit(self, cursor):
+    with self.__condition:
+      # Segments may have been dropped while the records were being sent
+      if cursor[0] < self.__cursor[0]: return
+
+      finished = [x for x in self.__segments() if x < cursor[0]]
+      self.__cursor = cursor
+
+      temp_path = os.path.join(self.__directory, 'cursor.tmp')
+      with open(temp_path, 'wb') as cf:
+        cf.write(Outbox.__CURSOR.pack(*cursor))
+        cf.flush()
+        os.fsync(cf.fileno())
+      os.replace(temp_path, os.path.join(self.__directory, 'cursor'))
+
+      for segment in finished: os.remove(self.__path(segment))
+
+  def __run(self):
+    while True:
+      with self.__condition:
+        if not self.__running: break
+        if not self.__is_connected(): self.__condition.wait(1)
+        if not (self.__running and self.__is_connected()): continue
+
+        start = list(self.__cursor)
+        records, cursor = self.__next_batch()
+
+        if not records:
+          if cursor != start: self.__commit(cursor)
+          else: self.__condition.wait(1)
+          continue
+
+      # Sends the whole batch before waiting, so the publisher can keep several records in flight. Unacknowledged
+      # messages are resent by the MQTT client after reconnecting, so this waits however long the outage lasts.
+      acknowledged = threading.Semaphore(0)
+      queued = 0
+      for record in records:
+        if not self.__send(record, acknowledged.release): break
+        queued += 1
+
+      for _ in range(queued):
+        while not acknowledged.acquire(timeout=1):
+          if not self.__running: return
+
+      if queued == len(records):
+        self.__commit(cursor)
+      else:
+        self.__commit(self.__cursor_after(start, records[:queued]))
+        time.sleep(1) # The publisher is full, so give it time to catch up
@@ -0,0 +1,223 @@
+'''
+RFID Logging Software
+
+Description (publisher.py):
+Publishes messages through the node's long-lived MQTT client from a background thread so that callers only
+ever have to queue a message.
+
+Contributors:
+Dom Stepek
+
+To read more about Paho MQTT for Python, go to: https://pypi.org/project/paho-mqtt/
+
+Edited on: October 17, 2026
+'''
+
+import threading, queue, time
+from metrics import Histogram
+
+class Publisher:
+  __STOP_CHECK_INTERVAL = 0.1
+
+  def __init__(self, client, max_in_flight = 20, max_queued = 10000):
+    """
+    Takes over the on_publish callback of the client.
+
+    Args:
+      client: paho.mqtt.client.Client, connected (or connecting) client with a running network loop
+      max_in_flight: int, max amount of messages sent but not yet acknowledged by the broker
+      max_queued: int, max amount of messages waiting to be sent. Messages past this are dropped.
+    """
+    self.__client = client
+    self.__client.on_publish = self.__published
+
+    self.__queue = queue.Queue(max_queued)
+    self.__in_flight = threading.BoundedSemaphore(max_in_flight)
+    self.__max_in_flight = max_in_flight
+    self.__dropped = 0
+    self.__latency = Histogram() # From being queued until acknowledged by the broker
+
+    # Callbacks waiting for the broker to acknowledge a message, keyed by message ID. A message can be acknowledged
+    # before publish() returns its ID, so those IDs are held in __early_acks until the sending thread catches up.
+    self.__callbacks = {}
+    self.__early_acks = set()
+    self.__callbacks_lock = threading.Lock()
+
+    self.__stopped = threading.Event()
+    threading.Thread(target=self.__run, daemon=True).start()
+
+  @property
+  def Queued(self):
+    return self.__queue.qsize()
+
+  @property
+  def Dropped(self):
+    return self.__dropped
+
+  @property
+  def Latency(self):
+    """
+    Histogram of the seconds from queueing each message until the broker acknowledged it.
+    """
+    return self.__latency
+
+  def Publish(self, topic, payload, qos = 1, callback = None):
+    """
+    Queues a message to be sent. Never blocks.
+
+    Args:
+      topic: str, topic to publish to
+      payload: bytes, message to send
+      qos: int, MQTT quality of service
+      callback: function, optional, called with no arguments once the broker has acknowledged the message
+
+    Returns: bool, whether or not the message was queued
+    """
+    try:
+      self.__queue.put_nowait([topic, payload, qos, callback, time.monotonic()])
+      return True
+    except queue.Full:
+      self.__dropped += 1
+      return False
+
+  def Flush(self, timeout = 5):
+    """
+    Waits until every queued message has been acknowledged by the broker.
+
+    Returns: bool, whether or not every message was sent before the timeout
+    """
+    done = threading.Event()
+    self.Publish(None, None, callback=done.set)
+    return done.wait(timeout)
+
+  def Stop(self):
+    """
+    Stops sending. Never blocks, and messages still queued are discarded.
+    """
+    self.__stopped.set()
+
+    # Wakes the thread if it's waiting on an empty queue. A full queue means it isn't, and it sees the stop
+    # after the message it's on.
+    try: self.__queue.put_nowait(None)
+    except queue.Full: pass
+
+  def __run(self):
+    while not self.__stopped.is_set():
+      item = self.__queue.get()
+      if item is None: break
+
+      topic, payload, qos, callback, queued_time = item
+
+      # Flush markers are passed along once every message before them has been acknowledged
+      if topic is None:
+        acquired = 0
+        while acquired < self.__max_in_flight and self.__acquire():
+          acquired += 1
+        for _ in range(acquired): self.__in_flight.release()
+        if acquired == self.__max_in_flight: callback()
+        continue
+
+      # Holds back until the broker has acknowledged enough messages to fit this one in the window
+      if not self.__acquire(): break
+      info = self.__client.publish(topic, payload, qos=qos)
+
+      with self.__callbacks_lock:
+        if info.mid in self.__early_acks:
+          self.__early_acks.discard(info.mid)
+          acknowledged = True
+        else:
+          self.__callbacks[info.mid] = [callback, queued_time]
+          acknowledged = False
+
+      if acknowledged: self.__acknowledge(callback, queued_time)
+
+  def __acquire(self):
+    """
+    Waits for room in the window of messages in flight, which a broker that stopped acknowledging never makes.
+
+    Returns: bool, whether there was room before the publisher was stopped
+    """
+    while not self.__in_flight.acquire(timeout=self.__STOP_CHECK_INTERVAL):
+      if self.__stopped.is_set(): return False
+    return True
+
+  def __published(self, client, data, mid):
+    with self.__callbacks_lock:
+      if mid not in self.__callbacks:
+        self.__early_acks.add(mid)
+        return
+      callback, queued_time = self.__callbacks.pop(mid)
+
+    self.__acknowledge(callback, queued_time)
+
+  def __acknowledge(self, callback, queued_time):
+    self.__latency.Observe(time.monotonic() - queued_time)
+    self.__in_flight.release()
+    if callback is not None: callback()
+
+class Batcher:
+  def __init__(self, callback, max_size = 50, linger = 0.25):
+    """
+    Groups items together so they can be sent in a single message.
+
+    Args:
+      callback: function, called with a list of items whenever a batch is complete
+      max_size: int, a batch is sent as soon as it has this many items
+      linger: float, max seconds the first item of a batch waits for more items
+    """
+    self.__callback = callback
+    self.__max_size = max_size
+    self.__linger = linger
+
+    self.__items = []
+    self.__deadline = None
+    self.__condition = threading.Condition()
+
+    self.__running = True
+    threading.Thread(target=self.__run, daemon=True).start()
+
+  def Add(self, item):
+    batch = None
+
+    with self.__condition:
+      self.__items.append(item)
+
+      if len(self.__items) >= self.__max_size:
+        batch = self.__take()
+      elif len(self.__items) == 1:
+        self.__deadline = time.monotonic() + self.__linger
+        self.__condition.notify()
+
+    if batch: self.__callback(batch)
+
+  def Flush(self):
+    with self.__condition: batch = self.__take()
+    if batch: self.__callback(batch)
+
+  def Stop(self):
+    self.Flush()
+    with self.__condition:
+      self.__running = False
+      self.__condition.notify()
+
+  def __take(self):
+    batch = self.__items
+    self.__items = []
+    self.__deadline = None
+    return batch
+
+  def __run(self):
+    while True:
+      batch = None
+
+      with self.__condition:
+        if not self.__running: break
+
+        if not self.__items:
+          self.__condition.wait()
+        elif self.__deadline > time.monotonic():
+          self.__condition.wait(self.__deadline - time.monotonic())
+        else:
+          batch = self.__take()
+
+      if batch: self.__callback(batch)
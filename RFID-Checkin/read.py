@@ -13,50 +13,80 @@ To read more about Paho MQTT for Python, go to: https://pypi.org/project/paho-mq
 Edited on: May 4, 2019
 '''
 
-from paho.mqtt import publish, client as mqtt
+from paho.mqtt import client as mqtt
 from reading_manager import ReadingManager
-from sensors import LaserManager
+from publisher import Publisher, Batcher
+from system_logger import SystemLogger
+from outbox import Outbox
+from reader_discovery import ReaderDiscovery
+from metrics import MetricsReporter, cpu_temperature
+from epc_filter import EPCFilter, decode_epcs
+from command_executor import CommandExecutor, Task
+from log_sync import read_chunks, decode_log_request
+from sensors import LaserManager, Laser, SetGPIOBackend
 from node_enums import *
-import pickle, mercury, datetime, pathlib, time
-import RPi.GPIO as GPIO
+import codec, datetime, time, sys, threading, os
 
 # Unique ID to differentiate between different systems that are connected to handler.py
 RASPI_ID = 'UPOGDU'
 LOG_FILE = "System Logs/{}.txt" # {} is replaced by a datetime value in print_out()
+OUTBOX_FOLDER = "Outbox/" # Tags are stored here until the broker has received them
 DATETIME_FORMAT = '%m/%d/%Y %H:%M:%S'
 READER_PATH = "tmr:///dev/ttyUSB"
+TAG_BATCH_SIZE = 50 # Max amount of tags sent in one message
+TAG_BATCH_LINGER = 0.25 # Max seconds a tag waits for others to be sent with it
+READER_PATH_CACHE = "reader_path.txt" # Paths the readers were last found on, tried first when looking for them
+READER_COUNT = 1 # Amount of readers connected to the Pi, e.g. one per door of a double doorway
+LASER_PINS = [[Laser.IN_PIN, Laser.OUT_PIN]] # In and out pin of each pair of lasers. The index of a pair is its zone.
+ANTENNA_ZONES = {} # Zone covered by each antenna, see ReadingManager. Antennas that aren't listed cover every zone.
+READER_CHECK_INTERVAL = 1 # Seconds between checks that the reader is still connected
+ADAPTIVE_SCANNING = True # Only read continuously after the lasers are tripped, see ReadingManager
+IDLE_OFF_TIME = 1750 # Milliseconds the antennas rest after each 250 ms read cycle while nothing is passing
+ACTIVE_TIME = 30 # Seconds after the lasers were last tripped until reading goes back to idle
+METRICS_INTERVAL = 10 # Seconds between the snapshots of the node's metrics published on the METRICS topic
 
 def connect_to_reader(path = READER_PATH, max_port = 10):
   """
-  Configure ThingMagic RFID Reader.
+  Configure ThingMagic RFID Reader. The ports are probed at the same time, see reader_discovery.py
 
   Args:
     max_port: int, attempts to connect to the path[0-max_port]. For example, tmr:///dev/ttyUSB4
 
   Returns: 
-    [response_codes.Response_Codes, mercury.Reader, str]
+    [mercury.Reader, str], the reader and its path, or [None, ""] if it couldn't be found
   """
-
-  conn_port = 0
-  reader = None
-
-  while conn_port <= max_port:
-    try:
-      reader = mercury.Reader("{}{}".format(path, conn_port))
-      reader.set_region('NA')
-
-      return [reader, "{}{}".format(path, conn_port)]
-    except: conn_port += 1
-
-  return [reader, ""]
+  return ReaderDiscovery(path, max_port, READER_PATH_CACHE).Connect()
 
 class ManagerWrapper:
-  def __init__(self, reader):
-    self.__print_out("connected to reader on '{}'".format(conn_path))
+  def __init__(self, reader, reader_path = "", batch_size = TAG_BATCH_SIZE, batch_linger = TAG_BATCH_LINGER, client = None, discovery = None,
+               metrics_interval = METRICS_INTERVAL):
+    """
+    Connects to MQTT and starts handling commands in the background. Call Run() to block until the node is stopped.
+
+    Args:
+      reader: mercury.Reader or list<mercury.Reader>, the connected RFID reader(s)
+      reader_path: str or list<str>, path each reader is connected on
+      batch_size: int, max amount of tags sent in one message
+      batch_linger: float, max seconds a tag waits for others to be sent with it
+      client: paho.mqtt.client.Client, optional unconnected client to use instead of connecting to the broker over websockets
+      discovery: ReaderDiscovery, optional, used to reconnect the readers whenever they are lost
+      metrics_interval: float, seconds between the snapshots of the node's metrics
+    """
+    self.__logger = SystemLogger(LOG_FILE, DATETIME_FORMAT)
+    self.__reader_paths = list(reader_path) if isinstance(reader_path, list) else [reader_path]
+    for path in self.__reader_paths: self.__print_out("connected to reader on '{}'".format(path))
 
-    self.__reading_man = ReadingManager(reader)
+    self.__reading_man = ReadingManager(reader, laser_pins=LASER_PINS, zones=ANTENNA_ZONES, adaptive=ADAPTIVE_SCANNING,
+                                        idle_off_time=IDLE_OFF_TIME, active_time=ACTIVE_TIME)
     self.__print_out("created reading manager")
     self.__status = Status.ONLINE
+    self.__logs_sent = {} # Log file name : offset of the end of the last chunk sent, see SendSystemLogs()
+
+    # Commands are run away from the MQTT network thread, see command_executor.py. __task is the mode started
+    # by the last command (single tag request or a test) that runs until it is stopped.
+    self.__task = None
+    self.__executor = CommandExecutor(self.__command_failed)
+    self.__register_commands()
 
     # Attempt to connect to MQTT
 
@@ -65,22 +95,54 @@ class ManagerWrapper:
     # connection type. Additionally, a more secure way of sending data, if necessary, is to connect with a client ID
     # that is recognized by the nodes. client.will_set sets the message to be sent by the MQTT client to the handler
     # in the case that this node disconnects.
-    self.__client = mqtt.Client(transport='websockets')  # Connect with websockets
+    self.__client = client or mqtt.Client(transport='websockets')  # Connect with websockets
     self.__client.on_connect = self.__client_connected
     self.__client.on_message = self.__client_messaged
-    self.__client.will_set("reader/{}/{}".format(RASPI_ID, Topic.NODE_STATUS), payload=pickle.dumps(Status.OFFLINE), qos=1)
+    self.__client.will_set("reader/{}/{}".format(RASPI_ID, Topic.NODE_STATUS), payload=codec.encode(Topic.NODE_STATUS, { 'Status' : Status.OFFLINE }, RASPI_ID), qos=1)
+
+    # Every outgoing message is queued on the publisher and sent through this same connection in the background
+    self.__publisher = Publisher(self.__client)
+
+    # Tags are written to the outbox before being sent so none are lost if the broker can't be reached. They are
+    # sent from there in the background once the client is connected.
+    tag_topic = 'reader/{}/{}'.format(RASPI_ID, Topic.TAG_READINGS)
+    self.__outbox = Outbox(OUTBOX_FOLDER, lambda payload, callback: self.__publisher.Publish(tag_topic, payload, 1, callback), self.__client.is_connected)
+    self.__tag_batcher = Batcher(lambda tags: self.__outbox.Append(codec.encode(Topic.TAG_READINGS, tags, RASPI_ID)), batch_size, batch_linger)
+
+    # Tags that no laser pass could be matched to are kept apart from the check-ins and sent as they are
+    self.__unmatched_batcher = Batcher(lambda tags: self.__send_message(Topic.UNMATCHED_TAGS, tags), batch_size, batch_linger)
     self.__client.connect('broker.hivemq.com', port=8000)
 
-    try: self.__client.loop_forever()
-    except (KeyboardInterrupt, SystemExit): self.Shutdown()
+    # The network loop runs on its own thread (reconnecting when necessary) so that the main thread is free to shut down the node
+    self.__client.loop_start()
+
+    # Watches for the reader being unplugged or re-enumerated and reattaches it without stopping the node
+    self.__discovery = discovery
+    self.__watching_reader = discovery is not None
+    if self.__watching_reader: threading.Thread(target=self.__watch_reader, daemon=True).start()
+
+    # Publishes the node's health in the background, see metrics.py
+    self.__metrics = MetricsReporter(self.__collect_metrics, lambda snapshot: self.__send_message(Topic.METRICS, snapshot), metrics_interval)
 
   @property
   def Status(self):
     return self.__status
+
+  @property
+  def ReadingManager(self):
+    return self.__reading_man
+
+  def Run(self):
+    """
+    Blocks until the script is interrupted, then shuts down the node.
+    """
+    try:
+      while True: time.sleep(1)
+    except (KeyboardInterrupt, SystemExit): self.Shutdown()
       
-  def BeginLogging(self, callback):
+  def BeginLogging(self, callback, unmatched_callback = None):
     self.__check_availability()
-    self.__reading_man.BeginReading(callback)
+    self.__reading_man.BeginReading(callback, unmatched_callback, self.__update_scan_mode)
     self.__update_status(Status.LOGGING)
 
   def StopLogging(self):
@@ -92,95 +154,187 @@ class ManagerWrapper:
     self.__check_availability()
 
     self.__update_status(Status.REQUESTING_TAG)
-    callback(self.__reading_man.ReadOnce())
-    self.__update_status(Status.ONLINE)
+    self.__start_task(lambda cancelled: callback(self.__reading_man.ReadOnce()), 'read-once')
 
   def BeginTesting(self, callback):
     self.__check_availability()
     
-    self.__reading_man.StartReaderTest(callback)
     self.__update_status(Status.RUNNING_READER_TEST)
+    self.__start_task(lambda cancelled: self.__reading_man.StartReaderTest(callback, cancelled=cancelled), 'reader-test')
 
   def StopTesting(self):
     if self.__status == Status.RUNNING_READER_TEST:
-      self.__reading_man.StopReaderTest()
-      self.__update_status(Status.ONLINE)
+      self.__stop_task()
 
   def TestLasers(self, callback):
     self.__check_availability()
 
-    self.__reading_man.TestLasers(callback=callback)
     self.__update_status(Status.RUNNING_SENSOR_TEST)
+    self.__start_task(lambda cancelled: self.__reading_man.StartLaserTest(callback, cancelled=cancelled), 'laser-test')
 
   def StopLasers(self):
     if self.__status == Status.RUNNING_SENSOR_TEST:
-      self.__reading_man.StopLaserTest()
-      self.__update_status(Status.ONLINE)
+      self.__stop_task()
 
   def Shutdown(self):
+    self.__watching_reader = False
+    # Commands already received are finished before anything they use is stopped
+    if not self.__executor.Stop(): self.__print_out("commands still running after waiting for them to finish")
+    self.__metrics.Stop()
     self.StopLogging()
     self.StopTesting()
     self.StopLasers()
+    self.__tag_batcher.Stop()
+    self.__unmatched_batcher.Stop()
     
     self.__print_out('stopped all activity')
     
     self.SendSystemLogs()
-    self.__send_message(Topic.NODE_STATUS, Status.OFFLINE)
+    self.__send_message(Topic.NODE_STATUS, { 'Status' : Status.OFFLINE })
 
+    self.__publisher.Flush()
     self.__print_out('sent logs to server')
     self.__print_out('shutting down node {}'.format(RASPI_ID))
+
+    self.__outbox.Stop()
+    self.__publisher.Stop()
+    self.__client.loop_stop()
+    self.__client.disconnect()
+    self.__logger.Stop()
            
     return self.Status
 
-  def SendSystemLogs(self):
-    log_data = ""
-    file_name = LOG_FILE.format(datetime.datetime.now().strftime('%m-%d-%Y'))
-    
-    with open(file_name, 'r') as LF:
-      log_data = LF.read()
-      
-    self.__send_message(Topic.NODE_LOG, { 'Name' : file_name.split(sep='/')[1], 'Logs' : log_data })
+  def SendSystemLogs(self, request = None):
+    """
+    Sends the part of the system logs the handler doesn't have yet as compressed chunks, see log_sync.py. The rest
+    of the log the handler asked for is sent first if it's from an earlier day, then today's log.
+
+    Args:
+      request: [str, int], optional name and size of the latest log file the handler has. Defaults to continuing
+        from the last chunk sent.
+    """
+    self.__logger.Flush()
+    folder, current = os.path.split(self.__logger.GetFileName())
+    name, offset = request or [current, self.__logs_sent.get(current, 0)]
+
+    logs = [[name, offset]] if name == current else [[name, offset], [current, 0]] if name else [[current, 0]]
+    for name, offset in logs:
+      name = os.path.basename(name)
+
+      try:
+        for chunk_offset, chunk, end in read_chunks(os.path.join(folder, name), offset):
+          self.__send_message(Topic.NODE_LOG, { 'Name' : name, 'Offset' : chunk_offset, 'Chunk' : chunk })
+          self.__logs_sent[name] = end
+      except OSError as error:
+        self.__print_out("could not send log '{}': {}", name, error)
 
   def __client_messaged(self, client, data, msg):
-    command = pickle.loads(msg.payload)
-    self.__send_message(Topic.NODE_RESPONSE, repr(command)) # Reply to the sender to let it know we've received the message
+    # Anyone can publish to the broker, so only well-formed commands are handled. Anything else is dropped.
+    try: body = codec.decode(msg.payload, Topic.COMMANDS)['BODY']
+    except ValueError as error:
+      self.__print_out("received malformed message: {}".format(error))
+      return
+
+    if not isinstance(body, dict) or not isinstance(body.get('Command'), Command) or 'Argument' not in body:
+      self.__print_out("received malformed command: {}", body)
+      return
+
+    command = body['Command']
+
+    # Runs on the network thread, so the command is only queued. The reply goes out straight away to let the
+    # sender know we've received the message, whatever the node is busy with.
+    self.__send_message(Topic.NODE_RESPONSE, command)
     self.__print_out("received message '{}'".format(command))
-    
-    try:
-      if command == Command.START_LOGGING:
-        self.BeginLogging(self.__log_tag)
-      elif command == Command.STOP_LOGGING:
-        self.StopLogging()
-      elif command == Command.READ_ONCE:
-        self.ReadOnce(callback=self.__log_tag)
-      elif command == Command.BEGIN_SENSOR_TEST:
-        self.TestLasers(callback=self.__log_sensor_reading)
-      elif command == Command.STOP_SENSOR_TEST:
-        self.StopLasers()
-      elif command == Command.BEGIN_READER_TEST:
-        self.BeginTesting(self.__log_tag)
-      elif command == Command.STOP_READER_TEST:
-        self.StopTesting()
-      elif command == Command.CHECK_STATUS:
-        self.__post_status()
-      elif command == Command.GET_LOGS:
-        self.SendSystemLogs()
-    except NodeBusy as error:
+    self.__executor.Submit(command, body['Argument'])
+
+  def __register_commands(self):
+    # Command : [handler called with the argument, whether it has to run in the order it was received]. Commands
+    # that change the status must be run in order. PING is only replied to.
+    commands = {
+      Command.START_LOGGING : [lambda argument: self.BeginLogging(self.__log_tag, self.__log_unmatched_tag), True],
+      Command.STOP_LOGGING : [lambda argument: self.StopLogging(), True],
+      Command.READ_ONCE : [lambda argument: self.ReadOnce(callback=self.__send_tag), True],
+      Command.BEGIN_SENSOR_TEST : [lambda argument: self.TestLasers(callback=self.__log_sensor_reading), True],
+      Command.STOP_SENSOR_TEST : [lambda argument: self.StopLasers(), True],
+      Command.BEGIN_READER_TEST : [lambda argument: self.BeginTesting(self.__send_tag), True],
+      Command.STOP_READER_TEST : [lambda argument: self.StopTesting(), True],
+      Command.CHECK_STATUS : [lambda argument: self.__post_status(), False],
+      Command.GET_LOGS : [lambda argument: self.SendSystemLogs(decode_log_request(argument) if argument else None), False],
+      Command.SET_EPC_FILTER : [lambda argument: self.__set_epc_filter(EPCFilter.FromBytes(argument) if argument else None), True],
+      Command.ADD_TO_EPC_FILTER : [lambda argument: self.__add_to_epc_filter(decode_epcs(argument or b'')), True]
+    }
+
+    for command, [handler, ordered] in commands.items():
+      self.__executor.Register(command, handler, ordered)
+
+  def __command_failed(self, command, error):
+    if isinstance(error, NodeBusy):
       self.__post_error(command, error)
+    elif isinstance(error, ValueError):
+      self.__print_out("received malformed argument for '{}': {}".format(command, error))
+    else:
+      self.__print_out("'{}' failed: {}".format(command, error))
+
+  def __start_task(self, target, name):
+    """
+    Runs a mode in the background. The node goes back online once it ends, whether it was stopped or not.
+    """
+    status = self.__status
+
+    def run(cancelled):
+      try: target(cancelled)
+      except Exception as error: self.__print_out("{} stopped: {}", name, error)
+
+      if self.__status == status: self.__update_status(Status.ONLINE)
+
+    self.__task = Task(run, name=name)
+
+  def __stop_task(self):
+    if self.__task is not None and not self.__task.Cancel():
+      self.__print_out("{} did not stop in time", self.__task)
+    self.__task = None
 
   def __client_connected(self, client, data, flags, rc):
     client.subscribe('reader/{}/{}'.format(RASPI_ID, Topic.COMMANDS), 1)
+
+    # The broker published the OFFLINE will if the connection was lost, and the handler drops tags from a node it
+    # sees as offline. The status goes out first so the tags kept in the outbox are taken.
+    self.__post_status()
+    self.__outbox.Wake()
     self.__print_out("connected to MQTT client on 'reader/{}/{}'".format(RASPI_ID, Topic.COMMANDS))
 
   def __send_message(self, topic, message):
     if isinstance(topic, Topic):
-      message_obj = {'TIMESTAMP' : datetime.datetime.now(), 'ID' : RASPI_ID, 'BODY' : message}
-      publish.single('reader/{}/{}'.format(RASPI_ID, topic.value), payload=pickle.dumps(message_obj), qos=1, hostname="broker.mqttdashboard.com", port=8000, transport="websockets")
+      self.__publisher.Publish('reader/{}/{}'.format(RASPI_ID, topic.value), codec.encode(topic, message, RASPI_ID), qos=1)
     else:
       raise ValueError("'topic' argument must be an instance of Topic")
 
+  def __set_epc_filter(self, epc_filter):
+    if epc_filter is None:
+      self.__reading_man.SetEPCFilter(None)
+      self.__print_out("cleared the EPC filter")
+    elif self.__reading_man.SetEPCFilter(epc_filter):
+      self.__print_out("set the EPC filter ({} bits)".format(epc_filter.BitCount))
+    else:
+      self.__print_out("EPC filter of {} bits is too large, reading every EPC".format(epc_filter.BitCount))
+
+  def __add_to_epc_filter(self, epcs):
+    self.__reading_man.AddToEPCFilter(epcs)
+    self.__print_out("added {} EPCs to the EPC filter".format(len(epcs)))
+
+  def __collect_metrics(self):
+    metrics = self.__reading_man.Metrics
+    metrics['Totals']['DroppedMessages'] = self.__publisher.Dropped
+    metrics['PublishQueue'] = self.__publisher.Queued
+    metrics['PublishLatency'] = self.__publisher.Latency.Snapshot()
+    metrics['OutboxBacklog'] = self.__outbox.Backlog
+    metrics['CPUTemperature'] = cpu_temperature()
+    return metrics
+
   def __post_status(self):
-    self.__send_message(Topic.NODE_STATUS, self.Status)
+    # The scan mode only means something while the readers are logging
+    scan_mode = self.__reading_man.ScanMode if self.Status == Status.LOGGING else None
+    self.__send_message(Topic.NODE_STATUS, { 'Status' : self.Status, 'ScanMode' : scan_mode })
 
   def __post_error(self, trigger, error):
     """
@@ -204,26 +358,53 @@ class ManagerWrapper:
     elif self.__status == Status.RUNNING_SENSOR_TEST:
       raise NodeBusy(NodeError.NODE_BUSY_TESTING_SENSORS)
 
-  def __print_out(self, msg):
+  def __print_out(self, msg, *args):
     """
-    Prints data to the LOG_FILE and out to the screen.
+    Queues data to be printed to the LOG_FILE and out to the screen. See system_logger.py
+
+    Args:
+      msg: str, message to log. If args are given, it is formatted with them on the logging thread.
     """
-    curr_time = datetime.datetime.now()
-    ft_msg = "{}\t{}".format(curr_time.strftime(DATETIME_FORMAT), msg)
+    self.__logger.Log(msg, *args)
+
+  def __watch_reader(self):
+    retry_interval = READER_CHECK_INTERVAL
 
-    print(ft_msg)
-    directory = LOG_FILE.split(sep='/')[0] + '/'
-    pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
-    with open(LOG_FILE.format(curr_time.strftime('%m-%d-%Y')), 'a') as LF:
-      LF.write(ft_msg + '\n')
+    while self.__watching_reader:
+      time.sleep(retry_interval)
+      lost = self.__reading_man.LostReaders
+      lost += [x for x, path in enumerate(self.__reader_paths) if x not in lost and not self.__discovery.IsPresent(path)]
+
+      for index in lost:
+        self.__print_out("lost reader on '{}', searching for it", self.__reader_paths[index])
+        reader, path = self.__discovery.Connect([x for i, x in enumerate(self.__reader_paths) if i != index])
+        if reader is None: continue
+
+        self.__reading_man.AttachReader(reader, index)
+        self.__reader_paths[index] = path
+        self.__print_out("reattached reader on '{}'", path)
+
+      # Backs off while a reader stays unplugged so the ports aren't probed constantly
+      missing = self.__reading_man.LostReaders or any(not self.__discovery.IsPresent(x) for x in self.__reader_paths)
+      retry_interval = min(retry_interval * 2, 30) if missing else READER_CHECK_INTERVAL
 
   def __log_tag(self, tag):
-    self.__send_message(Topic.TAG_READINGS, tag.__dict__)
-    self.__print_out('read tag: {}'.format(tag.__dict__))
+    self.__tag_batcher.Add(tag.__dict__)
+    self.__print_out('read tag: {}', tag.__dict__)
+
+  def __send_tag(self, tag):
+    # Single tag requests and reader tests skip the batcher, which would hold the tag back until after the status
+    # that ends them. The handler only takes tags while it sees the node's status as the mode they were read in.
+    self.__send_message(Topic.TAG_READINGS, [tag.__dict__])
+    self.__print_out('read tag: {}', tag.__dict__)
+
+  def __log_unmatched_tag(self, tag):
+    self.__unmatched_batcher.Add(tag.__dict__)
+    self.__print_out('read unmatched tag: {}', tag.__dict__)
 
   def __log_sensor_reading(self, laser_reading):
     self.__send_message(Topic.SENSOR_READINGS, laser_reading)
-    self.__print_out('read sensor value: {}'.format(sensor_reading))
+    self.__print_out('read sensor value: {}'.format(laser_reading))
 
   def __update_status(self, status):
     if isinstance(status, Status):
@@ -232,12 +413,28 @@ class ManagerWrapper:
 
       self.__print_out("current node status: {}".format(self.Status.value))
 
-if __name__ == '__main__':
-  # Attempt to connect to reader
-  reader, conn_path = connect_to_reader()
+  def __update_scan_mode(self, scan_mode):
+    self.__post_status()
+    self.__print_out("current scan mode: {}".format(scan_mode.value))
 
-  if conn_path == "":
+if __name__ == '__main__':
+  if '--simulate' in sys.argv:
+    # Runs without the reader or lasers, with an object passing in each direction every 10 seconds. See simulation.py
+    from simulation import SimulatedReader, SimulatedGPIO
+    gpio = SimulatedGPIO()
+    gpio.Play(SimulatedGPIO.PassTimeline(Laser.IN_PIN, Laser.OUT_PIN, 1) + SimulatedGPIO.PassTimeline(Laser.OUT_PIN, Laser.IN_PIN, 1, start=6), loop=10)
+    SetGPIOBackend(gpio)
+    reader, conn_path = SimulatedReader(rate=50, epcs=20), 'simulated reader'
+    discovery = None
+  else:
+    # Attempt to connect to the readers
+    discovery = ReaderDiscovery(READER_PATH, cache_file=READER_PATH_CACHE)
+    readers = discovery.ConnectAll(READER_COUNT)
+    reader, conn_path = [[x[0] for x in readers], [x[1] for x in readers]] if readers else [None, ""]
+
+  if not conn_path:
     raise ReaderUnreachable
     exit(1)
 
-  node_manager = ManagerWrapper(reader)
\ No newline at end of file
+  node_manager = ManagerWrapper(reader, conn_path, discovery=discovery)
+  node_manager.Run()
\ No newline at end of file
@@ -0,0 +1,173 @@
+'''
+RFID Logging Software
+
+Description (reader_discovery.py):
+Finds the serial ports the RFID readers are connected on. The paths that worked last are kept in a cache file and
+tried first, and every other candidate port is probed at the same time, so a port that isn't a reader only costs
+its connection timeout once instead of once per port before it.
+
+Contributors:
+Dom Stepek
+
+To read more about Mercury API for Python, go to: https://github.com/gotthardp/python-mercuryapi
+
+Edited on: October 17, 2026
+'''
+
+import os, threading
+
+# The Mercury API is only installed on the Raspberry Pi. Run read.py with --simulate to use simulation.py instead.
+try: import mercury
+except ImportError: mercury = None
+
+class ReaderDiscovery:
+  __DEVICE_PREFIX = 'tmr://'
+
+  def __init__(self, path = 'tmr:///dev/ttyUSB', max_port = 10, cache_file = 'reader_path.txt', region = 'NA', timeout = 30, connect = None):
+    """
+    Args:
+      path: str, path of the ports without the port number, e.g. tmr:///dev/ttyUSB
+      max_port: int, highest port number to try
+      cache_file: str, file storing the paths of the last successful connections
+      region: str, region set on the reader once connected
+      timeout: float, max seconds to wait on all the ports being probed
+      connect: function, optional, called with a path and returns a connected reader or raises. Defaults to
+        creating a mercury.Reader
+    """
+    self.__path = path
+    self.__max_port = max_port
+    self.__cache_file = cache_file
+    self.__region = region
+    self.__timeout = timeout
+    self.__connect = connect or self.__connect_mercury
+    self.__connected_path = ""
+
+  @property
+  def Path(self):
+    """
+    Path of the last successful connection, or an empty string.
+    """
+    return self.__connected_path
+
+  def IsPresent(self, path = None):
+    """
+    Args:
+      path: str, optional path to check. Defaults to the last successful connection
+
+    Returns: bool, whether the device of the path still exists. A USB reader that is unplugged or re-enumerated
+      loses its device file.
+    """
+    return self.__exists(self.__connected_path if path is None else path)
+
+  def Candidates(self, exclude = ()):
+    """
+    Args:
+      exclude: list<str>, paths to leave out, such as those of readers that are already connected
+
+    Returns: list<str>, paths to try, starting with the cached paths. Serial ports without a device file are skipped.
+    """
+    cached = [x for x in self.__load_cache() if self.__exists(x)]
+    paths = [f'{self.__path}{port}' for port in range(self.__max_port + 1)]
+    paths = cached + [x for x in paths if self.__exists(x) and x not in cached]
+
+    return [x for x in paths if x not in exclude]
+
+  def Connect(self, exclude = ()):
+    """
+    Tries the first cached path on its own, then every other candidate at once.
+
+    Args:
+      exclude: list<str>, paths to leave out, such as those of readers that are already connected
+
+    Returns: [mercury.Reader, str], the connected reader and its path, or [None, ""] if no reader was found
+    """
+    candidates = self.Candidates(exclude)
+
+    if candidates and candidates[0] in self.__load_cache():
+      reader = self.__try_connect(candidates[0])
+      if reader is not None: return self.__connected(reader, candidates[0])
+      candidates = candidates[1:]
+
+    if not candidates: return [None, ""]
+
+    result = []
+    done = threading.Event()
+    lock = threading.Lock()
+    remaining = [len(candidates)]
+
+    def probe(path):
+      reader = self.__try_connect(path)
+
+      with lock:
+        # Only the first reader found is kept. Any other is dropped, closing its connection.
+        if reader is not None and not result: result.extend([reader, path])
+        remaining[0] -= 1
+        if result or remaining[0] == 0: done.set()
+
+    for path in candidates:
+      threading.Thread(target=probe, args=(path,), daemon=True).start()
+    done.wait(self.__timeout)
+
+    with lock:
+      if not result: return [None, ""]
+      return self.__connected(*result)
+
+  def ConnectAll(self, count):
+    """
+    Args:
+      count: int, amount of readers to look for
+
+    Returns: list<[mercury.Reader, str]>, the readers that were found and their paths
+    """
+    readers = []
+
+    for _ in range(count):
+      reader, path = self.Connect([x[1] for x in readers])
+      if reader is None: break
+      readers.append([reader, path])
+
+    return readers
+
+  def __connected(self, reader, path):
+    self.__connected_path = path
+    self.__save_cache(path)
+    return [reader, path]
+
+  def __try_connect(self, path):
+    try: return self.__connect(path)
+    except Exception: return None
+
+  def __connect_mercury(self, path):
+    if mercury is None: raise RuntimeError('The Mercury API is not installed')
+
+    reader = mercury.Reader(path)
+    reader.set_region(self.__region)
+    return reader
+
+  def __device(self, path):
+    """
+    Returns: str, the device file of a path such as tmr:///dev/ttyUSB0, or None if the path isn't a local device
+    """
+    if not path.startswith(ReaderDiscovery.__DEVICE_PREFIX + '/'): return None
+    return path[len(ReaderDiscovery.__DEVICE_PREFIX):]
+
+  def __exists(self, path):
+    device = self.__device(path)
+    return device is None or os.path.exists(device)
+
+  def __load_cache(self):
+    """
+    Returns: list<str>, cached paths, most recently connected first
+    """
+    try:
+      with open(self.__cache_file) as cf: return [x.strip() for x in cf if x.strip()]
+    except OSError: return []
+
+  def __save_cache(self, path):
+    paths = [path] + [x for x in self.__load_cache() if x != path]
+
+    try:
+      temp_path = self.__cache_file + '.tmp'
+      with open(temp_path, 'w') as cf: cf.write('\n'.join(paths[:self.__max_port + 1]) + '\n')
+      os.replace(temp_path, self.__cache_file)
+    except OSError: pass
@@ -11,23 +11,37 @@ To read more about Mercury API for Python go to: https://github.com/gotthardp/py
 
 Edited on: May 4, 2019
 '''
-from multiprocessing import Process, Queue, Value
-from ctypes import c_bool
-import datetime, time
+from multiprocessing import Process, Queue, Value, Array, Event, RawValue
+from ctypes import c_bool, c_double, c_int, c_uint64
+import datetime, time, threading
 from sensors import *
 from tag import *
-from node_enums import Status
+from node_enums import Status, ScanMode
+from ring_buffer import TagRing, DirectionRing
+from correlator import DirectionCorrelator
+from aggregator import TagAggregator
+from metrics import Histogram
+from epc_filter import SharedEPCFilter
 
 class TimeRange:
   def __init__(self, start_time, end_time, expansion = 0):
+    """
+    Args:
+      start_time: datetime or float, start of the range. Floats are time.monotonic() values
+      end_time: datetime or float, end of the range. Must be the same type as start_time
+      expansion: float, seconds to pad both ends of the range with
+    """
     if isinstance(start_time, datetime.datetime) and isinstance(end_time, datetime.datetime):
       self.StartTime = start_time + datetime.timedelta(seconds=-expansion)
       self.EndTime = end_time + datetime.timedelta(seconds=expansion)
+    elif isinstance(start_time, (int, float)) and isinstance(end_time, (int, float)):
+      self.StartTime = start_time - expansion
+      self.EndTime = end_time + expansion
     else:
-      raise ValueError('start_time and end_time must be an instance of datetime')
+      raise ValueError('start_time and end_time must both be an instance of datetime or monotonic times')
 
   def Contains(self, test_time):
-    if isinstance(test_time, datetime.datetime):
+    if isinstance(test_time, (datetime.datetime, int, float)):
       return self.StartTime <= test_time and test_time <= self.EndTime
     elif isinstance(test_time, TimeRange):
       return self.StartTime <= test_time.StartTime and test_time.EndTime <= self.EndTime
@@ -39,11 +53,64 @@ class TimeRange:
     return "[{},{}]".format(self.StartTime, self.EndTime)
 
 class ReadingManager:
-  def __init__(self, reader):
+  # Antennas are numbered across readers from 0 as reader index * ANTENNAS_PER_READER + antenna port - 1, since
+  # Mercury antenna ports start at 1. Antennas are sent as a 32 bit mask (see codec.py), so up to 4 readers can be
+  # used at once.
+  ANTENNAS_PER_READER = 8
+  MAX_READERS = 4
+
+  def __init__(self, reader, continuous = True, aggregation_window = 1, laser_pins = None, zones = None, adaptive = False,
+               idle_off_time = 1750, active_time = 30):
+    """
+    Args:
+      reader: mercury.Reader or list<mercury.Reader>, the connected RFID reader(s). Each reader is read by its own
+        process, all feeding the same stream of tags.
+      continuous: bool, whether to stream tags with the Mercury API's asynchronous reading or to read in timed cycles
+      aggregation_window: float, reads of the same EPC less than this many seconds apart are sent as one tag
+      laser_pins: list<[int, int]>, optional in and out pin of each pair of lasers, where the index of a pair is
+        its zone. Defaults to a single pair on Laser.IN_PIN and Laser.OUT_PIN
+      zones: dict<int, int>, optional zone covered by each antenna, numbered as described by ANTENNAS_PER_READER.
+        Tags are only matched to directions from the lasers of their antenna's zone. Antennas that aren't listed
+        match every zone.
+      adaptive: bool, whether to scan at a low duty cycle while nothing is passing, which keeps the readers cool
+        and frees up the CPU, and only read continuously for the active time after the lasers are tripped.
+        Otherwise the readers always read continuously.
+      idle_off_time: int, milliseconds the antennas are off after each read cycle while idle
+      active_time: float, seconds after the lasers were last tripped until the readers go back to idle
+    """
     self.__THRESHOLD_TIME = 3
-
-    self.__reader = reader
+    self.__RUN_CHECK_INTERVAL = 0.25 # Seconds between checks of the running flag in event driven processes
+    self.__SENDER_MIN_INTERVAL = 0.02 # Min seconds between passes of the sender, so bursts of reads are handled together
+    self.__BREAK_REPORT_TIME = 0.05 # Max seconds for a beam break to reach the sender as a pending pass
+    self.__READ_ON_TIME = 250 # Milliseconds per asynchronous read cycle. With no off time the antenna is always on.
+    self.__SCAN_MODE_CHECK_INTERVAL = 0.05 # Seconds between checks of the scan mode by adaptive reader processes
+
+    self.__readers = list(reader) if isinstance(reader, (list, tuple)) else [reader]
+    if not 0 < len(self.__readers) <= ReadingManager.MAX_READERS:
+      raise ValueError(f'Must give between 1 and {ReadingManager.MAX_READERS} readers')
+
+    self.__continuous = continuous
+    self.__aggregation_window = aggregation_window
+    self.__laser_pins = laser_pins or [[Laser.IN_PIN, Laser.OUT_PIN]]
+    self.__zones = zones or {}
+    self.__adaptive = adaptive
+    self.__idle_off_time = idle_off_time
+    self.__active_time = active_time
+    self.__scan_mode = Value(c_int, list(ScanMode).index(ScanMode.ACTIVE)) # Set by the lasers process, see __set_scan_mode()
     self.__running = Value(c_bool, False)
+    self.__readers_lost = Array(c_bool, len(self.__readers))
+    self.__readers_running = [None] * len(self.__readers) # Stops a single reader process, see AttachReader()
+    self.__epc_filter = SharedEPCFilter() # Reads of other EPCs are dropped by the reader processes
+    self.__tag_ring = None
+    self.__direction_ring = None
+    self.__sync_queue = None
+    self.__processes = []
+
+    # Metrics, see the Metrics property. Tags waiting in the sender are only written by the sender process.
+    self.__waiting_tags = RawValue(c_uint64, 0)
+    self.__tag_latency = Histogram()
+    self.__tags_sent = 0
+    self.__unmatched_sent = 0
 
   def __test_laser(self):
     """
@@ -51,158 +118,457 @@ class ReadingManager:
     """
 
 
-  def BeginReading(self, callback):
+  def BeginReading(self, callback, unmatched_callback = None, scan_mode_callback = None):
+    """
+    Starts reading tags in the background.
+
+    Args:
+      callback: function, called with each Tag once its direction is known. Runs on a thread of the calling
+        process, so it is free to use connections owned by that process.
+      unmatched_callback: function, optional, called the same way with each Tag that was read while no object
+        was passing the lasers. Its status is Unknown.
+      scan_mode_callback: function, optional, called with the ScanMode whenever adaptive reading changes it
+    """
     if hasattr(callback, '__call__'):
       # Diagrams for how Reading Manager works can be seen in ../Diagrams/
-      # The direction queue will hold the list of all directions logged by the lasers
-      # The tag queue holds the list of all tags read by the RFID reader
-
-      direction_queue = Queue(1)
-      direction_queue.put([])
-      tag_queue = Queue(1)
-      tag_queue.put([])
+      # The direction ring will hold all directions logged by the lasers
+      # The tag ring holds all tags read by the RFID reader
+      # Both live in shared memory, so the processes never have to pickle or wait on each other to pass them along
+
+      # Either ring wakes the sender as soon as something is put into it. The lasers process also shares when
+      # each pair of lasers has a pass under way (the first beam broken, but not yet the second).
+      wake = Event()
+      direction_ring = DirectionRing(wake=wake)
+      tag_ring = TagRing(wake=wake)
+      pending_passes = Array(c_double, len(self.__laser_pins))
+      self.__tag_ring = tag_ring
+      self.__direction_ring = direction_ring
+
+      # Tags with a direction are handed back to this process to be sent. There are few of them compared to reads.
+      # Changes of the scan mode are handed back the same way.
+      sync_queue = Queue()
+      self.__sync_queue = sync_queue
+      self.__tags_sent = 0
+      self.__unmatched_sent = 0
+
+      # Reading starts out active in case something is already passing
+      with self.__scan_mode.get_lock(): self.__scan_mode.value = list(ScanMode).index(ScanMode.ACTIVE)
       
       # Tells the new processes that the program is running
       with self.__running.get_lock():
         self.__running.value = True
       
       # Create and start processes for the laser scanning, RFID reader reading, and MQTT publishing.
-      Process(target=self.__run_lasers, args=(direction_queue, self.__running)).start()
-      Process(target=self.__run_sender, args=(tag_queue, direction_queue, self.__running, callback)).start()
-      Process(target=self.__run_reader, args=(tag_queue, self.__running, testing)).start()
+      self.__processes = [
+        Process(target=self.__run_lasers, args=(direction_ring, pending_passes, self.__running, sync_queue), name='lasers'),
+        Process(target=self.__run_sender, args=(tag_ring, direction_ring, pending_passes, wake, self.__running, sync_queue), name='sender')
+      ]
+      for process in self.__processes: process.start()
+      for index in range(len(self.__readers)): self.__start_reader(index)
+      threading.Thread(target=self.__run_dispatcher, args=(sync_queue, callback, unmatched_callback, scan_mode_callback)).start()
     else:
       raise ValueError('Must specify callback function')
 
+  @property
+  def ProcessIDs(self):
+    """
+    Dictionary of process name to process ID of the processes started by BeginReading().
+    """
+    return {process.name : process.pid for process in self.__processes}
+
+  @property
+  def ScanMode(self):
+    """
+    ScanMode the readers are in. Always active unless adaptive reading is on.
+    """
+    with self.__scan_mode.get_lock(): return list(ScanMode)[self.__scan_mode.value]
+
+  @property
+  def Metrics(self):
+    """
+    Object of the current metrics, formatted as {
+      'Totals' : object, counts since reading last began {
+        'Reads' : int, reads put into the tag ring
+        'DroppedReads' : int, reads overwritten before the sender got to them
+        'LaserEvents' : int, directions logged by the lasers
+        'Tags' : int, tags handed to the callback
+        'UnmatchedTags' : int, tags handed to the unmatched callback
+        'FilteredReads' : int, reads dropped by the EPC filter, since the node started
+      }
+      'TagQueue' : int, reads waiting in the tag ring
+      'DirectionQueue' : int, directions waiting in the direction ring
+      'WaitingTags' : int, tags held by the sender until their direction is known
+      'SyncQueue' : int, tags waiting to be handed to the callbacks
+      'TagLatency' : object, milliseconds from the last read of each tag until it was handed to a callback,
+        since the last time the metrics were taken. See Histogram.Snapshot()
+    }
+    """
+    tag_ring, direction_ring, sync_queue = self.__tag_ring, self.__direction_ring, self.__sync_queue
+
+    return {
+      'Totals' : {
+        'Reads' : tag_ring.Written if tag_ring else 0,
+        'DroppedReads' : tag_ring.Dropped if tag_ring else 0,
+        'LaserEvents' : direction_ring.Written if direction_ring else 0,
+        'Tags' : self.__tags_sent,
+        'UnmatchedTags' : self.__unmatched_sent,
+        'FilteredReads' : self.__epc_filter.Rejected
+      },
+      'TagQueue' : len(tag_ring) if tag_ring else 0,
+      'DirectionQueue' : len(direction_ring) if direction_ring else 0,
+      'WaitingTags' : self.__waiting_tags.value,
+      'SyncQueue' : sync_queue.qsize() if sync_queue else 0,
+      'TagLatency' : self.__tag_latency.Snapshot()
+    }
+
+  @property
+  def ReaderCount(self):
+    return len(self.__readers)
+
+  @property
+  def LostReaders(self):
+    """
+    Indexes of the readers that raised an error while reading, e.g. because they were unplugged. Cleared by
+    AttachReader().
+    """
+    with self.__readers_lost.get_lock(): return [x for x, lost in enumerate(self.__readers_lost) if lost]
+
+  def AttachReader(self, reader, index = 0):
+    """
+    Swaps in a newly connected reader. While reading, only that reader's process is restarted, so the directions
+    and tags waiting in the other processes are kept.
+
+    Args:
+      reader: mercury.Reader, the connected RFID reader
+      index: int, index of the reader being replaced
+    """
+    name = f'reader-{index}'
+    old_process = next((x for x in self.__processes if x.name == name), None)
+
+    if old_process is not None:
+      with self.__readers_running[index].get_lock(): self.__readers_running[index].value = False
+
+      # A reader that was unplugged can leave the process stuck inside the Mercury API
+      old_process.join(self.__RUN_CHECK_INTERVAL * 4)
+      if old_process.is_alive(): old_process.terminate()
+      self.__processes.remove(old_process)
+
+    self.__readers[index] = reader
+    with self.__readers_lost.get_lock(): self.__readers_lost[index] = False
+
+    with self.__running.get_lock(): running = self.__running.value
+    if running and old_process is not None: self.__start_reader(index)
+
+  def SetEPCFilter(self, epc_filter):
+    """
+    Only reads of EPCs in the filter are logged from now on, including by processes that are already reading.
+    Single tag requests and reader tests aren't filtered, so new tags can still be found.
+
+    Args:
+      epc_filter: EPCFilter, EPCs to log, or None to log every EPC
+
+    Returns: bool, whether the filter could be used. Filters too large to be held leave every EPC logged.
+    """
+    return self.__epc_filter.Load(epc_filter)
+
+  def AddToEPCFilter(self, epcs):
+    """
+    Args:
+      epcs: list<str>, hex EPCs to add to the filter set by SetEPCFilter()
+    """
+    self.__epc_filter.Add(epcs)
+
   def StopReading(self):
-    # Tells the processes to stop running and to exit
+    # Tells the processes to stop running and to exit. They're forgotten, so AttachReader() doesn't restart one.
     with self.__running.get_lock():
       self.__running.value = False
+    self.__processes = []
 
   def ReadOnce(self):
-    tag_data = self.__reader.read()[0]
+    tag_data = self.__readers[0].read()[0]
     return Tag(str(tag_data.epc, 'utf-8'), TagStatus.Unknown, tag_data.rssi)
 
-  def StartLaserTest(self, callback, timeout = 1):
-    lm = LaserManager()
+  def StartLaserTest(self, callback, timeout = 1, cancelled = None):
+    """
+    Calls the callback with [Laser.Type, value] for both lasers of the first pair every timeout seconds. Blocks
+    until StopLaserTest() is called or cancelled is set.
+
+    Args:
+      cancelled: threading.Event, optional, stops the test once set. See command_executor.Task
+    """
+    lm = LaserManager(*self.__laser_pins[0])
 
     with self.__running.get_lock():
-      self.__running = True
+      self.__running.value = True
 
-    while True:
-      running = False
-      with self.__running.get_lock(): running = self.__running.value
-      if not running: break
+    try:
+      while self.__is_testing(cancelled):
+        callback([Laser.Type.Out, lm.OutLaser.Value])
+        callback([Laser.Type.In, lm.InLaser.Value])
+        self.__wait(timeout, cancelled)
+    finally:
+      self.__end_test()
 
-      callback([Laser.Type.Out, lm.OutLaser.Value])
-      callback([Laser.Type.In, lm.InLaser.Value])
-      time.sleep(timeout)
+  def StartReaderTest(self, callback, timeout = 1, cancelled = None):
+    """
+    Calls the callback with each Tag read by the first reader, unfiltered and without a direction. Blocks until
+    StopReaderTest() is called or cancelled is set.
 
-  def StartReaderTest(self, callback, timeout = 1):
+    Args:
+      cancelled: threading.Event, optional, stops the test once set. See command_executor.Task
+    """
     with self.__running.get_lock():
-      self.__running = True
+      self.__running.value = True
 
-    while True:
-      running = False
-      with self.__running.get_lock(): running = self.__running.value
-      if not running: break
-      
-      tag_data = self.__reader.read()
-      for x in tag_data:
-        callback(Tag(str(x.epc, 'utf-8'), TagStatus.Unknown, tag_data.rssi))
-      time.sleep(timeout)
+    try:
+      while self.__is_testing(cancelled):
+        tag_data = self.__readers[0].read()
+        for x in tag_data:
+          callback(Tag(str(x.epc, 'utf-8'), TagStatus.Unknown, x.rssi, x.timestamp, x.antenna))
+        self.__wait(timeout, cancelled)
+    finally:
+      self.__end_test()
 
   def StopLaserTest(self): self.StopReading()
 
   def StopReaderTest(self): self.StopReading()
 
-  def __run_sender(self, tag_queue, dir_queue, run_val, callback):
+  def __end_test(self):
+    # However the test ended (stopped, cancelled, or failed), so AttachReader() never restarts a reader for it
+    with self.__running.get_lock():
+      self.__running.value = False
+
+  def __is_testing(self, cancelled):
+    if cancelled is not None and cancelled.is_set(): return False
+    with self.__running.get_lock(): return self.__running.value
+
+  def __wait(self, timeout, cancelled):
+    if cancelled is not None: cancelled.wait(timeout)
+    else: time.sleep(timeout)
+
+  def __run_dispatcher(self, sync_queue, callback, unmatched_callback, scan_mode_callback):
+    """
+    Calls the callbacks with each tag synced by the sender process and each scan mode set by the lasers process.
+    Ends when the sender puts None.
+    """
+    for item in iter(sync_queue.get, None):
+      if isinstance(item, ScanMode):
+        if scan_mode_callback is not None: scan_mode_callback(item)
+        continue
+
+      self.__tag_latency.Observe((datetime.datetime.now() - item.LastSeen).total_seconds())
+      if item.Status != TagStatus.Unknown:
+        self.__tags_sent += 1
+        callback(item)
+      elif unmatched_callback is not None:
+        self.__unmatched_sent += 1
+        unmatched_callback(item)
+
+  def __run_sender(self, tag_ring, dir_ring, pending_passes, wake, run_val, sync_queue):
     """
-    Syncs tags queue to direction queue and calls the callback with each updated tag.
+    Syncs tags ring to direction ring and places each tag into the sync queue as soon as no direction still
+    to come could change its match. Sleeps until something is put into a ring or the next tag is due.
     """
 
-    wait_time = self.__THRESHOLD_TIME * 2
+    # Reads of the same tag are first merged into a single event (see aggregator.py), which is then matched
+    # to a direction (see correlator.py, and ../Diagrams for a visual explanation)
+    aggregator = TagAggregator(self.__aggregation_window)
+    correlator = DirectionCorrelator(self.__THRESHOLD_TIME * 2, self.__zones, self.__THRESHOLD_TIME)
+
     while True:
       # Checks to see if node is running
       running = False
       with run_val.get_lock(): running = run_val.value
       if not running: break
       
-      curr_time = datetime.datetime.now()
+      # The time is taken before reading the pending passes and emptying the rings. The lasers process logs a
+      # direction before clearing its pending pass, so every pass that started before then has been seen in one
+      # or the other. Passes expire if the second beam isn't broken within the threshold.
+      curr_time = time.monotonic()
+      wake.clear()
+      with pending_passes.get_lock():
+        pending = [x for x in pending_passes if x and x > curr_time - self.__THRESHOLD_TIME]
+
+      for start_time, end_time, status, zone in dir_ring.GetDirections():
+        correlator.AddDirection(TimeRange(start_time, end_time, self.__THRESHOLD_TIME), status, zone)
+      for tag in tag_ring.GetTags():
+        aggregator.AddTag(tag)
+      for tag in aggregator.Collect(curr_time):
+        correlator.AddTag(tag)
+
+      # Breaks that happened just before curr_time may not have been shared yet, so passes are only ruled out
+      # from slightly earlier on
+      for tag in correlator.Collect(curr_time - self.__BREAK_REPORT_TIME, pending):
+        sync_queue.put(tag)
+      self.__waiting_tags.value = len(aggregator) + len(correlator)
+
+      # Sleeps until the next event or tag is due, a pending pass expires, or a ring wakes it up
+      deadlines = [aggregator.NextDeadline, correlator.NextDeadline] + [x + self.__THRESHOLD_TIME for x in pending]
+      deadlines = [x + self.__BREAK_REPORT_TIME for x in deadlines if x is not None]
+      time.sleep(self.__SENDER_MIN_INTERVAL)
+      timeout = min(deadlines + [time.monotonic() + self.__RUN_CHECK_INTERVAL]) - time.monotonic()
+      wake.wait(max(0, timeout))
+
+    # Everything still waiting is sent with the directions known so far, rather than being lost
+    for start_time, end_time, status, zone in dir_ring.GetDirections():
+      correlator.AddDirection(TimeRange(start_time, end_time, self.__THRESHOLD_TIME), status, zone)
+    for tag in tag_ring.GetTags(): aggregator.AddTag(tag)
+    for tag in aggregator.Collect(float('inf')):
+      correlator.AddTag(tag)
+    for tag in correlator.Collect(float('inf')):
+      sync_queue.put(tag)
+    self.__waiting_tags.value = 0
+
+    sync_queue.put(None)
+
+  def __start_reader(self, index):
+    self.__readers_running[index] = Value(c_bool, True)
+    process = Process(target=self.__run_reader, args=(index, self.__tag_ring, self.__running, self.__readers_running[index]), name=f'reader-{index}')
+    process.start()
+    self.__processes.append(process)
+
+  def __is_reading(self, index, run_val, reader_run_val):
+    """
+    Returns: bool, whether the reader's process should keep going
+    """
+    with run_val.get_lock():
+      if not run_val.value: return False
+    with reader_run_val.get_lock():
+      if not reader_run_val.value: return False
+    with self.__readers_lost.get_lock():
+      return not self.__readers_lost[index]
 
-      tags = tag_queue.get()
-      dirs = dir_queue.get()
-      
-      for x in dirs:
-        for y in tags:
-          # If the current tag was read within the time of a direction and sync it's direction.
-          # See ../Diagrams for a visual explanation
-          if x[0].Contains(y.Timestamp):
-            y.Status = x[1]
-
-      for y in [x for x in tags if x.Status != TagStatus.Unknown]: callback(y)
-          
-      tag_queue.put([])
-      dir_queue.put([])
-      
-      time.sleep(wait_time)
+  def __lose_reader(self, index):
+    with self.__readers_lost.get_lock(): self.__readers_lost[index] = True
 
-  def __run_reader(self, tag_queue, run_val, testing):
+  def __run_reader(self, index, tag_ring, run_val, reader_run_val):
     """
-    Reads and processes tags read by RFID reader and places them into the tag queue
+    Reads and processes tags read by one of the RFID readers and places them into the tag ring. Exits and marks
+    the reader as lost if it fails.
     """
     
+    try:
+      if self.__continuous:
+        self.__run_reader_continuous(index, tag_ring, run_val, reader_run_val)
+      else:
+        self.__run_reader_timed(index, tag_ring, run_val, reader_run_val)
+    except Exception:
+      self.__lose_reader(index)
+
+  def __run_reader_timed(self, index, tag_ring, run_val, reader_run_val):
+    reader = self.__readers[index]
+    antenna_offset = index * ReadingManager.ANTENNAS_PER_READER - 1
+
     while True:
       # Checks to see if node is running
-      running = False
-      with run_val.get_lock(): running = run_val.value
-      if not running: break
+      if not self.__is_reading(index, run_val, reader_run_val): break
+      active = self.ScanMode == ScanMode.ACTIVE
 
-      # Reads for tags
-      tag_reads = self.__reader.read(2000)
-      curr_time = datetime.datetime.now()
+      # Reads for tags. While idle, reads for a single short cycle between long rests.
+      tag_reads = reader.read(2000 if active else self.__READ_ON_TIME)
 
-      tags = tag_queue.get()
-      # Pulls EPC and RSSI off the data from the Mercury API
+      # Pulls EPC, RSSI, and antenna off the data from the Mercury API, dropping tags that aren't ours
       for tag_data in tag_reads:
-          tags.append(Tag(tag_data.epc, TagStatus.Unknown, tag_data.rssi))
-      tag_queue.put(tags)
+        if tag_data.epc in self.__epc_filter:
+          tag_ring.PutRead(tag_data.epc, tag_data.rssi, tag_data.timestamp, tag_data.antenna + antenna_offset)
       
       # Arbitrary sleep time. Can be removed
-      time.sleep(1)
+      time.sleep(1 if active else self.__idle_off_time / 1000)
 
-  def __run_lasers(self, dir_queue, run_val):
-    def update_tag_directions(time_range, status):
-      dirs = dir_queue.get() # Acquire access to the list of directions inside of dir_queue
-      dirs.append([time_range, status]) # Add this new direction to the list
-      dir_queue.put(dirs) # Put the list back into dir_queue
-    
-    # See sensors.py for LaserManager details
-    lm = LaserManager()
+  def __run_reader_continuous(self, index, tag_ring, run_val, reader_run_val):
+    """
+    Streams tags from the RFID reader into the tag ring as soon as the reader reports them. The Mercury API
+    calls add_tag on its own thread, so the antenna is never idle waiting for this process.
+    """
+
+    reader = self.__readers[index]
+    antenna_offset = index * ReadingManager.ANTENNAS_PER_READER - 1
+
+    def add_tag(tag_data):
+      # Tags that aren't ours are dropped here, before they take up room in the ring
+      if tag_data.epc not in self.__epc_filter: return
+
+      # Uses the reader's own timestamp so the tag lines up with the lasers regardless of reporting delay
+      tag_ring.PutRead(tag_data.epc, tag_data.rssi, tag_data.timestamp, tag_data.antenna + antenna_offset)
+
+    # Errors on the Mercury API's reading thread are reported through its exception handler
+    if hasattr(reader, 'enable_exception_handler'): reader.enable_exception_handler(lambda error: self.__lose_reader(index))
+    scan_mode = self.ScanMode
+    reader.start_reading(add_tag, on_time=self.__READ_ON_TIME, off_time=self.__off_time(scan_mode))
 
     while True:
       # Checks to see if node is running
+      if not self.__is_reading(index, run_val, reader_run_val): break
+
+      # Restarts reading with the duty cycle of the new scan mode. The mode is checked often so that reading ramps
+      # up quickly once the lasers are tripped.
+      if self.__adaptive and self.ScanMode != scan_mode:
+        scan_mode = self.ScanMode
+        reader.stop_reading()
+        reader.start_reading(add_tag, on_time=self.__READ_ON_TIME, off_time=self.__off_time(scan_mode))
+
+      time.sleep(self.__SCAN_MODE_CHECK_INTERVAL if self.__adaptive else self.__RUN_CHECK_INTERVAL)
+
+    reader.stop_reading()
+
+  def __off_time(self, scan_mode):
+    """
+    Returns: int, milliseconds the antennas are off after each read cycle in the scan mode
+    """
+    return 0 if scan_mode == ScanMode.ACTIVE else self.__idle_off_time
+
+  def __set_scan_mode(self, scan_mode, sync_queue):
+    """
+    Sets the scan mode read by the reader processes and reports it to the dispatcher if it changed.
+    """
+    with self.__scan_mode.get_lock():
+      if list(ScanMode)[self.__scan_mode.value] == scan_mode: return
+      self.__scan_mode.value = list(ScanMode).index(scan_mode)
+      sync_queue.put(scan_mode)
+
+  def __run_lasers(self, dir_ring, pending_passes, run_val, sync_queue):
+    # Any beam break starts or ends a pass, so it ramps the readers up to continuous reading when adaptive
+    last_activity = [time.monotonic()]
+
+    def log_activity():
+      last_activity[0] = time.monotonic()
+      if self.__adaptive: self.__set_scan_mode(ScanMode.ACTIVE, sync_queue)
+
+    def direction_logger(zone):
+      def log_direction(laser_type, start_time, end_time):
+        dir_ring.PutDirection(start_time, end_time, TagStatus[laser_type.name], zone)
+        log_activity()
+      return log_direction
+
+    def pending_logger(zone):
+      def log_pending(start_time):
+        with pending_passes.get_lock(): pending_passes[zone] = start_time or 0
+        log_activity()
+      return log_pending
+    
+    # See sensors.py for LaserManager and DirectionDetector details. The detector is driven by GPIO edge events
+    # on its own thread and timestamps beam breaks with time.monotonic(), which is shared between processes.
+    # When both lasers are broken in sequence within __THRESHOLD_TIME, the direction, the time it took for an
+    # object to pass by both lasers, and the zone of the lasers is added into the dir_ring. The first break of
+    # a pass is shared in pending_passes until the pass is logged, so the sender knows to wait for it.
+    # See ../Diagrams/ for laser graphic
+    managers = [LaserManager(in_pin, out_pin) for in_pin, out_pin in self.__laser_pins]
+    detectors = [DirectionDetector(lm, direction_logger(zone), self.__THRESHOLD_TIME, pending_callback=pending_logger(zone))
+                 for zone, lm in enumerate(managers)]
+    for detector in detectors: detector.Start()
+
+    while True:
+      # Checks to see if node is running. Nothing else happens on this thread, so it can sleep between checks.
       running = False
       with run_val.get_lock(): running = run_val.value
       if not running: break
-      ts = datetime.datetime.now()
-      
-      # The two following if-then blocks checks to see if there is an object in front of it and no object
-      # in front of it's complement. If this is the case, wait to see if an object then passes by it's complement.
-      # If an object passes by withing __THRESHOLD_TIME, then that implies that something has passed by both sensors
-      # and has a momentum in the direction of the most recent laser reading. When this happens, this process will add this
-      # direction and the time it took for an object to pass by both lasers (plus a padding) into the dir_queue by calling update_tag_directions()
-      # See ../Diagrams/ for laser graphic
-
-      if not lm.InLaser.Value and lm.OutLaser.Value:
-        while (datetime.datetime.now() - ts).total_seconds() < self.__THRESHOLD_TIME:
-          if not lm.OutLaser.Value:
-            update_tag_directions(TimeRange(ts, datetime.datetime.now(), self.__THRESHOLD_TIME), TagStatus.Out)
-            time.sleep(0.5)
-            break
-              
-      if not lm.OutLaser.Value and lm.InLaser.Value:
-        while (datetime.datetime.now() - ts).total_seconds() < self.__THRESHOLD_TIME:
-          if not lm.InLaser.Value:
-            update_tag_directions(TimeRange(ts, datetime.datetime.now(), self.__THRESHOLD_TIME), TagStatus.In)
-            time.sleep(0.5)
-            break
+
+      # Decays back to idle once nothing has tripped the lasers for a while. The mode is set every time, which
+      # undoes an idle mode set just as the lasers were tripped.
+      if self.__adaptive:
+        idle = time.monotonic() - last_activity[0] >= self.__active_time
+        self.__set_scan_mode(ScanMode.IDLE if idle else ScanMode.ACTIVE, sync_queue)
+      time.sleep(self.__RUN_CHECK_INTERVAL)
+
+    for detector in detectors: detector.Stop()
+    managers[0].StopLasers()
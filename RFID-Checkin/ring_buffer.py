@@ -0,0 +1,137 @@
+'''
+RFID Logging Software
+
+Description (ring_buffer.py):
+Fixed-size ring buffers in shared memory used to pass tag reads and laser directions between the node processes.
+Records are packed directly into the shared buffer with struct, so nothing is pickled or copied through a pipe.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+from multiprocessing import Lock, RawArray, RawValue
+from ctypes import c_char, c_uint64
+import struct, time
+from tag import Tag, TagStatus
+
+class RingBuffer:
+  def __init__(self, record_format, capacity = 8192, wake = None):
+    """
+    Ring buffer of fixed-width records. Must be created before the processes that share it are started.
+    When the buffer is full, the oldest record is overwritten and counted as dropped.
+
+    Args:
+      record_format: str, struct format of a single record
+      capacity: int, max amount of records held at once
+      wake: multiprocessing.Event, optional, set whenever a record is put into the empty buffer so the reader
+        can wait on it instead of polling. The reader must clear it before calling Get().
+    """
+    self.__record = struct.Struct(record_format)
+    self.__capacity = capacity
+
+    self.__buffer = RawArray(c_char, self.__record.size * capacity)
+    self.__head = RawValue(c_uint64, 0) # Total amount of records written
+    self.__tail = RawValue(c_uint64, 0) # Total amount of records read
+    self.__dropped = RawValue(c_uint64, 0)
+    self.__lock = Lock()
+    self.__wake = wake
+
+  @property
+  def Capacity(self):
+    return self.__capacity
+
+  @property
+  def Dropped(self):
+    return self.__dropped.value
+
+  @property
+  def Written(self):
+    """
+    Total amount of records put into the buffer, including those dropped.
+    """
+    return self.__head.value
+
+  def __len__(self):
+    with self.__lock:
+      return self.__head.value - self.__tail.value
+
+  def Put(self, *values):
+    with self.__lock:
+      head = self.__head.value
+      was_empty = head == self.__tail.value
+
+      if head - self.__tail.value == self.__capacity:
+        self.__tail.value += 1
+        self.__dropped.value += 1
+
+      self.__record.pack_into(self.__buffer, (head % self.__capacity) * self.__record.size, *values)
+      self.__head.value = head + 1
+
+    # Only the first record after the buffer was emptied needs to wake the reader
+    if was_empty and self.__wake is not None: self.__wake.set()
+
+  def Get(self):
+    """
+    Removes all records currently in the buffer.
+
+    Returns: list<tuple>, the unpacked records, oldest first
+    """
+    with self.__lock:
+      head = self.__head.value
+      records = [self.__record.unpack_from(self.__buffer, (i % self.__capacity) * self.__record.size) for i in range(self.__tail.value, head)]
+      self.__tail.value = head
+
+    return records
+
+class TagRing(RingBuffer):
+  # EPC length, raw EPC, RSSI, monotonic read time, antenna
+  __RECORD_FORMAT = '<B32sbdB'
+
+  def __init__(self, capacity = 8192, wake = None):
+    super().__init__(TagRing.__RECORD_FORMAT, capacity, wake)
+
+  def PutRead(self, epc, rssi, timestamp = None, antenna = 0):
+    """
+    Args:
+      epc: bytes or str, hex EPC as reported by the Mercury API
+      rssi: int, signal strength of the read
+      timestamp: float, optional time (in seconds since the epoch) the reader saw the tag. Defaults to now.
+      antenna: int, antenna that read the tag
+    """
+    raw_epc = bytes.fromhex(str(epc, 'utf-8') if isinstance(epc, bytes) else epc)
+    read_time = time.monotonic()
+    if timestamp is not None: read_time -= time.time() - timestamp
+
+    self.Put(len(raw_epc), raw_epc, max(-128, min(127, int(rssi))), read_time, antenna)
+
+  def GetTags(self):
+    """
+    Returns: list<Tag>, all tags read since the last call
+    """
+    return [Tag(raw_epc[:epc_len].hex().upper(), TagStatus.Unknown, rssi, antenna=antenna, read_time=read_time)
+            for epc_len, raw_epc, rssi, read_time, antenna in self.Get()]
+
+class DirectionRing(RingBuffer):
+  # Monotonic start time, monotonic end time, TagStatus, zone
+  __RECORD_FORMAT = '<ddBB'
+
+  def __init__(self, capacity = 1024, wake = None):
+    super().__init__(DirectionRing.__RECORD_FORMAT, capacity, wake)
+
+  def PutDirection(self, start_time, end_time, status, zone = 0):
+    """
+    Args:
+      start_time: float, time.monotonic() of the first break
+      end_time: float, time.monotonic() of the second break
+      status: TagStatus, direction of the object
+      zone: int, index of the pair of lasers that were broken
+    """
+    self.Put(start_time, end_time, status.value, zone)
+
+  def GetDirections(self):
+    """
+    Returns: list<[float, float, TagStatus, int]>, all directions logged since the last call
+    """
+    return [[start_time, end_time, TagStatus(status), zone] for start_time, end_time, status, zone in self.Get()]
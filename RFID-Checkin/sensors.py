@@ -10,13 +10,25 @@ Dom Stepek
 Edited on: May 4, 2019
 '''
 
-import RPi.GPIO as GPIO
 import time, threading, enum, datetime
 from multiprocessing import Process
 
+# RPi.GPIO is only available on the Raspberry Pi. Elsewhere, a backend such as simulation.SimulatedGPIO must be
+# set with SetGPIOBackend() before any lasers are created.
+try: import RPi.GPIO as GPIO
+except ImportError: GPIO = None
+
+def SetGPIOBackend(backend):
+  """
+  Replaces RPi.GPIO with another object offering the same functions. Must be called before processes using
+  the lasers are started.
+  """
+  global GPIO
+  GPIO = backend
+
 class Laser:
-  __IN_PIN = 7
-  __OUT_PIN = 11
+  IN_PIN = 7
+  OUT_PIN = 11
 
   class Type(enum.Enum):
     In = 0
@@ -27,31 +39,63 @@ class Laser:
     Paused = 1
     Stopped = 2
 
-  def __init__(self, type):
+  def __init__(self, type, pin = None):
+    """
+    Args:
+      type: Laser.Type, which side of the doorway the laser is on
+      pin: int, optional board pin of the photoresistor. Defaults to IN_PIN or OUT_PIN depending on the type.
+    """
     self.__type = type
     
     # Assign the pins to the proper laser type
-    if type == Laser.Type.In:
-      self.__pin = Laser.__IN_PIN
+    if pin is not None:
+      self.__pin = pin
+    elif type == Laser.Type.In:
+      self.__pin = Laser.IN_PIN
     elif type == Laser.Type.Out:
-      self.__pin = Laser.__OUT_PIN
+      self.__pin = Laser.OUT_PIN
         
     GPIO.setup(self.__pin, GPIO.IN)
       
+  @property
+  def LaserType(self):
+    return self.__type
+
   @property
   def Opposite(self):
-    return Laser.Type.In if self.__type == Laser.Type.Out else Laser.Type.In
+    return Laser.Type.In if self.__type == Laser.Type.Out else Laser.Type.Out
 
   @property
   def Value(self):
     # Pulls value of digital input from the pin.
     return GPIO.input(self.__pin)
+
+  def WatchBeam(self, callback, bouncetime = None):
+    """
+    Registers an edge-triggered callback for whenever the beam is broken. The photoresistor pulls the pin low
+    when an object is in front of it, so only falling edges are watched. Edges are latched by the kernel, so short
+    breaks are caught even if the callback thread is busy.
+
+    Args:
+      callback: function, called with (Laser.Type, float) where the float is the time.monotonic() of the break
+      bouncetime: int, optional debounce time in milliseconds
+    """
+    kwargs = {} if bouncetime is None else {'bouncetime' : bouncetime}
+    GPIO.add_event_detect(self.__pin, GPIO.FALLING, callback=lambda channel: callback(self.__type, time.monotonic()), **kwargs)
+
+  def StopWatching(self):
+    GPIO.remove_event_detect(self.__pin)
             
 class LaserManager:
-  def __init__(self):
+  def __init__(self, in_pin = None, out_pin = None):
+    """
+    Args:
+      in_pin: int, optional board pin of the in laser. Defaults to Laser.IN_PIN
+      out_pin: int, optional board pin of the out laser. Defaults to Laser.OUT_PIN
+    """
     GPIO.setmode(GPIO.BOARD)
-    self.__in_laser = Laser(Laser.Type.In)
-    self.__out_laser = Laser(Laser.Type.Out)
+    self.__in_laser = Laser(Laser.Type.In, in_pin)
+    self.__out_laser = Laser(Laser.Type.Out, out_pin)
 
   @property
   def Lasers(self):
@@ -65,5 +109,73 @@ class LaserManager:
   def OutLaser(self):
     return self.__out_laser
   
+  def GetLaser(self, laser_type):
+    return self.__in_laser if laser_type == Laser.Type.In else self.__out_laser
+
   def StopLasers(self):
     GPIO.cleanup() # Allows for pins to be reused without conflict in future runs of the script
+
+class DirectionDetector:
+  def __init__(self, laser_manager, callback, threshold = 3, lockout = 0.5, bouncetime = None, pending_callback = None):
+    """
+    Detects the direction of objects passing both lasers using GPIO edge events instead of polling.
+
+    When a beam is broken while its complement is clear, the break is held as pending. If the complement is then
+    broken within threshold seconds, an object has passed both lasers with a momentum in the direction of the
+    second laser and callback is called. See ../Diagrams/ for laser graphic.
+
+    Args:
+      laser_manager: LaserManager, lasers to watch
+      callback: function, called with (Laser.Type, float, float), the direction and the monotonic times of the first and second break
+      threshold: float, max seconds between the first and second break
+      lockout: float, seconds to ignore breaks after a direction has been detected
+      bouncetime: int, optional debounce time in milliseconds passed to GPIO
+      pending_callback: function, optional, called with the monotonic time of the earliest break waiting for its
+        complement (or None) whenever it changes. When a direction completes a pass, it is called after callback.
+    """
+    self.__laser_manager = laser_manager
+    self.__callback = callback
+    self.__threshold = threshold
+    self.__lockout = lockout
+    self.__bouncetime = bouncetime
+
+    self.__pending_callback = pending_callback
+    self.__pending = {}
+    self.__lockout_until = 0
+    self.__lock = threading.Lock()
+
+  def Start(self):
+    for laser in self.__laser_manager.Lasers:
+      laser.WatchBeam(self.__beam_broken, self.__bouncetime)
+
+  def Stop(self):
+    for laser in self.__laser_manager.Lasers:
+      laser.StopWatching()
+
+  def __beam_broken(self, laser_type, timestamp):
+    opposite = self.__laser_manager.GetLaser(laser_type).Opposite
+    direction = None
+
+    with self.__lock:
+      if timestamp < self.__lockout_until: return
+      previous_pending = self.__earliest_pending()
+
+      first_break = self.__pending.pop(opposite, None)
+      if first_break is not None and timestamp - first_break <= self.__threshold:
+        # Complement was broken first, so the object is moving towards this laser
+        self.__pending.clear()
+        self.__lockout_until = timestamp + self.__lockout
+        direction = [laser_type, first_break, timestamp]
+      elif self.__laser_manager.GetLaser(opposite).Value:
+        # Only start a pass if the complement is clear (nothing is standing in both beams)
+        self.__pending[laser_type] = timestamp
+
+      earliest_pending = self.__earliest_pending()
+
+    if direction is not None:
+      self.__callback(*direction)
+    if earliest_pending != previous_pending and self.__pending_callback is not None:
+      self.__pending_callback(earliest_pending)
+
+  def __earliest_pending(self):
+    return min(self.__pending.values()) if self.__pending else None
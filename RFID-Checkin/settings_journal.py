@@ -0,0 +1,213 @@
+'''
+RFID Logging Software
+
+Description (settings_journal.py):
+Keeps the handler's settings safe on disk without rewriting them on every read. The settings are saved as a
+snapshot, which is written to a temporary file, synced, and then renamed over the old one, so a crash leaves either
+the old or the new snapshot and never half of one. Each change to a tag's status and location in between is
+appended to a journal as a single line. Loading replays the journal over the snapshot, and once the journal gets
+long the handler saves a new snapshot, which empties it.
+
+Callers only queue changes and snapshots, since they are made from the MQTT network thread. A background thread
+writes them in order, syncing every change that arrived together with a single fsync, as log_file.py does.
+
+Format of a journal line: JSON list [EPC, status name, location]. A line cut off by a crash is ignored.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import json, os, pickle, threading, queue, time
+
+class SettingsJournal:
+  __MAX_BATCH = 1000
+
+  def __init__(self, settings_file, journal_file = None, compact_after = 1000, fsync_interval = 0, on_error = None):
+    """
+    Args:
+      settings_file: str, path of the snapshot of the settings
+      journal_file: str, path of the journal. Defaults to the settings file with '.journal' added
+      compact_after: int, amount of changes after which Append() asks for a new snapshot
+      fsync_interval: float, max seconds between syncs of the journal to disk. 0 syncs every batch of changes,
+        None leaves it to the OS
+      on_error: function, optional, called with the exception whenever a change or snapshot can't be saved
+    """
+    self.__settings_file = settings_file
+    self.__journal_file = journal_file or settings_file + '.journal'
+    self.__compact_after = compact_after
+    self.__fsync_interval = fsync_interval
+    self.__on_error = on_error
+    self.__lock = threading.Lock()
+    self.__changes = 0
+
+    # Only used by the writer thread
+    self.__journal = None
+    self.__last_fsync = time.monotonic()
+
+    self.__queue = queue.Queue()
+    self.__thread = threading.Thread(target=self.__run, daemon=True)
+    self.__thread.start()
+
+  @property
+  def Changes(self):
+    """
+    Amount of changes in the journal since the last snapshot.
+    """
+    return self.__changes
+
+  def Load(self):
+    """
+    Returns: [object, list<[str, str, str]>], the settings from the snapshot (or None if there isn't a readable
+      one) and each change since, as [EPC, status name, location], in the order they were made
+    """
+    settings = None
+    try:
+      with open(self.__settings_file, 'rb') as sf:
+        data = sf.read()
+      if data: settings = pickle.loads(data)
+    except (OSError, pickle.UnpicklingError, EOFError): pass
+
+    changes = []
+    try:
+      with open(self.__journal_file, 'r', encoding='utf-8') as jf:
+        for line in jf:
+          try: change = json.loads(line)
+          except ValueError: break # Cut off by a crash, so nothing comes after it
+
+          if isinstance(change, list) and len(change) == 3: changes.append(change)
+    except OSError: pass
+
+    with self.__lock: self.__changes = len(changes)
+    return [settings, changes]
+
+  def Append(self, epc, status, location):
+    """
+    Queues a change to a tag to be recorded. Never blocks.
+
+    Args:
+      epc: str, EPC of the tag
+      status: str, name of its new status
+      location: str, its new last location
+
+    Returns: bool, whether the journal has grown long enough that a new snapshot should be saved
+    """
+    line = json.dumps([epc, status, location]) + '\n'
+
+    with self.__lock:
+      self.__queue.put_nowait(['a', line])
+      self.__changes += 1
+      return self.__changes >= self.__compact_after
+
+  def Snapshot(self, settings):
+    """
+    Queues saving the settings, replacing the old snapshot, and emptying the journal. Never blocks.
+
+    Args:
+      settings: object, the settings, which must include every change appended so far. Changes made to them
+        before the snapshot is written are also appended after it, so replaying those is harmless.
+    """
+    with self.__lock:
+      self.__queue.put_nowait(['s', settings])
+      self.__changes = 0
+
+  def Flush(self, timeout = 5):
+    """
+    Waits until every change and snapshot queued so far has been written and synced.
+
+    Returns: bool, whether or not they were written before the timeout
+    """
+    done = threading.Event()
+    self.__queue.put_nowait(done)
+    return done.wait(timeout)
+
+  def Close(self, timeout = 5):
+    """
+    Stops the thread once everything already queued has been written and synced.
+
+    Returns: bool, whether or not it was written before the timeout
+    """
+    self.__queue.put_nowait(None)
+    self.__thread.join(timeout)
+    return not self.__thread.is_alive()
+
+  def __run(self):
+    running = True
+
+    while running:
+      # Everything that piled up during the last write is written, and synced, together
+      batch = [self.__queue.get()]
+      try:
+        while len(batch) < SettingsJournal.__MAX_BATCH and isinstance(batch[-1], list):
+          batch.append(self.__queue.get_nowait())
+      except queue.Empty: pass
+
+      lines = []
+      flushes = []
+
+      for item in batch:
+        if item is None:
+          running = False
+        elif isinstance(item, threading.Event):
+          flushes.append(item)
+        elif item[0] == 's':
+          # The changes before the snapshot are in it, so they only have to be written if it couldn't be saved
+          if self.__try(self.__snapshot, item[1]): lines = []
+        else:
+          lines.append(item[1])
+
+      if lines: self.__try(self.__write, lines)
+
+      if flushes or not running or (self.__fsync_interval is not None and time.monotonic() - self.__last_fsync >= self.__fsync_interval):
+        self.__try(self.__fsync)
+      for done in flushes: done.set()
+
+    if self.__journal is not None: self.__journal.close()
+
+  def __try(self, function, *args):
+    """
+    Runs a step of writing. The thread has to keep going, so a failure is only reported, and whatever is still in
+    the handler's memory is saved by the next snapshot.
+
+    Returns: bool, whether the step succeeded
+    """
+    try:
+      function(*args)
+      return True
+    except Exception as error:
+      if self.__on_error is not None: self.__on_error(error)
+      return False
+
+  def __write(self, lines):
+    if self.__journal is None:
+      self.__journal = open(self.__journal_file, 'a', encoding='utf-8')
+
+    self.__journal.write(''.join(lines))
+    self.__journal.flush()
+
+  def __fsync(self):
+    if self.__journal is not None: os.fsync(self.__journal.fileno())
+    self.__last_fsync = time.monotonic()
+
+  def __snapshot(self, settings):
+    temp_file = self.__settings_file + '.tmp'
+
+    with open(temp_file, 'wb') as sf:
+      pickle.dump(settings, sf)
+      sf.flush()
+      os.fsync(sf.fileno())
+    os.replace(temp_file, self.__settings_file)
+    self.__sync_folder()
+
+    # Changes left in the journal by a crash right here are already in the snapshot, so replaying them is harmless
+    if self.__journal is not None: self.__journal.close()
+    self.__journal = open(self.__journal_file, 'w', encoding='utf-8')
+
+  def __sync_folder(self):
+    # Makes the rename itself survive a power loss. Not every platform allows opening a folder.
+    try:
+      fd = os.open(os.path.dirname(os.path.abspath(self.__settings_file)), os.O_RDONLY)
+      try: os.fsync(fd)
+      finally: os.close(fd)
+    except OSError: pass
@@ -0,0 +1,463 @@
+'''
+RFID Logging Software
+
+Description (simulation.py):
+Stand-ins for the Mercury API reader and RPi.GPIO so the node can run without the physical hardware. The simulated
+reader emits synthetic or recorded tag reads and the simulated GPIO plays back beam-break timelines. The local
+broker lets the node and the handler talk to each other within a single process, without a network.
+
+Use sensors.SetGPIOBackend(SimulatedGPIO(...)) and pass a SimulatedReader wherever a mercury.Reader is expected,
+or run read.py with --simulate. Pass LocalBroker().Client() wherever a paho.mqtt.client.Client is expected.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import threading, random, time, os, csv, bisect, queue
+
+class SimulatedTagReadData:
+  """
+  Mirrors the fields of mercury.TagReadData that the node uses.
+  """
+  def __init__(self, epc, rssi, antenna = 1, timestamp = None, read_count = 1):
+    self.epc = epc
+    self.rssi = rssi
+    self.antenna = antenna
+    self.read_count = read_count
+    self.timestamp = timestamp if timestamp is not None else time.time()
+
+class SimulatedReader:
+  def __init__(self, rate = 100, epcs = 100, rssi_profile = (-60, 8), antennas = (1,), recording = None, seed = None, loop = True):
+    """
+    Args:
+      rate: float, average tag reads per second
+      epcs: int or list<str>, amount of random EPCs to read, or the hex EPCs themselves
+      rssi_profile: (float, float) or function, mean and standard deviation of the RSSI, or a function called
+        with the EPC that returns the RSSI of a read
+      antennas: list<int>, antennas reads are spread across
+      recording: list<[float, str, int, int]>, optional reads played back instead of random ones, formatted as
+        seconds since the start of reading, EPC, RSSI, and antenna. See LoadRecording()
+      seed: int, optional seed for repeatable reads
+      loop: bool, whether the recording repeats once it has been played through. Otherwise the reader goes quiet.
+    """
+    self.__rate = rate
+    self.__random = random.Random(seed)
+    self.__epcs = epcs if isinstance(epcs, list) else ['E2{:022X}'.format(self.__random.getrandbits(88)) for _ in range(epcs)]
+    self.__rssi_profile = rssi_profile
+    self.__antennas = list(antennas)
+    self.__recording = sorted(recording, key=lambda x: x[0]) if recording else None
+    self.__recording_start = None # Monotonic time the current pass through the recording started
+    self.__recording_index = 0
+    self.__loop = loop
+
+    self.__reading = False
+    self.__thread = None
+    self.__reads = 0
+
+  @property
+  def EPCs(self):
+    return self.__epcs
+
+  @property
+  def Reads(self):
+    """
+    Amount of reads emitted by this process.
+    """
+    return self.__reads
+
+  @staticmethod
+  def LoadRecording(path):
+    """
+    Loads reads from a CSV file with rows formatted as offset,epc,rssi,antenna where offset is the seconds
+    since the start of the recording.
+    """
+    with open(path, newline='') as rf:
+      return [[float(row[0]), row[1], int(row[2]), int(row[3])] for row in csv.reader(rf) if row and not row[0].startswith('#')]
+
+  def set_region(self, region): pass
+
+  def set_read_plan(self, antennas, protocol, read_power = None): self.__antennas = list(antennas)
+
+  def get_model(self): return 'Simulated'
+
+  def read(self, timeout = 500):
+    """
+    Blocks for the timeout (in milliseconds) and returns every tag read during it.
+    """
+    reads = []
+    self.__generate(timeout / 1000, reads.append)
+    return reads
+
+  def start_reading(self, callback, on_time = 250, off_time = 0):
+    if self.__reading: raise RuntimeError('Reader is already reading')
+
+    def run():
+      while self.__reading:
+        self.__generate(on_time / 1000, callback)
+        if off_time:
+          time.sleep(off_time / 1000)
+          self.__skip_missed()
+
+    self.__reading = True
+    self.__thread = threading.Thread(target=run, daemon=True)
+    self.__thread.start()
+
+  def stop_reading(self):
+    self.__reading = False
+    if self.__thread is not None and self.__thread is not threading.current_thread(): self.__thread.join()
+    self.__thread = None
+
+  def __generate(self, duration, callback):
+    """
+    Emits reads for duration seconds, sleeping between them to keep to the rate or recording.
+    """
+    end_time = time.monotonic() + duration
+
+    if self.__recording is not None:
+      # Recordings loop one second after their last read (unless loop is off), with the position kept between calls
+      if self.__recording_start is None: self.__recording_start = time.monotonic()
+
+      while self.__recording_index < len(self.__recording):
+        offset, epc, rssi, antenna = self.__recording[self.__recording_index]
+        read_time = self.__recording_start + offset
+        if read_time > end_time: break
+
+        time.sleep(max(0, read_time - time.monotonic()))
+        self.__emit(callback, epc, rssi, antenna)
+
+        self.__recording_index += 1
+        if self.__recording_index == len(self.__recording) and self.__loop:
+          self.__recording_index = 0
+          self.__recording_start += self.__recording[-1][0] + 1
+
+      time.sleep(max(0, end_time - time.monotonic()))
+      return
+
+    next_read = time.monotonic() + self.__random.expovariate(self.__rate)
+    while next_read < end_time:
+      time.sleep(max(0, next_read - time.monotonic()))
+      epc = self.__random.choice(self.__epcs)
+      self.__emit(callback, epc, self.__rssi(epc), self.__random.choice(self.__antennas))
+      next_read += self.__random.expovariate(self.__rate)
+
+    time.sleep(max(0, end_time - time.monotonic()))
+
+  def __skip_missed(self):
+    """
+    Drops the recorded reads that happened while the antenna was off.
+    """
+    if self.__recording is None or self.__recording_start is None: return
+    now = time.monotonic()
+
+    while self.__recording_index < len(self.__recording) and self.__recording_start + self.__recording[self.__recording_index][0] < now:
+      self.__recording_index += 1
+      if self.__recording_index == len(self.__recording) and self.__loop:
+        self.__recording_index = 0
+        self.__recording_start += self.__recording[-1][0] + 1
+
+  def __rssi(self, epc):
+    if callable(self.__rssi_profile): return int(self.__rssi_profile(epc))
+    mean, deviation = self.__rssi_profile
+    return int(max(-127, min(0, self.__random.gauss(mean, deviation))))
+
+  def __emit(self, callback, epc, rssi, antenna):
+    self.__reads += 1
+    callback(SimulatedTagReadData(bytes(epc, 'utf-8'), rssi, antenna))
+
+class SimulatedGPIO:
+  """
+  Mirrors the parts of RPi.GPIO used by sensors.py. Pins read high (beam unbroken) until a timeline changes them.
+  """
+  BOARD = 10
+  BCM = 11
+  IN = 1
+  OUT = 0
+  FALLING = 32
+  RISING = 31
+  BOTH = 33
+
+  def __init__(self, timeline = None):
+    """
+    Args:
+      timeline: list<[float, int, int]>, optional pin changes formatted as seconds after now, pin, and value.
+        See Play() and PassTimeline()
+    """
+    self.__values = {}
+    self.__events = {}
+    self.__lock = threading.Lock()
+
+    self.__timeline = []
+    self.__player_pid = None
+    self.__loop = None
+    if timeline: self.Play(timeline)
+
+  @staticmethod
+  def PassTimeline(first_pin, second_pin, passes, interval = 5, gap = 0.3, break_time = 0.2, start = 1):
+    """
+    Builds a timeline of objects passing the first pin's laser and then the second's.
+
+    Args:
+      first_pin: int, pin of the laser broken first
+      second_pin: int, pin of the laser broken second
+      passes: int, amount of objects
+      interval: float, seconds between objects
+      gap: float, seconds between breaking the first and second laser
+      break_time: float, seconds each beam stays broken
+      start: float, seconds until the first object
+
+    Returns: list<[float, int, int]>
+    """
+    timeline = []
+    for x in range(passes):
+      t = start + x * interval
+      timeline += [[t, first_pin, 0], [t + break_time, first_pin, 1], [t + gap, second_pin, 0], [t + gap + break_time, second_pin, 1]]
+    return sorted(timeline)
+
+  def Play(self, timeline, loop = None):
+    """
+    Schedules pin changes. The times are relative to this call and use time.monotonic(), so a timeline scheduled
+    before a process is forked plays at the same moments in the child.
+
+    Args:
+      timeline: list<[float, int, int]>, seconds after now, pin, and value
+      loop: float, optional seconds after which the timeline repeats
+    """
+    now = time.monotonic()
+    with self.__lock:
+      self.__timeline = sorted(self.__timeline + [[now + t, pin, value] for t, pin, value in timeline])
+      self.__loop = loop
+
+  def setmode(self, mode): pass
+
+  def setwarnings(self, flag): pass
+
+  def setup(self, pin, direction, **kwargs):
+    self.__values.setdefault(pin, 1)
+
+  def input(self, pin):
+    self.__advance(time.monotonic())
+    return self.__values.get(pin, 1)
+
+  def output(self, pin, value):
+    self.__set(pin, value)
+
+  def add_event_detect(self, pin, edge, callback = None, bouncetime = None):
+    with self.__lock:
+      self.__events[pin] = [edge, callback]
+
+      # Threads don't survive a fork, so each process that watches pins plays the timeline itself
+      if self.__player_pid != os.getpid():
+        self.__player_pid = os.getpid()
+        threading.Thread(target=self.__play, daemon=True).start()
+
+  def remove_event_detect(self, pin):
+    with self.__lock: self.__events.pop(pin, None)
+
+  def cleanup(self):
+    with self.__lock: self.__events.clear()
+
+  def __play(self):
+    while True:
+      with self.__lock:
+        if not self.__events: break
+        upcoming = self.__timeline[0][0] if self.__timeline else None
+
+      if upcoming is None: break
+      time.sleep(max(0, upcoming - time.monotonic()))
+      self.__advance(time.monotonic())
+
+    with self.__lock: self.__player_pid = None
+
+  def __advance(self, now):
+    """
+    Applies every pin change scheduled up until now.
+    """
+    while True:
+      with self.__lock:
+        if not self.__timeline or self.__timeline[0][0] > now: return
+        t, pin, value = self.__timeline.pop(0)
+        if self.__loop: bisect.insort(self.__timeline, [t + self.__loop, pin, value])
+
+      self.__set(pin, value)
+
+  def __set(self, pin, value):
+    with self.__lock:
+      previous = self.__values.get(pin, 1)
+      self.__values[pin] = value
+      edge, callback = self.__events.get(pin, [None, None])
+
+    if callback is None or previous == value: return
+    if edge == SimulatedGPIO.BOTH or edge == (SimulatedGPIO.FALLING if value == 0 else SimulatedGPIO.RISING):
+      callback(pin)
+
+class LocalMessage:
+  """
+  Mirrors the fields of paho.mqtt.client.MQTTMessage and MQTTMessageInfo that the node and handler use.
+  """
+  def __init__(self, topic, payload, qos = 0, mid = 0):
+    self.topic = topic
+    self.payload = payload
+    self.qos = qos
+    self.mid = mid
+    self.rc = 0
+
+class LocalBroker:
+  """
+  In-process stand-in for the MQTT broker. Messages are delivered to every subscribed client in the order they
+  were published, and are never lost.
+  """
+  def __init__(self):
+    self.__clients = []
+    self.__lock = threading.Lock()
+
+  def Client(self, name = ''):
+    """
+    Returns: LocalClient, a new unconnected client of this broker
+    """
+    return LocalClient(self, name)
+
+  @property
+  def Clients(self):
+    with self.__lock: return list(self.__clients)
+
+  def Connect(self, client):
+    with self.__lock:
+      if client not in self.__clients: self.__clients.append(client)
+
+  def Disconnect(self, client):
+    with self.__lock:
+      if client in self.__clients: self.__clients.remove(client)
+
+  def Publish(self, topic, payload, qos = 0):
+    # Delivers from a copy of the client list so that clients may connect or disconnect from within a callback
+    for client in self.Clients:
+      if client.Subscribed(topic): client.Deliver(LocalMessage(topic, payload, qos))
+
+class LocalClient:
+  """
+  Mirrors the parts of paho.mqtt.client.Client used by the node and handler. Like paho, callbacks run on the
+  client's network loop, started by loop_start() or loop_forever().
+  """
+  def __init__(self, broker, name = ''):
+    """
+    Args:
+      broker: LocalBroker, broker the client connects to
+      name: str, optional name used to tell clients apart in reports
+    """
+    self.on_connect = None
+    self.on_message = None
+    self.on_publish = None
+
+    self.__broker = broker
+    self.__name = name
+    self.__subscriptions = set()
+    self.__events = queue.Queue()
+    self.__connected = False
+    self.__loop_thread = None
+
+    self.__mid = 0
+    self.__mid_lock = threading.Lock()
+
+    self.__callback_time = 0
+    self.__messages = 0
+
+  @property
+  def Name(self):
+    return self.__name
+
+  @property
+  def CallbackTime(self):
+    """
+    Thread CPU seconds spent inside the client's callbacks.
+    """
+    return self.__callback_time
+
+  @property
+  def Messages(self):
+    """
+    Amount of messages passed to on_message.
+    """
+    return self.__messages
+
+  @property
+  def Pending(self):
+    """
+    Amount of events waiting for the network loop.
+    """
+    return self.__events.qsize()
+
+  def Subscribed(self, topic):
+    levels = topic.split('/')
+
+    for subscription in list(self.__subscriptions):
+      filters = subscription.split('/')
+      if filters[-1] == '#':
+        filters = filters[:-1]
+        if len(levels) < len(filters): continue
+      elif len(levels) != len(filters): continue
+
+      if all(f == '+' or f == level for f, level in zip(filters, levels)): return True
+
+    return False
+
+  def Deliver(self, message):
+    self.__events.put(['message', message])
+
+  def will_set(self, topic, payload = None, qos = 0, retain = False): pass
+
+  def connect(self, host = 'localhost', port = 1883, keepalive = 60):
+    self.__broker.Connect(self)
+    self.__connected = True
+    self.__events.put(['connect', None])
+    return 0
+
+  def disconnect(self):
+    self.__broker.Disconnect(self)
+    self.__connected = False
+    self.__events.put(None)
+    return 0
+
+  def is_connected(self):
+    return self.__connected
+
+  def subscribe(self, topic, qos = 0):
+    self.__subscriptions.add(topic)
+    return [0, 0]
+
+  def publish(self, topic, payload = None, qos = 0, retain = False):
+    with self.__mid_lock:
+      self.__mid += 1
+      mid = self.__mid
+
+    self.__broker.Publish(topic, payload, qos)
+    self.__events.put(['published', mid])
+    return LocalMessage(topic, payload, qos, mid)
+
+  def loop_start(self):
+    if self.__loop_thread is None:
+      self.__loop_thread = threading.Thread(target=self.loop_forever, daemon=True)
+      self.__loop_thread.start()
+
+  def loop_stop(self):
+    if self.__loop_thread is not None:
+      self.__events.put(None)
+      if self.__loop_thread is not threading.current_thread(): self.__loop_thread.join()
+      self.__loop_thread = None
+
+  def loop_forever(self):
+    while True:
+      event = self.__events.get()
+      if event is None: break
+
+      kind, data = event
+      start = time.thread_time()
+
+      if kind == 'connect' and self.on_connect: self.on_connect(self, None, {}, 0)
+      elif kind == 'published' and self.on_publish: self.on_publish(self, None, data)
+      elif kind == 'message' and self.on_message:
+        self.__messages += 1
+        self.on_message(self, None, data)
+
+      self.__callback_time += time.thread_time() - start
@@ -0,0 +1,131 @@
+'''
+RFID Logging Software
+
+Description (system_logger.py):
+Writes the node's system logs from a background thread. Callers only queue a line, while the thread keeps the
+day's log file open, writes lines in batches, and occasionally syncs the file to the SD card.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import threading, queue, datetime, os, time
+
+class SystemLogger:
+  __MAX_BATCH = 500
+
+  def __init__(self, file_format, datetime_format = '%m/%d/%Y %H:%M:%S', fsync_interval = 5, echo = True):
+    """
+    Args:
+      file_format: str, path of the log files where {} is replaced by the day of the log
+      datetime_format: str, format of the timestamp at the start of each line
+      fsync_interval: float, max seconds between syncs of the log file to disk
+      echo: bool, whether to also print each line to the screen
+    """
+    self.__file_format = file_format
+    self.__datetime_format = datetime_format
+    self.__fsync_interval = fsync_interval
+    self.__echo = echo
+
+    self.__queue = queue.Queue()
+    self.__file = None
+    self.__file_name = None
+    self.__last_fsync = time.monotonic()
+
+    threading.Thread(target=self.__run, daemon=True).start()
+
+  def GetFileName(self, day = None):
+    """
+    Args:
+      day: datetime, day of the log file. Defaults to today.
+
+    Returns: str, path of the log file for the day
+    """
+    return self.__file_format.format((day or datetime.datetime.now()).strftime('%m-%d-%Y'))
+
+  def Log(self, msg, *args):
+    """
+    Queues a line to be written. Never blocks.
+
+    Args:
+      msg: str, line to write. If args are given, it is formatted with them on the logging thread.
+      *args: objects, optional values for msg.format()
+    """
+    self.__queue.put_nowait([datetime.datetime.now(), msg, args])
+
+  def Flush(self, timeout = 5):
+    """
+    Waits until every line queued so far has been written and synced.
+
+    Returns: bool, whether or not the lines were written before the timeout
+    """
+    done = threading.Event()
+    self.__queue.put_nowait(done)
+    return done.wait(timeout)
+
+  def Stop(self):
+    self.Flush()
+    self.__queue.put_nowait(None)
+
+  def __run(self):
+    running = True
+
+    while running:
+      # Waits for the next line, then takes whatever else has been queued behind it
+      try: batch = [self.__queue.get(timeout=self.__fsync_interval)]
+      except queue.Empty: batch = []
+
+      try:
+        while len(batch) < SystemLogger.__MAX_BATCH: batch.append(self.__queue.get_nowait())
+      except queue.Empty: pass
+
+      lines = []
+      flushes = []
+
+      for item in batch:
+        if item is None:
+          running = False
+        elif isinstance(item, threading.Event):
+          flushes.append(item)
+        else:
+          curr_time, msg, args = item
+          file_name = self.GetFileName(curr_time)
+
+          # Writes what has been collected for the previous day before moving on to the new day's file
+          if file_name != self.__file_name:
+            self.__write(lines)
+            lines = []
+            self.__open(file_name)
+
+          lines.append("{}\t{}".format(curr_time.strftime(self.__datetime_format), msg.format(*args) if args else msg))
+
+      self.__write(lines)
+
+      if flushes or not running or time.monotonic() - self.__last_fsync >= self.__fsync_interval:
+        self.__fsync()
+      for done in flushes: done.set()
+
+    if self.__file is not None: self.__file.close()
+
+  def __open(self, file_name):
+    if self.__file is not None:
+      self.__fsync()
+      self.__file.close()
+
+    os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+    self.__file = open(file_name, 'a')
+    self.__file_name = file_name
+
+  def __write(self, lines):
+    if not lines: return
+
+    text = '\n'.join(lines)
+    if self.__echo: print(text)
+    self.__file.write(text + '\n')
+    self.__file.flush()
+
+  def __fsync(self):
+    self.__last_fsync = time.monotonic()
+    if self.__file is not None: os.fsync(self.__file.fileno())
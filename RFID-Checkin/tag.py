@@ -10,7 +10,7 @@ Dom Stepek, Gavin Furlong
 Edited on: March 21, 2019
 '''
 
-import datetime, enum
+import datetime, enum, time
 
 DATETIME_FORMAT = '%m/%d/%Y %H:%M:%S'
 
@@ -20,8 +20,18 @@ class TagStatus(enum.Enum):
   Unknown = 2
 
 class Tag:
-  def __init__(self, epc, status, rssi):
+  def __init__(self, epc, status, rssi, timestamp = None, antenna = 0, read_time = None):
+    """
+    Args:
+      epc: bytes or str, EPC of the tag
+      status: TagStatus, int, or str, direction the tag was moving
+      rssi: int, signal strength of the read
+      timestamp: float, optional time (in seconds since the epoch) the reader saw the tag. Defaults to now.
+      antenna: int, antenna that read the tag
+      read_time: float, optional time.monotonic() the reader saw the tag. Used instead of timestamp if given.
+    """
     self.RSSI = rssi
+    self.Antenna = antenna
     if isinstance(epc, bytes):
       self.EPC = str(epc, 'utf-8')
     elif isinstance(epc, str):
@@ -32,14 +42,46 @@ class Tag:
     elif isinstance(status, int):
       self.Status = TagStatus(status)
     elif isinstance(status, str):
-      self.Status  = TagStaus[status.title()]
+      self.Status  = TagStatus[status.title()]
     
     self.Timestamp = datetime.datetime.now()
+    self.ReadTime = time.monotonic() # Used to sync with laser directions, which are timestamped with the same clock
+
+    if read_time is not None:
+      self.Timestamp -= datetime.timedelta(seconds=self.ReadTime - read_time)
+      self.ReadTime = read_time
+    elif timestamp is not None:
+      self.Timestamp = datetime.datetime.fromtimestamp(timestamp)
+      self.ReadTime -= time.time() - timestamp
+
+    # Summary of every read of this tag when reads are aggregated. See Merge()
+    self.FirstSeen = self.Timestamp
+    self.LastSeen = self.Timestamp
+    self.ReadCount = 1
+    self.Antennas = [antenna]
+
+  def Merge(self, other):
+    """
+    Folds another read of the same tag into this one. The strongest read decides the RSSI, antenna, and read time.
+
+    Args:
+      other: Tag, read of the same EPC
+    """
+    self.FirstSeen = min(self.FirstSeen, other.FirstSeen)
+    self.LastSeen = max(self.LastSeen, other.LastSeen)
+    self.ReadCount += other.ReadCount
+    self.Antennas = sorted(set(self.Antennas + other.Antennas))
+
+    if other.RSSI > self.RSSI:
+      self.RSSI = other.RSSI
+      self.Antenna = other.Antenna
+      self.Timestamp = other.Timestamp
+      self.ReadTime = other.ReadTime
       
   def to_object(self):
-  """
-  Deprecated. Use Tag.__dict__ instead
-  """
+    """
+    Deprecated. Use Tag.__dict__ instead
+    """
     return {
         "EPC" : self.EPC,
         "Status" : self.Status.name,
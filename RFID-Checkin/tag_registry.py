@@ -0,0 +1,143 @@
+'''
+RFID Logging Software
+
+Description (tag_registry.py):
+The handler's RFID tags, keyed by EPC so a read is matched to its tag without searching the whole inventory.
+Tags are also indexed by owner and by last location for the CLI. Status and location changes must go through
+Update() to keep the indexes in step. Safe to use from the network threads of several nodes at once.
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import threading
+
+def _key(epc):
+  # EPCs are sent by the nodes in upper case, but may be typed into the spreadsheet in any case
+  return epc.strip().upper()
+
+class TagRegistry:
+  def __init__(self, tags = ()):
+    """
+    Args:
+      tags: list<RFIDTag>, tags to start with. A later tag replaces an earlier one with the same EPC
+    """
+    self.__tags = {} # EPC : RFIDTag, in the order the tags were added
+    self.__by_owner = {} # Owner : {EPC : RFIDTag}
+    self.__by_location = {} # Last location : {EPC : RFIDTag}
+    self.__lock = threading.RLock()
+
+    for tag in tags: self.Add(tag)
+
+  def __len__(self):
+    return len(self.__tags)
+
+  def __iter__(self):
+    with self.__lock: return iter(list(self.__tags.values()))
+
+  def __contains__(self, epc):
+    return _key(epc) in self.__tags
+
+  @property
+  def EPCs(self):
+    with self.__lock: return [tag.EPC for tag in self.__tags.values()]
+
+  @property
+  def Owners(self):
+    with self.__lock: return sorted(self.__by_owner)
+
+  @property
+  def Locations(self):
+    with self.__lock: return sorted(self.__by_location)
+
+  def Get(self, epc):
+    """
+    Returns: RFIDTag, the tag with the EPC, or None if it isn't registered
+    """
+    return self.__tags.get(_key(epc))
+
+  def ByOwner(self, owner):
+    """
+    Returns: list<RFIDTag>, tags of the owner
+    """
+    with self.__lock: return list(self.__by_owner.get(owner, {}).values())
+
+  def ByLocation(self, location):
+    """
+    Returns: list<RFIDTag>, tags last seen at the location
+    """
+    with self.__lock: return list(self.__by_location.get(location, {}).values())
+
+  def Add(self, tag):
+    """
+    Registers a tag, replacing any tag with the same EPC.
+
+    Args:
+      tag: RFIDTag, tag to add
+    """
+    key = _key(tag.EPC)
+
+    with self.__lock:
+      self.Remove(key)
+      self.__tags[key] = tag
+      self.__index(self.__by_owner, tag.Owner, key, tag)
+      self.__index(self.__by_location, tag.LastLocation, key, tag)
+
+  def Remove(self, epc):
+    """
+    Returns: RFIDTag, the tag removed, or None if it wasn't registered
+    """
+    key = _key(epc)
+
+    with self.__lock:
+      tag = self.__tags.pop(key, None)
+      if tag is not None:
+        self.__unindex(self.__by_owner, tag.Owner, key)
+        self.__unindex(self.__by_location, tag.LastLocation, key)
+      return tag
+
+  def Update(self, epc, status = None, location = None):
+    """
+    Args:
+      epc: str, EPC of the tag
+      status: RFIDTag.Status, optional new status
+      location: str, optional new last location
+
+    Returns: RFIDTag, the updated tag, or None if it isn't registered
+    """
+    key = _key(epc)
+
+    with self.__lock:
+      tag = self.__tags.get(key)
+      if tag is None: return None
+
+      if status is not None: tag.Status = status
+      if location is not None and location != tag.LastLocation:
+        self.__unindex(self.__by_location, tag.LastLocation, key)
+        tag.LastLocation = location
+        self.__index(self.__by_location, location, key, tag)
+
+      return tag
+
+  def Replace(self, tags):
+    """
+    Replaces every tag, such as after loading the settings file or the spreadsheet.
+
+    Args:
+      tags: list<RFIDTag>, the new tags
+    """
+    with self.__lock:
+      self.__tags, self.__by_owner, self.__by_location = {}, {}, {}
+      for tag in tags: self.Add(tag)
+
+  def __index(self, index, value, key, tag):
+    index.setdefault(value, {})[key] = tag
+
+  def __unindex(self, index, value, key):
+    tags = index.get(value)
+    if tags is None: return
+
+    tags.pop(key, None)
+    if not tags: del index[value]
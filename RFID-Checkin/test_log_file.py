@@ -0,0 +1,55 @@
+'''
+RFID Logging Software
+
+Description (test_log_file.py):
+Tests for log_file.py. Run with: python3 -m unittest test_log_file
+
+Contributors:
+Dom Stepek
+
+Edited on: October 17, 2026
+'''
+
+import unittest, tempfile, os, datetime
+from log_file import LogFile
+from log import Log
+
+class TestTail(unittest.TestCase):
+  def setUp(self):
+    self.__folder = tempfile.TemporaryDirectory()
+    self.__path = os.path.join(self.__folder.name, 'logs.csv')
+
+  def tearDown(self):
+    self.__folder.cleanup()
+
+  def __log(self, x, owner):
+    return Log(datetime.datetime(2026, 10, 17) + datetime.timedelta(seconds=x), f'E2B0{x:08X}', x % 2, owner, 'Laptop', 'Room 112', '')
+
+  def __write_logs(self, owners, count):
+    log_file = LogFile(self.__path, linger=0)
+    logs = [self.__log(x, owners[x % len(owners)]) for x in range(count)]
+
+    log_file.Rewrite(logs)
+    self.assertTrue(log_file.Flush())
+    return [log_file, logs]
+
+  def test_non_ascii_across_block_boundaries(self):
+    # Most bytes are part of a multi-byte character. Adding logs with owners of 1 to 3 bytes moves the end of
+    # the file, and so every block boundary, by a byte at a time until some land inside a character.
+    owners = ['José', 'Zoë Ångström', '田中太郎', '漢字漢字漢字漢字', 'Ñúñez']
+    log_file, logs = self.__write_logs(owners, 3000)
+    self.assertGreater(os.path.getsize(self.__path), 2 * (1 << 16))
+
+    for x, owner in enumerate(['a', 'é', '漢', 'b', 'ü', '字'] * 2):
+      logs.append(self.__log(3000 + x, owner))
+      log_file.Append(logs[-1:])
+
+      for count in [1, 1200, 2500, 4000]:
+        self.assertEqual([str(y) for y in log_file.Tail(count)], [str(y) for y in logs[-count:]])
+
+  def test_empty_file(self):
+    log_file, _ = self.__write_logs(['Dom'], 0)
+    self.assertEqual(log_file.Tail(5), [])
+
+if __name__ == '__main__':
+  unittest.main()